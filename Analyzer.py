@@ -1,22 +1,86 @@
+import os
 import ROOT
+import json
+import multiprocessing
 from EventBuilder import EventBuilder
 from Event import Event
+from EventBatch import EventBatch
+from ColumnChunk import prune_branches
+from Skim import Skim
+from EventStore import EventStore
+from Prefetcher import Prefetcher, read_file_chunks
+from Pipeline import Pipeline, Source, ChunkSource, ColumnSource, Progress
+from CutFlow import CutFlow
+from Profiler import Profiler
+from Fingerprint import input_fingerprint
+from ResultsStore import config_hash, METADATA_NAME
 from collections import OrderedDict
 
 class Analyzer(object):
     """
     Base class for analyzing datasets using the FPraktikum framework.
     """
+    # names of the numerical attributes counting events, e.g. ('n_selected',),
+    # summed when the results of several runs of a dataset are merged
+    counter_names = ()
 
     def __init__(self, dataset_name, file_name, event_options = {}):
         self.dataset_name = dataset_name
         self.file_name = file_name
+        # options as given, the hash of the configuration is stored in the output file
+        self.event_options = event_options
+        # systematic variations, e.g. OrderedDict([('nominal', {}), ('jec_up', {'JEC': 'up'})]).
+        # The analyzer itself processes the first variation, an analyzer of the same
+        # class is created for each further one.
+        self.variation = None
+        self._variation_options = OrderedDict()
+        self._variation_analyzers = None
+        if event_options.get("variations"):
+            for name, options in event_options["variations"].items():
+                variation_options = dict(event_options)
+                del variation_options["variations"]
+                variation_options.update(options)
+                self._variation_options[name] = variation_options
+            self.variation = list(self._variation_options.keys())[0]
+            event_options = self._variation_options.pop(self.variation)
         self.event_builder = EventBuilder(event_options)
         self.histograms = OrderedDict()
+        # event selection, cuts are added by derived classes
+        self.cutflow = CutFlow()
         self.working_dataset = None
         self.max_events = -1
         if "max_events" in event_options:
             self.max_events = event_options["max_events"]
+        # "event": build one Event per entry, "batch": build EventBatches from chunks of entries
+        self.mode = "event"
+        if "mode" in event_options:
+            self.mode = event_options["mode"]
+        self.chunk_size = 100000
+        if "chunk_size" in event_options:
+            self.chunk_size = event_options["chunk_size"]
+        # size of the TTree read cache in bytes
+        self.cache_size = 30*1024*1024
+        if "cache_size" in event_options:
+            self.cache_size = event_options["cache_size"]
+        # branches read in addition to the ones used by the EventBuilder
+        self.extra_branches = []
+        # preselection of the skim, e.g. [('triggerIsoMu24', '==', True)], None reads the full file
+        self.preselection = None
+        if "skim" in event_options:
+            self.preselection = event_options["skim"]
+        self.skim = None
+        # read the events from an uncompressed memory-mapped copy of the file
+        self.event_store = False
+        if "event_store" in event_options:
+            self.event_store = event_options["event_store"]
+        # number of chunks read ahead in a background process while processing, 0 reads in the event loop
+        self.prefetch = 0
+        if "prefetch" in event_options:
+            self.prefetch = event_options["prefetch"]
+        # Profiler measuring the time spent in each stage of the event loop, None if disabled
+        self.profiler = None
+        if event_options.get("profile"):
+            self.profiler = Profiler()
 
 
     def attach_histogram(self, histogram, name):
@@ -37,41 +101,316 @@ class Analyzer(object):
     def fill_histograms(self, event, name):
         """
         Fill all attatched histograms.
+
+        Accepts a single Event or an EventBatch.
         """
-        self.histograms[name].fill(event)
+        if isinstance(event, EventBatch):
+            self.histograms[name].fill_batch(event)
+        else:
+            self.histograms[name].fill(event)
 
-    def run(self):
+    def variation_analyzers(self):
+        """
+        return an OrderedDict with the analyzers of all variations, including this one.
+        """
+        if self._variation_analyzers is None:
+            self._variation_analyzers = OrderedDict([(self.variation, self)])
+            for name, options in self._variation_options.items():
+                analyzer = self.__class__(self.dataset_name, self.file_name, options)
+                analyzer.variation = name
+                # avoid name clashes with the histograms of the other variations
+                for histograms in analyzer.histograms.values():
+                    for hist in histograms.hists.values():
+                        hist.SetName(hist.GetName()+"_"+name)
+                self._variation_analyzers[name] = analyzer
+        return self._variation_analyzers
+
+    def run(self, first_entry=0, n_entries=-1, write=True, shard_index=0, shard_count=1):
         """
         Loop over all datasets and process each event.
+
+        Processes the entries [first_entry, first_entry+n_entries) of the events tree,
+        n_entries < 0 processes all entries from first_entry on.
+        Alternatively the tree can be split into shard_count shards of equal size,
+        of which only the shard shard_index is processed.
+        At most max_events entries are read.
+        If a preselection is given by the "skim" event option, the events are read
+        from the skim and the entries refer to the skimmed events. The yields of the
+        first cut are then those of all events of the file.
+        Otherwise with the "event_store" event option the events are read from the
+        memory-mapped EventStore of the file, which is converted on the first run.
+        With the "prefetch" event option the chunks of the tree are read in a background
+        process, at most prefetch chunks ahead of the event loop, except in worker processes
+        of a ParallelRunner, which read in the event loop.
+        If variations are given by the "variations" event option, each event is read
+        once and processed by the analyzers of all variations.
+        If write is False the output file is not written, e.g. when the results
+        of several runs are merged first.
+        With the "profile" event option, the time spent in each stage is measured.
         """
         print("Start processing %s."% self.dataset_name)
-        f = ROOT.TFile.Open('files/'+self.file_name)
-        n_event = 0
-        for event_data in f.events:
-            if self.max_events > 0 and n_event >= self.max_events:
-                continue
-            n_event += 1
-            if n_event % 10000 == 0: print("%d events processed" % n_event)
-            # build event from TTree
-            event = self.event_builder.build_event(event_data)
-            # process event
-            self.process(event)
-        f.Close()
+        if self.profiler is not None:
+            for analyzer in self.variation_analyzers().values():
+                self.profiler.instrument(analyzer)
+            self.profiler.start()
+        source = self.event_source(first_entry, n_entries, shard_index, shard_count)
+        n_event = self.pipeline(source).run()
+        if self.skim is not None:
+            self.set_source_yields((source.first_entry, source.last_entry), len(source.columns))
         print("Done. Processed %d events." % n_event)
-        self.write_output()
+        if self.profiler is not None:
+            print(self.profiler.progress(max(n_event, 1)))
+            self.profiler.stop(n_event)
+        if write:
+            self.write_output()
+        return n_event
+
+    def event_source(self, first_entry=0, n_entries=-1, shard_index=0, shard_count=1):
+        """
+        return the source of the events to process, see run.
+        """
+        if self.preselection is None and self.event_store:
+            store = EventStore(self.file_name, self.branches())
+            source = self.column_source(self.timed("io", store.load)(), first_entry, n_entries,
+                                        shard_index, shard_count)
+        else:
+            f = ROOT.TFile.Open('files/'+self.file_name)
+            tree = f.events
+            if self.preselection is not None:
+                self.prune_branches(tree)
+                self.skim = Skim(self.file_name, self.branches(), self.preselection)
+                skim = self.timed("io", self.skim.load)(tree)
+                source = self.column_source(skim, first_entry, n_entries, shard_index, shard_count)
+            else:
+                first_entry, last_entry = self.entry_range(tree.GetEntries(), first_entry, n_entries,
+                                                           shard_index, shard_count)
+                prefetch = self.prefetch
+                if prefetch > 0 and multiprocessing.current_process().daemon:
+                    # workers of a ParallelRunner cannot start the reader process, and a reader
+                    # thread gives little overlap since reading the chunks holds the GIL
+                    print("Prefetching is disabled in worker processes, %s is read in the event loop."
+                          % self.dataset_name)
+                    prefetch = 0
+                if prefetch > 0:
+                    # read and decompress the next chunks in a background process
+                    source = ChunkSource(Prefetcher(read_file_chunks,
+                                                    (self.file_name, self.branches(), first_entry,
+                                                     last_entry, self.chunk_size, self.cache_size),
+                                                    prefetch), self.mode)
+                else:
+                    source = Source(self.file_name, self.branches(), first_entry, last_entry - first_entry,
+                                    self.mode, self.chunk_size, self.cache_size)
+            f.Close()
+        source.timer = lambda items: self.timed_iter("io", items)
+        return source
+
+    def column_source(self, columns, first_entry, n_entries, shard_index, shard_count):
+        """
+        return the source of the events of a ColumnChunk holding all events, e.g. a skim or an event store.
+        """
+        first_entry, last_entry = self.entry_range(len(columns), first_entry, n_entries,
+                                                   shard_index, shard_count)
+        return ColumnSource(columns, first_entry, last_entry, self.mode, self.chunk_size)
+
+    def pipeline(self, source):
+        """
+        return the Pipeline processing the events of source: each variation builds the events
+        and passes them to process or process_batch, then the progress is printed.
+        """
+        return Pipeline(source).branch(self).branch(Progress(self.progress))
+
+    def entry_range(self, n_tree_entries, first_entry=0, n_entries=-1, shard_index=0, shard_count=1):
+        """
+        return the range [first_entry, last_entry) of tree entries to process.
+        """
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            raise ValueError("Analyzer.run(): invalid shard %d of %d" % (shard_index, shard_count))
+        last_entry = n_tree_entries
+        if n_entries >= 0:
+            last_entry = min(last_entry, first_entry + n_entries)
+        if shard_count > 1:
+            n_range = max(last_entry - first_entry, 0)
+            shard_first = first_entry + n_range * shard_index // shard_count
+            last_entry = first_entry + n_range * (shard_index + 1) // shard_count
+            first_entry = shard_first
+        if self.max_events > 0:
+            last_entry = min(last_entry, first_entry + self.max_events)
+        return first_entry, max(first_entry, last_entry)
+
+    def set_source_yields(self, entry_range, n_skimmed):
+        """
+        Replace the yields of the first cut, which only saw the preselected events of the skim,
+        by the yields of all events of the source file, so efficiencies refer to all events.
+
+        The source yields are counted by the run starting at the first skimmed event and the
+        other runs count none, so they are counted once when runs of several entry ranges
+        are merged. Runs stopped early by max_events keep the yields of the skimmed events.
+        """
+        first_entry, last_entry = entry_range
+        if self.max_events > 0 and last_entry < n_skimmed and last_entry - first_entry >= self.max_events:
+            print("Warning: %s stopped after max_events skimmed events, the yields of the first cut "
+                  "only count preselected events." % self.dataset_name)
+            return
+        if first_entry == 0:
+            yields = self.skim.source_yields()
+        else:
+            yields = {'counts': [0], 'sumw': [0.0], 'sumw2': [0.0]}
+        for analyzer in self.variation_analyzers().values():
+            analyzer.cutflow.set_first(yields)
+
+    def progress(self, n_event):
+        """
+        return the progress message, with throughput and time per stage when profiling.
+        """
+        if self.profiler is None:
+            return "%d events processed" % n_event
+        return "%d events processed (%s)" % (n_event, self.profiler.progress(n_event))
+
+    def timed(self, stage, function):
+        """
+        return function, wrapped with a timer for stage when profiling.
+        """
+        if self.profiler is None:
+            return function
+        return self.profiler.timed(stage, function)
+
+    def timed_iter(self, stage, iterable):
+        """
+        return iterable, timing each step for stage when profiling.
+        """
+        if self.profiler is None:
+            return iterable
+        return self.profiler.timed_iter(stage, iterable)
+
+    def add_branches(self, *branches):
+        """
+        Read additional branches of the events tree, e.g. to use them in process.
+
+        They can be accessed through event_builder.tree in event mode.
+        """
+        for branch in branches:
+            if branch not in self.extra_branches:
+                self.extra_branches.append(branch)
+
+    def branches(self):
+        """
+        return the branches read from the events tree.
+        """
+        branches = list(self.event_builder.branches)
+        branches += [b for b in self.extra_branches if b not in branches]
+        return branches
+
+    def prune_branches(self, tree):
+        """
+        Disable all branches of the tree which are not read by the analyzer
+        and enable the TTree read cache for the remaining ones.
+        """
+        prune_branches(tree, self.branches(), self.cache_size)
+
+    def counters(self):
+        """
+        return the counters of the analyzer, the attributes listed in counter_names.
+        """
+        return OrderedDict((name, getattr(self, name)) for name in self.counter_names)
+
+    def summary(self):
+        """
+        return the counters and cut flow yields of this analyzer and its variations.
+        """
+        summary = {'counters': self.counters(), 'cutflow': self.cutflow.yields()}
+        if self.variation is not None:
+            summary['variations'] = OrderedDict((name, analyzer.summary())
+                                                for name, analyzer in self.variation_analyzers().items()
+                                                if analyzer is not self)
+        return summary
+
+    def results(self):
+        """
+        return the filled histograms and counters, e.g. to send them from a worker process.
+        """
+        self.flush_histograms()
+        histograms = OrderedDict()
+        for name in self.histograms.keys():
+            histograms[name] = self.histograms[name].hists
+        results = {'histograms': histograms, 'counters': self.counters(), 'cutflow': self.cutflow.yields()}
+        if self.profiler is not None:
+            results['profile'] = self.profiler.results()
+        if self.variation is not None:
+            results['variations'] = OrderedDict((name, analyzer.results())
+                                                for name, analyzer in self.variation_analyzers().items()
+                                                if analyzer is not self)
+        return results
+
+    def merge(self, results, first=False):
+        """
+        Add the results of another run of this analyzer.
+
+        If first is True the histograms and counters are replaced instead.
+        Histograms are added bin by bin and counters are summed.
+        """
+        for name, hists in results['histograms'].items():
+            for key, hist in hists.items():
+                if first:
+                    self.histograms[name].hists[key].Reset()
+                self.histograms[name].hists[key].Add(hist)
+        for name in self.counter_names:
+            if name not in results['counters']:
+                continue
+            value = results['counters'][name]
+            if first:
+                setattr(self, name, value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
+        self.cutflow.merge(results['cutflow'], first)
+        if self.profiler is not None and 'profile' in results:
+            self.profiler.merge(results['profile'], first)
+        for name, variation_results in results.get('variations', {}).items():
+            self.variation_analyzers()[name].merge(variation_results, first)
 
     def write_output(self):
         """
         Create new root file containing the histograms filled by the analyzer.
+
+        With variations, the histograms of each variation are written to their own directory.
+        The configuration hash, the fingerprint of the input file, the counters and the
+        cut flow are stored as JSON, so the results can be read back by a ResultsStore.
         """
+        for analyzer in self.variation_analyzers().values():
+            analyzer.flush_histograms()
         f = ROOT.TFile.Open('output_'+self.file_name, 'RECREATE')
-        # write histograms
+        if self.variation is None:
+            self.write_histograms(f)
+        else:
+            for name, analyzer in self.variation_analyzers().items():
+                analyzer.write_histograms(f.mkdir(name))
+        metadata = OrderedDict([('config_hash', config_hash(self.__class__, self.event_options)),
+                                ('fingerprint', input_fingerprint(self.file_name)),
+                                ('results', self.summary())])
+        f.cd()
+        ROOT.TNamed(METADATA_NAME, json.dumps(metadata)).Write()
+        f.Close()
+        if self.profiler is not None:
+            self.profiler.write('profile_'+os.path.splitext(self.file_name)[0]+'.json', self.dataset_name)
+
+    def flush_histograms(self):
+        """
+        Add the values buffered by vectorized filling to the histograms.
+        """
+        for histograms in self.histograms.values():
+            histograms.flush()
+
+    def write_histograms(self, tdir):
+        """
+        Write the histograms to the given directory, with one subdirectory per histogram collection,
+        and the cut flow if cuts are defined.
+        """
+        if self.cutflow.cuts:
+            self.cutflow.write(tdir)
         for name in self.histograms.keys():
-            tdir = f.mkdir(name)
-            tdir.cd()
+            subdir = tdir.mkdir(name)
+            subdir.cd()
             for hist in self.histograms[name].hists.values():
                 hist.Write()
-        f.Close()
 
     def process(self, event):
         """
@@ -79,3 +418,12 @@ class Analyzer(object):
         Has to be implemented in derived classes.
         """
         raise NotImplementedError()
+
+    def process_batch(self, batch):
+        """
+        The method is called for each EventBatch when running in batch mode.
+        By default each event of the batch is passed to process,
+        derived classes can override it with a vectorized implementation.
+        """
+        for event in batch.events():
+            self.process(event)
@@ -0,0 +1,186 @@
+import ROOT
+import numpy as np
+from collections import OrderedDict
+from FourMomentum import counts_to_offsets
+
+# Branches holding one value per object are stored as flat arrays,
+# the number of objects per event is given by the counter branch.
+JAGGED_COUNTERS = OrderedDict([('Muon_', 'NMuon'),
+                               ('Jet_', 'NJet'),
+                               ])
+
+def counter_branch(branch):
+    """
+    return the counter branch of a per-object branch or None for per-event branches.
+    """
+    for prefix, counter in JAGGED_COUNTERS.items():
+        if branch.startswith(prefix):
+            return counter
+    return None
+
+
+class ColumnChunk(object):
+    """
+    A chunk of consecutive entries of the events tree stored as NumPy arrays.
+
+    Per-event branches are arrays with one value per event, per-object branches
+    (Muon_*, Jet_*) are flat arrays over all objects in the chunk. The offsets of
+    each event into the flat arrays are derived from the counter branches.
+    """
+    def __init__(self, columns, first_entry=0):
+        self.columns = columns
+        self.first_entry = first_entry
+        self.n_events = 0
+        for name, column in columns.items():
+            if counter_branch(name) is None:
+                self.n_events = len(column)
+                break
+        self._offsets = {}
+
+    def __len__(self):
+        return self.n_events
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def offsets(self, counter):
+        """
+        return offsets into the flat object arrays for the given counter branch.
+        The objects of event i are stored in [offsets[i], offsets[i+1]).
+        """
+        if counter not in self._offsets:
+            self._offsets[counter] = counts_to_offsets(self.columns[counter])
+        return self._offsets[counter]
+
+    def select(self, mask):
+        """
+        return a new ColumnChunk containing only the events where mask is True.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        object_masks = {}
+        columns = OrderedDict()
+        for name, column in self.columns.items():
+            counter = counter_branch(name)
+            if counter is None:
+                columns[name] = column[mask]
+                continue
+            if counter not in object_masks:
+                object_masks[counter] = np.repeat(mask, self.columns[counter])
+            columns[name] = column[object_masks[counter]]
+        return ColumnChunk(columns, self.first_entry)
+
+    def slice(self, begin, end):
+        """
+        return a new ColumnChunk containing the events [begin, end).
+        """
+        columns = OrderedDict()
+        for name, column in self.columns.items():
+            counter = counter_branch(name)
+            if counter is None:
+                columns[name] = column[begin:end]
+            else:
+                offsets = self.offsets(counter)
+                columns[name] = column[offsets[begin]:offsets[end]]
+        return ColumnChunk(columns, self.first_entry + begin)
+
+    def chunks(self, first_entry=0, last_entry=-1, chunk_size=100000):
+        """
+        Generator over the events [first_entry, last_entry) in chunks of chunk_size events.
+        """
+        if last_entry < 0 or last_entry > self.n_events:
+            last_entry = self.n_events
+        for begin in range(first_entry, last_entry, chunk_size):
+            yield self.slice(begin, min(begin + chunk_size, last_entry))
+
+    @classmethod
+    def concatenate(cls, chunks):
+        """
+        return a single ColumnChunk containing the events of all chunks.
+        """
+        chunks = list(chunks)
+        columns = OrderedDict()
+        for name in chunks[0].columns.keys():
+            columns[name] = np.concatenate([chunk.columns[name] for chunk in chunks])
+        return cls(columns, chunks[0].first_entry)
+
+    def row(self, i):
+        """
+        return a view of event i with the same attribute access as a tree entry.
+        """
+        return ColumnRow(self, i)
+
+
+class ColumnRow(object):
+    """
+    A single event of a ColumnChunk.
+
+    Branches are accessed as attributes like on the entries of a TTree,
+    per-object branches return the list of objects belonging to the event.
+    The values are Python floats, ints and bools like those read from a TTree, so events
+    built from float32 columns, e.g. of a skim or an event store, are computed in double
+    precision and give the same results as events built from the tree.
+    """
+    def __init__(self, chunk, i):
+        self._chunk = chunk
+        self._i = i
+
+    def __getattr__(self, name):
+        column = self._chunk.columns[name]
+        counter = counter_branch(name)
+        if counter is None:
+            return column[self._i].item()
+        offsets = self._chunk.offsets(counter)
+        return column[offsets[self._i]:offsets[self._i+1]].tolist()
+
+
+def _flatten(column):
+    """
+    flatten a column of per-event vectors returned by RDataFrame.AsNumpy.
+    """
+    if len(column) == 0:
+        return np.zeros(0)
+    return np.concatenate([np.asarray(v) for v in column])
+
+def prune_branches(tree, branches, cache_size=30*1024*1024):
+    """
+    Disable all branches of the tree except the given ones
+    and enable the TTree read cache for them.
+    """
+    tree.SetBranchStatus("*", 0)
+    for branch in branches:
+        tree.SetBranchStatus(branch, 1)
+    tree.SetCacheSize(cache_size)
+    for branch in branches:
+        tree.AddBranchToCache(branch, True)
+    tree.StopCacheLearningPhase()
+
+def read_chunks(tree, branches, first_entry=0, last_entry=-1, chunk_size=100000):
+    """
+    Read the given branches of tree in chunks of chunk_size entries.
+
+    Reads entries [first_entry, last_entry), last_entry < 0 reads until the end of the tree.
+    Yields a ColumnChunk for each chunk.
+    """
+    n_entries = tree.GetEntries()
+    if last_entry < 0 or last_entry > n_entries:
+        last_entry = n_entries
+    # counter branches are needed to unpack the per-object branches
+    branches = list(branches)
+    for branch in list(branches):
+        counter = counter_branch(branch)
+        if counter is not None and counter not in branches:
+            branches.append(counter)
+    df = ROOT.RDataFrame(tree)
+    for begin in range(first_entry, last_entry, chunk_size):
+        end = min(begin + chunk_size, last_entry)
+        arrays = df.Range(begin, end).AsNumpy(branches)
+        columns = OrderedDict()
+        for branch in branches:
+            if counter_branch(branch) is None:
+                columns[branch] = np.asarray(arrays[branch])
+            else:
+                columns[branch] = _flatten(arrays[branch])
+        yield ColumnChunk(columns, begin)
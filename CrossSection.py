@@ -0,0 +1,205 @@
+import numpy as np
+from collections import OrderedDict
+from Datasets import LUMINOSITY, default_datasets
+
+def variation_group(name):
+    """
+    return the systematic source of a variation, e.g. 'jec' for 'jec_up' and 'jec_down'.
+    """
+    for suffix in ('_up', '_down'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class CrossSection(object):
+    """
+    Measurement of the ttbar production cross section from cut flow yields,
+
+        sigma = (N_data - N_background) / (efficiency * luminosity),
+
+    with the efficiency of the signal selection (yield after cut relative to the yield after reference).
+
+    yields maps each process to the yields of its cut flow as returned by CutFlow.yields(),
+    variations maps the name of each systematic variation (e.g. 'jec_up') to the yields of
+    the processes in that variation. Processes missing in a variation, e.g. data, are taken
+    from the nominal yields. Without data the sum of all simulated processes is used as
+    expected data. Nothing is computed from events, so the measurement can be repeated
+    on stored results.
+    """
+    def __init__(self, yields, variations=None, signal='TTbar', data='Data', cut=None, reference=None,
+                 luminosity=LUMINOSITY):
+        self.yields = yields
+        self.variations = variations if variations is not None else OrderedDict()
+        self.signal = signal
+        self.data = data
+        names = yields[signal]['names']
+        self.cut = cut if cut is not None else names[-1]
+        self.reference = reference if reference is not None else names[0]
+        self.luminosity = luminosity
+
+    @classmethod
+    def from_analyzers(cls, analyzers, datasets=None, **kwargs):
+        """
+        return the CrossSection of the cut flows of an OrderedDict of analyzers, e.g. loaded by a ResultsStore,
+        including the yields of their variations. The yields are combined and scaled per dataset of
+        the registry datasets (see Datasets.yields), by default the datasets of the analysis.
+        """
+        if datasets is None:
+            datasets = default_datasets()
+        kwargs.setdefault('luminosity', datasets.luminosity)
+        yields = datasets.yields(analyzers)
+        variations = OrderedDict()
+        for analyzer in analyzers.values():
+            if analyzer.variation is None:
+                continue
+            for variation, variation_analyzer in analyzer.variation_analyzers().items():
+                if variation_analyzer is not analyzer and variation not in variations:
+                    variations[variation] = datasets.yields(analyzers, variation)
+        return cls(yields, variations, **kwargs)
+
+    def has_data(self):
+        return self.data in self.yields
+
+    def components(self, variation=None):
+        """
+        return an OrderedDict with the weighted yields and their sums of squared weights entering
+        the measurement: data, background, signal after cut and after reference.
+        """
+        yields = OrderedDict(self.yields)
+        if variation is not None:
+            yields.update(self.variations[variation])
+        def value(process, cut, key):
+            return yields[process][key][yields[process]['names'].index(cut)]
+        backgrounds = [p for p in yields if p not in (self.signal, self.data)]
+        components = OrderedDict()
+        if self.has_data():
+            components['data'] = value(self.data, self.cut, 'sumw')
+            components['data_sumw2'] = value(self.data, self.cut, 'sumw2')
+        else:
+            components['data'] = sum(value(p, self.cut, 'sumw') for p in backgrounds + [self.signal])
+            # expected data, Poisson uncertainty
+            components['data_sumw2'] = components['data']
+        components['background'] = sum(value(p, self.cut, 'sumw') for p in backgrounds)
+        components['background_sumw2'] = sum(value(p, self.cut, 'sumw2') for p in backgrounds)
+        components['signal_pass'] = value(self.signal, self.cut, 'sumw')
+        components['signal_pass_sumw2'] = value(self.signal, self.cut, 'sumw2')
+        components['signal_total'] = value(self.signal, self.reference, 'sumw')
+        components['signal_total_sumw2'] = value(self.signal, self.reference, 'sumw2')
+        return components
+
+    def calculate(self, data, background, signal_pass, signal_total):
+        """
+        return the cross section for the given yields, which may be arrays.
+        Without signal events passing the cut the result is inf or nan.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency = np.divide(signal_pass, signal_total)
+            return np.divide(data - background, efficiency*self.luminosity)
+
+    def efficiency(self, variation=None):
+        """
+        return the signal efficiency, nan without signal events after reference.
+        """
+        c = self.components(variation)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return float(np.divide(c['signal_pass'], c['signal_total']))
+
+    def value(self, variation=None):
+        """
+        return the measured cross section in pb.
+        """
+        c = self.components(variation)
+        return float(self.calculate(c['data'], c['background'], c['signal_pass'], c['signal_total']))
+
+    def stat_errors(self):
+        """
+        return the statistical uncertainties of the cross section by linear error propagation:
+        of the data, of the simulated background and of the efficiency (weighted binomial), and their total.
+        They are nan if no signal events pass the cut.
+        """
+        c = self.components()
+        efficiency = self.efficiency()
+        if not efficiency > 0:
+            print("Warning: no signal events pass the cut '%s', the cross section is undefined." % self.cut)
+            errors = OrderedDict((name, float('nan')) for name in ('data', 'background', 'efficiency'))
+            errors['total'] = float('nan')
+            return errors
+        sigma = self.value()
+        scale = 1/(efficiency*self.luminosity)
+        efficiency_var = ((1 - 2*efficiency)*c['signal_pass_sumw2']
+                          + efficiency*efficiency*c['signal_total_sumw2'])/c['signal_total']**2
+        errors = OrderedDict([('data', scale*c['data_sumw2']**0.5),
+                              ('background', scale*c['background_sumw2']**0.5),
+                              ('efficiency', abs(sigma)/efficiency*max(efficiency_var, 0.0)**0.5)])
+        errors['total'] = sum(e*e for e in errors.values())**0.5
+        return errors
+
+    def toys(self, n_toys=10000, seed=1):
+        """
+        return the cross sections of n_toys pseudo-experiments as array.
+
+        The data yield is Poisson distributed. The simulated yields are Poisson distributed
+        in their effective number of events sumw^2/sumw2, independently for the signal events
+        passing and failing the selection.
+        """
+        rng = np.random.RandomState(seed)
+        c = self.components()
+        def fluctuate(sumw, sumw2):
+            if sumw <= 0 or sumw2 <= 0:
+                return np.full(n_toys, float(sumw))
+            n_effective = sumw*sumw/sumw2
+            return rng.poisson(n_effective, n_toys)*(sumw/n_effective)
+        data = fluctuate(c['data'], c['data_sumw2'])
+        background = fluctuate(c['background'], c['background_sumw2'])
+        signal_pass = fluctuate(c['signal_pass'], c['signal_pass_sumw2'])
+        signal_fail = fluctuate(c['signal_total'] - c['signal_pass'], c['signal_total_sumw2'] - c['signal_pass_sumw2'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.calculate(data, background, signal_pass, signal_pass + signal_fail)
+
+    def toy_errors(self, n_toys=10000, seed=1):
+        """
+        return the standard deviation and the central 68% interval of the cross section in pseudo-experiments.
+        """
+        toys = self.toys(n_toys, seed)
+        toys = toys[np.isfinite(toys)]
+        if len(toys) == 0:
+            return OrderedDict([('std', float('nan')), ('low', float('nan')), ('high', float('nan'))])
+        low, high = np.percentile(toys, [15.865, 84.135])
+        return OrderedDict([('std', float(np.std(toys))), ('low', float(low)), ('high', float(high))])
+
+    def systematics(self):
+        """
+        return the systematic uncertainties: for each source the shifts of the cross section in its
+        variations and the envelope (largest absolute shift), and the total envelope added in quadrature.
+        """
+        nominal = self.value()
+        sources = OrderedDict()
+        for variation in self.variations:
+            source = sources.setdefault(variation_group(variation), OrderedDict([('shifts', OrderedDict())]))
+            shift = self.value(variation) - nominal
+            # without selected signal events the cross section is undefined, not infinite
+            source['shifts'][variation] = shift if np.isfinite(shift) else float('nan')
+        for source in sources.values():
+            source['envelope'] = float(np.max(np.abs(list(source['shifts'].values()))))
+        total = sum(source['envelope']**2 for source in sources.values())**0.5
+        return sources, total
+
+    def summary(self, n_toys=10000, seed=1):
+        """
+        return the measurement with all uncertainties as string.
+        """
+        c = self.components()
+        stat = self.stat_errors()
+        toys = self.toy_errors(n_toys, seed)
+        sources, syst = self.systematics()
+        lines = ["Cross section measurement after cut '%s'%s:" % (self.cut, "" if self.has_data() else " (expected data)"),
+                 "  data: %.1f, background: %.1f +- %.1f" % (c['data'], c['background'], c['background_sumw2']**0.5),
+                 "  efficiency: %.4f" % self.efficiency(),
+                 "  sigma_ttbar = %.1f +- %.1f (stat) +- %.1f (syst) pb" % (self.value(), stat['total'], syst),
+                 "  stat: data %.1f, background %.1f, efficiency %.1f pb" % (stat['data'], stat['background'], stat['efficiency']),
+                 "  stat from %d toys: %.1f pb, 68%% interval [%.1f, %.1f] pb" % (n_toys, toys['std'], toys['low'], toys['high'])]
+        for name, source in sources.items():
+            shifts = ", ".join("%s %+.1f" % item for item in source['shifts'].items())
+            lines.append("  syst %s: %.1f pb (%s)" % (name, source['envelope'], shifts))
+        return "\n".join(lines)
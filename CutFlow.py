@@ -0,0 +1,246 @@
+import ROOT
+import operator
+import numpy as np
+
+# comparison operators allowed in cuts and preselections
+OPERATORS = {'==': operator.eq,
+             '!=': operator.ne,
+             '>': operator.gt,
+             '>=': operator.ge,
+             '<': operator.lt,
+             '<=': operator.le,
+             }
+
+class Cut(object):
+    """
+    A named cut of a CutFlow.
+
+    The selection is either a function returning True for events passing the cut
+    or a tuple (field, operator, value), e.g. ('n_jets', '>=', 4) or
+    ('trigger.IsoMu24', '==', True). Fields are attributes or methods of Event and
+    EventBatch, dictionary entries are separated by a dot. Selections given as tuple
+    work for single events and batches, for functions select_batch can give a
+    vectorized version returning a mask.
+    """
+    def __init__(self, name, selection=None, select_batch=None, histograms=()):
+        self.name = name
+        self.selection = selection
+        self.select_batch = select_batch
+        self.histograms = list(histograms)
+        if isinstance(selection, tuple) and selection[1] not in OPERATORS:
+            raise ValueError("Cut(): unknown operator '%s' in cut %s" % (selection[1], name))
+
+    def value(self, event):
+        """
+        return the value of the field of a (field, operator, value) selection.
+        """
+        names = self.selection[0].split('.')
+        value = getattr(event, names[0])
+        if callable(value):
+            value = value()
+        for name in names[1:]:
+            value = value[name]
+        return value
+
+    def passes(self, event):
+        """
+        return True if the event passes the cut.
+        """
+        if self.selection is None:
+            return True
+        if callable(self.selection):
+            return bool(self.selection(event))
+        return bool(OPERATORS[self.selection[1]](self.value(event), self.selection[2]))
+
+    def mask(self, batch):
+        """
+        return the mask of events of an EventBatch passing the cut.
+        """
+        if self.selection is None:
+            return np.ones(len(batch), dtype=bool)
+        if callable(self.selection):
+            if self.select_batch is not None:
+                return np.asarray(self.select_batch(batch), dtype=bool)
+            return np.array([self.passes(event) for event in batch.events()], dtype=bool)
+        return np.asarray(OPERATORS[self.selection[1]](self.value(batch), self.selection[2]), dtype=bool)
+
+
+class CutFlow(object):
+    """
+    An ordered list of named cuts with the yields after each cut.
+
+    Events are passed through the cuts in order until the first cut fails, batches
+    are reduced by the mask of each cut. After each cut the number of events, the sum
+    of weights and the sum of squared weights are recorded and the histogram
+    collections requested for this cut are filled.
+    """
+    def __init__(self, name="cutflow"):
+        self.name = name
+        self.cuts = []
+        # yields after each cut
+        self.counts = []
+        self.sumw = []
+        self.sumw2 = []
+
+    def add_cut(self, name, selection=None, select_batch=None, histograms=()):
+        """
+        Append a cut, see Cut for the selection.
+
+        histograms are the names of the histogram collections of the analyzer
+        filled with the events passing this and all previous cuts.
+        """
+        if name in self.names():
+            raise ValueError("CutFlow.add_cut(): cut %s already exists" % name)
+        self.cuts.append(Cut(name, selection, select_batch, histograms))
+        self.counts.append(0)
+        self.sumw.append(0.0)
+        self.sumw2.append(0.0)
+
+    def names(self):
+        """
+        return the names of all cuts.
+        """
+        return [cut.name for cut in self.cuts]
+
+    def index(self, name):
+        """
+        return the position of a cut.
+        """
+        return self.names().index(name)
+
+    def process(self, event, fill=None):
+        """
+        Apply the cuts to an event and record the yields.
+
+        fill(event, name) is called for the histogram collections of each passed cut.
+        returns True if the event passes all cuts.
+        """
+        weight = event.weight
+        for i, cut in enumerate(self.cuts):
+            if not cut.passes(event):
+                return False
+            self.counts[i] += 1
+            self.sumw[i] += weight
+            self.sumw2[i] += weight*weight
+            if fill is not None:
+                for name in cut.histograms:
+                    fill(event, name)
+        return True
+
+    def process_batch(self, batch, fill=None):
+        """
+        Apply the cuts to an EventBatch and record the yields.
+
+        fill(batch, name) is called for the histogram collections of each cut with
+        the events passing it.
+        returns the EventBatch of events passing all cuts.
+        """
+        for i, cut in enumerate(self.cuts):
+            if cut.selection is not None:
+                batch = batch.select(cut.mask(batch))
+            self.counts[i] += len(batch)
+            self.sumw[i] += float(np.sum(batch.weight))
+            self.sumw2[i] += float(np.sum(batch.weight*batch.weight))
+            if fill is not None:
+                for name in cut.histograms:
+                    fill(batch, name)
+        return batch
+
+    def set_first(self, yields):
+        """
+        Replace the yields of the first cut, e.g. by the yields of all events of a file
+        of which only a preselection was processed. The first cut must not select events.
+        yields holds 'counts', 'sumw' and 'sumw2' with one value each.
+        """
+        if not self.cuts:
+            return
+        if self.cuts[0].selection is not None:
+            raise ValueError("CutFlow.set_first(): the first cut %s selects events, "
+                             "add a cut without selection, e.g. 'no_cuts', first" % self.cuts[0].name)
+        self.counts[0] = yields['counts'][0]
+        self.sumw[0] = yields['sumw'][0]
+        self.sumw2[0] = yields['sumw2'][0]
+
+    def count(self, name):
+        """
+        return the number of events passing the cut name.
+        """
+        return self.counts[self.index(name)]
+
+    def sum_weights(self, name):
+        """
+        return the weighted number of events passing the cut name.
+        """
+        return self.sumw[self.index(name)]
+
+    def error(self, name):
+        """
+        return the statistical uncertainty of the weighted number of events passing the cut name.
+        """
+        return self.sumw2[self.index(name)]**0.5
+
+    def efficiency(self, name, reference=None, weighted=True):
+        """
+        return the fraction of events passing the cut name of the events passing the
+        cut reference, by default the first cut.
+        """
+        yields = self.sumw if weighted else self.counts
+        denominator = yields[self.index(reference) if reference is not None else 0]
+        return yields[self.index(name)] / denominator if denominator != 0 else 0.0
+
+    def table(self):
+        """
+        return the cut flow table as string.
+        """
+        lines = ["%-20s %12s %14s %14s %10s" % ("cut", "events", "weighted", "uncertainty", "eff.")]
+        for i, cut in enumerate(self.cuts):
+            lines.append("%-20s %12d %14.2f %14.2f %10.4f" % (cut.name, self.counts[i], self.sumw[i],
+                                                             self.sumw2[i]**0.5, self.efficiency(cut.name)))
+        return "\n".join(lines)
+
+    def yields(self):
+        """
+        return the yields after each cut, e.g. to send them from a worker process.
+        """
+        return {'names': self.names(), 'counts': list(self.counts),
+                'sumw': list(self.sumw), 'sumw2': list(self.sumw2)}
+
+    def merge(self, yields, first=False):
+        """
+        Add yields returned by yields() of a CutFlow with the same cuts.
+        If first is True the yields are replaced instead.
+        """
+        if yields['names'] != self.names():
+            raise ValueError("CutFlow.merge(): cuts do not match")
+        for name in ('counts', 'sumw', 'sumw2'):
+            if first:
+                setattr(self, name, list(yields[name]))
+            else:
+                setattr(self, name, [a + b for a, b in zip(getattr(self, name), yields[name])])
+
+    def to_histograms(self):
+        """
+        return the cut flow as ROOT histograms with one bin per cut,
+        holding the weighted (with uncertainties) and unweighted yields.
+        """
+        n = len(self.cuts)
+        weighted = ROOT.TH1D(self.name+"_weighted", "cut flow;;weighted events", n, 0, n)
+        unweighted = ROOT.TH1D(self.name+"_unweighted", "cut flow;;events", n, 0, n)
+        weighted.Sumw2()
+        for i, cut in enumerate(self.cuts):
+            for hist in (weighted, unweighted):
+                hist.GetXaxis().SetBinLabel(i+1, cut.name)
+            weighted.SetBinContent(i+1, self.sumw[i])
+            weighted.SetBinError(i+1, self.sumw2[i]**0.5)
+            unweighted.SetBinContent(i+1, self.counts[i])
+        weighted.SetEntries(self.counts[0] if n else 0)
+        unweighted.SetEntries(self.counts[0] if n else 0)
+        return weighted, unweighted
+
+    def write(self, tdir):
+        """
+        write the cut flow histograms to the given directory.
+        """
+        tdir.cd()
+        for hist in self.to_histograms():
+            hist.Write()
@@ -0,0 +1,160 @@
+import numpy as np
+from collections import OrderedDict
+from Analyzer import Analyzer
+
+def _leading_muon_pt(event):
+    return event.muons[0].pt() if event.muons else 0.0
+
+def _leading_muon_pt_batch(batch):
+    muon, has_muon = batch.muons.nth(0)
+    pt = np.zeros(len(batch))
+    pt[has_muon] = muon.pt()
+    return pt
+
+# variables available for cut scans: name -> (function of an Event, function of an EventBatch)
+SCAN_VARIABLES = OrderedDict([
+    ('muon_pt', (_leading_muon_pt, _leading_muon_pt_batch)),
+    ('n_jets', (lambda event: event.n_jets(), lambda batch: batch.n_jets())),
+    ('n_b_jets', (lambda event: event.n_b_jets(), lambda batch: batch.n_b_jets())),
+    ('met_pt', (lambda event: event.met.pt(), lambda batch: batch.met.pt())),
+    ])
+
+
+class CutScan(object):
+    """
+    Weighted yields for all points of a grid of cut thresholds from a single pass over the events.
+
+    Each variable is cut as value >= threshold. The events are filled into a
+    multidimensional histogram with the thresholds as bin edges, the yields for
+    every grid point are then obtained from cumulative sums over each axis.
+    """
+    def __init__(self, grid):
+        """
+        grid is an OrderedDict of variable names from SCAN_VARIABLES and lists of thresholds.
+        """
+        self.variables = list(grid.keys())
+        for name in self.variables:
+            if name not in SCAN_VARIABLES:
+                raise ValueError("CutScan(): unknown variable %s" % name)
+        self.thresholds = [np.sort(np.asarray(grid[name], dtype=np.float64)) for name in self.variables]
+        # bin 0 holds values below the first threshold
+        self.shape = tuple(len(t) + 1 for t in self.thresholds)
+        self.sumw = np.zeros(self.shape)
+        self.sumw2 = np.zeros(self.shape)
+
+    def _fill(self, values, weights):
+        """
+        add events with the given values of each variable and weights.
+        """
+        bins = [np.searchsorted(t, v, side='right') for t, v in zip(self.thresholds, values)]
+        index = np.ravel_multi_index(bins, self.shape)
+        size = int(np.prod(self.shape))
+        self.sumw += np.bincount(index, weights, minlength=size).reshape(self.shape)
+        self.sumw2 += np.bincount(index, weights*weights, minlength=size).reshape(self.shape)
+
+    def fill(self, event):
+        """
+        add a single event.
+        """
+        values = [np.array([SCAN_VARIABLES[name][0](event)], dtype=np.float64) for name in self.variables]
+        self._fill(values, np.array([event.weight], dtype=np.float64))
+
+    def fill_batch(self, batch):
+        """
+        add all events of an EventBatch.
+        """
+        values = [np.asarray(SCAN_VARIABLES[name][1](batch), dtype=np.float64) for name in self.variables]
+        self._fill(values, np.asarray(batch.weight, dtype=np.float64))
+
+    def yields(self, squared=False):
+        """
+        return the weighted yields for every grid point.
+
+        Element [i, j, ...] holds the events with values >= thresholds[0][i],
+        thresholds[1][j], ... . With squared=True the sums of squared weights are returned.
+        """
+        table = self.sumw2 if squared else self.sumw
+        for axis in range(table.ndim):
+            table = np.flip(np.cumsum(np.flip(table, axis), axis=axis), axis)
+        return table[tuple(slice(1, None) for _ in self.shape)]
+
+    def merge(self, results, first=False):
+        """
+        Add the sums of another CutScan with the same grid.
+        If first is True the sums are replaced instead.
+        """
+        if first:
+            self.sumw = np.array(results['sumw'])
+            self.sumw2 = np.array(results['sumw2'])
+        else:
+            self.sumw = self.sumw + results['sumw']
+            self.sumw2 = self.sumw2 + results['sumw2']
+
+    def grid_point(self, index):
+        """
+        return the thresholds of a grid point as OrderedDict.
+        """
+        return OrderedDict((name, t[i]) for name, t, i in zip(self.variables, self.thresholds, index))
+
+
+def significance(scans, signal='TTbar', metric='s_over_sqrt_b'):
+    """
+    return the significance for every grid point.
+
+    scans is a dict of dataset names and CutScans with the same grid. Data is
+    ignored, all other datasets except signal are background.
+    metric is 's_over_sqrt_b' for S/sqrt(B) or 's_over_sqrt_s_plus_b' for S/sqrt(S+B).
+    Grid points without any expected events have significance 0.
+    """
+    s = scans[signal].yields()
+    b = sum(scan.yields() for name, scan in scans.items()
+            if name != signal and 'data' not in name.lower())
+    if metric == 's_over_sqrt_b':
+        denominator = b
+    elif metric == 's_over_sqrt_s_plus_b':
+        denominator = s + b
+    else:
+        raise ValueError("significance(): unknown metric %s" % metric)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = s / np.sqrt(denominator)
+    return np.where(denominator > 0, result, 0.0)
+
+def best_grid_points(scans, n=10, signal='TTbar', metric='s_over_sqrt_b'):
+    """
+    return the n grid points with the highest significance as list of (significance, thresholds).
+    """
+    values = significance(scans, signal, metric)
+    scan = scans[signal]
+    order = np.argsort(values, axis=None)[::-1][:n]
+    return [(values.flat[i], scan.grid_point(np.unravel_index(i, values.shape))) for i in order]
+
+
+class ScanAnalyzer(Analyzer):
+    """
+    Analyzer filling a CutScan with the events passing the trigger selection.
+
+    The grid is given by the "scan" event option, an OrderedDict of variable names
+    from SCAN_VARIABLES and lists of thresholds.
+    """
+
+    def __init__(self, dataset_name, file_name, event_options = {}):
+        super(ScanAnalyzer, self).__init__(dataset_name, file_name, event_options)
+        self.scan = CutScan(event_options["scan"])
+        self.cutflow.add_cut("no_cuts")
+        self.cutflow.add_cut("trigger", ("trigger.IsoMu24", "==", True))
+
+    def process(self, event):
+        if self.cutflow.process(event):
+            self.scan.fill(event)
+
+    def process_batch(self, batch):
+        self.scan.fill_batch(self.cutflow.process_batch(batch))
+
+    def results(self):
+        results = super(ScanAnalyzer, self).results()
+        results['scan'] = {'sumw': self.scan.sumw, 'sumw2': self.scan.sumw2}
+        return results
+
+    def merge(self, results, first=False):
+        super(ScanAnalyzer, self).merge(results, first)
+        self.scan.merge(results['scan'], first)
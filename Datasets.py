@@ -0,0 +1,239 @@
+from collections import OrderedDict
+
+# integrated luminosity of the data in pb^-1
+LUMINOSITY = 50.
+
+class Sample(object):
+    """
+    An input file of a dataset with the cross section of the simulated process in pb
+    and the sum of weights of the generated events.
+
+    Simulated events are scaled by xsec * luminosity / sumw. Without cross section or
+    sum of weights the scale factor is 1, the event weights of the files are then
+    expected to be normalized to the luminosity already.
+    """
+    def __init__(self, file_name, xsec=None, sumw=None):
+        self.file_name = file_name
+        self.xsec = xsec
+        self.sumw = sumw
+
+    def scale(self, luminosity):
+        """
+        return the scale factor of the events for the given luminosity.
+        """
+        if self.xsec is None or self.sumw is None:
+            return 1.0
+        return self.xsec*luminosity/self.sumw
+
+
+class Dataset(object):
+    """
+    A process of the analysis, e.g. Diboson, made of one or several samples.
+    """
+    def __init__(self, name, samples, color=None, is_data=False):
+        self.name = name
+        self.samples = list(samples)
+        self.color = color
+        self.is_data = is_data
+
+    def run_names(self):
+        """
+        return the names of the samples as processed by an analyzer, the name of the dataset
+        for a single sample or <name>-<n> for several samples.
+        """
+        if len(self.samples) == 1:
+            return [self.name]
+        return ["%s-%d" % (self.name, i+1) for i in range(len(self.samples))]
+
+
+class Datasets(object):
+    """
+    Registry of the datasets of the analysis with the luminosity, the plotting colors
+    and the normalization of each sample.
+
+    Analyzers run on each sample separately (see runs). The scale factors of the samples
+    are only applied when the results of the samples are combined per dataset, e.g. for
+    plotting, so changing a cross section or the luminosity does not require processing
+    the events again.
+    """
+    def __init__(self, luminosity=LUMINOSITY):
+        self.luminosity = luminosity
+        self.datasets = OrderedDict()
+
+    def add(self, name, files, color=None, xsec=None, sumw=None, is_data=False):
+        """
+        Add a dataset of one file or a list of files.
+        xsec and sumw are given for all files or as list with one value per file.
+        """
+        if isinstance(files, str):
+            files = [files]
+        def per_file(value):
+            if isinstance(value, (list, tuple)):
+                if len(value) != len(files):
+                    raise ValueError("Datasets.add(): %s needs one value per file" % name)
+                return list(value)
+            return [value]*len(files)
+        samples = [Sample(f, x, s) for f, x, s in zip(files, per_file(xsec), per_file(sumw))]
+        self.datasets[name] = Dataset(name, samples, color, is_data)
+        return self
+
+    def __getitem__(self, name):
+        return self.datasets[name]
+
+    def __contains__(self, name):
+        return name in self.datasets
+
+    def __iter__(self):
+        return iter(self.datasets)
+
+    def __len__(self):
+        return len(self.datasets)
+
+    def keys(self):
+        return self.datasets.keys()
+
+    def items(self):
+        return self.datasets.items()
+
+    def select(self, names=None, data=True):
+        """
+        return a registry with the given datasets, by default all, without the data if data is False.
+        """
+        selected = Datasets(self.luminosity)
+        for name, dataset in self.datasets.items():
+            if (names is None or name in names) and (data or not dataset.is_data):
+                selected.datasets[name] = dataset
+        return selected
+
+    def runs(self):
+        """
+        return an OrderedDict of the samples to process, name -> file name, e.g. for ParallelRunner or ResultsStore.
+        """
+        runs = OrderedDict()
+        for dataset in self.datasets.values():
+            for run_name, sample in zip(dataset.run_names(), dataset.samples):
+                runs[run_name] = sample.file_name
+        return runs
+
+    def samples(self, name):
+        """
+        return the run names and samples of a dataset.
+        """
+        dataset = self.datasets[name]
+        return list(zip(dataset.run_names(), dataset.samples))
+
+    def color(self, name):
+        """
+        return the plotting color of a dataset, None if not set.
+        """
+        return self.datasets[name].color if name in self.datasets else None
+
+    def is_data(self, name):
+        """
+        return True if name is a data set.
+        """
+        if name in self.datasets:
+            return self.datasets[name].is_data
+        return 'data' in name.lower()
+
+    def scale(self, run_name):
+        """
+        return the scale factor of the sample processed as run_name.
+        """
+        for dataset in self.datasets.values():
+            if run_name in dataset.run_names():
+                sample = dataset.samples[dataset.run_names().index(run_name)]
+                return 1.0 if dataset.is_data else sample.scale(self.luminosity)
+        return 1.0
+
+    def groups(self, analyzers):
+        """
+        return an OrderedDict dataset name -> list of (analyzer, scale factor) of its samples
+        for the analyzers of an OrderedDict run name -> analyzer. Analyzers not belonging
+        to a dataset of the registry form a dataset of their own.
+        """
+        groups = OrderedDict()
+        known = set()
+        for name in self.datasets:
+            runs = [(analyzers[run_name], self.scale(run_name)) for run_name, sample in self.samples(name)
+                    if run_name in analyzers]
+            known.update(run_name for run_name, sample in self.samples(name))
+            if runs:
+                groups[name] = runs
+        for run_name, analyzer in analyzers.items():
+            if run_name not in known:
+                groups[run_name] = [(analyzer, 1.0)]
+        return groups
+
+    def histograms(self, analyzers):
+        """
+        return the histograms of each dataset, summed over its samples with their scale factors,
+        as OrderedDict dataset name -> collection -> histogram key -> histogram.
+
+        Datasets of a single unscaled sample return the histograms of its analyzer,
+        the others are combined in copies, so the analyzers are left unchanged.
+        """
+        histograms = OrderedDict()
+        for name, runs in self.groups(analyzers).items():
+            collections = OrderedDict()
+            for collection in runs[0][0].histograms.keys():
+                collections[collection] = OrderedDict()
+                for key, hist in runs[0][0].histograms[collection].hists.items():
+                    if len(runs) == 1 and runs[0][1] == 1.0:
+                        collections[collection][key] = hist
+                        continue
+                    combined = hist.Clone(hist.GetName())
+                    combined.SetDirectory(0)
+                    combined.Reset()
+                    for analyzer, scale in runs:
+                        combined.Add(analyzer.histograms[collection].hists[key], scale)
+                    collections[collection][key] = combined
+            histograms[name] = collections
+        return histograms
+
+    def yields(self, analyzers, variation=None):
+        """
+        return the cut flow yields of each dataset, summed over its samples with their scale factors,
+        as OrderedDict dataset name -> yields (see CutFlow.yields), optionally of a systematic variation.
+        Systematic variations only apply to simulation, data is left out of their yields.
+        """
+        yields = OrderedDict()
+        for name, runs in self.groups(analyzers).items():
+            if variation is not None and self.is_data(name):
+                continue
+            combined = None
+            for analyzer, scale in runs:
+                if variation is not None:
+                    if analyzer.variation is None or variation not in analyzer.variation_analyzers():
+                        continue
+                    analyzer = analyzer.variation_analyzers()[variation]
+                run_yields = analyzer.cutflow.yields()
+                if combined is None:
+                    combined = {'names': run_yields['names'],
+                                'counts': [0]*len(run_yields['names']),
+                                'sumw': [0.0]*len(run_yields['names']),
+                                'sumw2': [0.0]*len(run_yields['names'])}
+                combined['counts'] = [a + b for a, b in zip(combined['counts'], run_yields['counts'])]
+                combined['sumw'] = [a + scale*b for a, b in zip(combined['sumw'], run_yields['sumw'])]
+                combined['sumw2'] = [a + scale*scale*b for a, b in zip(combined['sumw2'], run_yields['sumw2'])]
+            if combined is not None:
+                yields[name] = combined
+        return yields
+
+
+def default_datasets():
+    """
+    return the registry of the datasets of the ttbar analysis.
+
+    The cross sections and sums of weights are not set, the event weights of the
+    files are normalized to the luminosity of the data.
+    """
+    datasets = Datasets(LUMINOSITY)
+    datasets.add('Data', 'data.root', is_data=True)
+    datasets.add('QCD', 'qcd.root', color=867)
+    datasets.add('Diboson', ['ww.root', 'wz.root', 'zz.root'], color=875)
+    datasets.add('DY+jets', 'dy.root', color=829)
+    datasets.add('single top', 'single_top.root', color=798)
+    datasets.add('TTbar', 'ttbar.root', color=632)
+    datasets.add('W+jets', 'wjets.root', color=602)
+    return datasets
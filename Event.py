@@ -12,6 +12,8 @@ class Event(object):
         self.trigger = {}
         self.weight = 1.0
         self.top_mass = 0.0
+        # neutrino solutions by NeutrinoSolver settings, see NeutrinoSolver.event_neutrinos
+        self.neutrinos = {}
 
     def n_jets(self):
         """
@@ -30,3 +32,77 @@ class Event(object):
         returns number of b-tagged jets.
         """
         return len(self.b_jets)
+
+
+class LazyEvent(Event):
+    """
+    An Event whose muons, jets, b_jets and met are built by the EventBuilder on first access.
+
+    weight and trigger are set right away, so events rejected by the trigger never build
+    their objects. This only saves time if nothing uses the objects before the trigger cut:
+    filling histograms of all events, like the 'no_cuts' histograms of TTbarAnalyzer,
+    builds the objects of every event. The objects are read from the tree entry or
+    ColumnRow the event was built from; for a tree the entry is read again if the tree
+    has moved on.
+    """
+    def __init__(self, builder, source, entry=None):
+        super(LazyEvent, self).__init__()
+        self._builder = builder
+        self._source = source
+        self._entry = entry
+        # nothing is built yet, Event.__init__ has set empty collections
+        self._muons = None
+        self._jets = None
+        self._b_jets = None
+        self._met = None
+
+    def _read(self):
+        """
+        return the source positioned at the entry of the event.
+        """
+        if self._entry is not None and self._source.GetReadEntry() != self._entry:
+            self._source.GetEntry(self._entry)
+        return self._source
+
+    def _build_jets(self):
+        self._jets, self._b_jets = self._builder.build_jets(self._read())
+
+    @property
+    def muons(self):
+        if self._muons is None:
+            self._muons = self._builder.build_muons(self._read())
+        return self._muons
+
+    @muons.setter
+    def muons(self, muons):
+        self._muons = muons
+
+    @property
+    def jets(self):
+        if self._jets is None:
+            self._build_jets()
+        return self._jets
+
+    @jets.setter
+    def jets(self, jets):
+        self._jets = jets
+
+    @property
+    def b_jets(self):
+        if self._b_jets is None:
+            self._build_jets()
+        return self._b_jets
+
+    @b_jets.setter
+    def b_jets(self, b_jets):
+        self._b_jets = b_jets
+
+    @property
+    def met(self):
+        if self._met is None:
+            self._met = self._builder.build_met(self._read())
+        return self._met
+
+    @met.setter
+    def met(self, met):
+        self._met = met
@@ -0,0 +1,91 @@
+import numpy as np
+from Event import Event
+from uhhObjects import *
+
+
+class EventBatch(object):
+    """
+    A batch of collision events stored column-wise.
+
+    Per-event quantities are arrays with one entry per event. Object collections
+    (muons, jets, b_jets) are jagged MuonArray/JetArray objects, met is a METArray
+    with one entry per event.
+    """
+    def __init__(self, n_events=0):
+        self.n_events = n_events
+        self.weight = np.ones(n_events)
+        self.trigger = {}
+        self.met = METArray(np.zeros(n_events), np.zeros(n_events))
+        self.muons = MuonArray(offsets=np.zeros(n_events + 1, dtype=np.int64))
+        self.jets = JetArray(offsets=np.zeros(n_events + 1, dtype=np.int64))
+        self.b_jets = JetArray(offsets=np.zeros(n_events + 1, dtype=np.int64))
+        self.top_mass = np.zeros(n_events)
+        # entry of each event in the events tree
+        self.entries = np.arange(n_events)
+        # neutrino solutions by NeutrinoSolver settings, see NeutrinoSolver.batch_neutrinos
+        self.neutrinos = {}
+
+    def __len__(self):
+        return self.n_events
+
+    def n_muons(self):
+        """
+        returns number of muons per event.
+        """
+        return self.muons.counts()
+
+    def n_jets(self):
+        """
+        returns number of jets per event.
+        """
+        return self.jets.counts()
+
+    def n_b_jets(self):
+        """
+        returns number of b-tagged jets per event.
+        """
+        return self.b_jets.counts()
+
+    def select(self, mask):
+        """
+        return a new EventBatch containing only the events where mask is True.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        batch = EventBatch(int(np.count_nonzero(mask)))
+        batch.weight = self.weight[mask]
+        batch.trigger = dict((name, value[mask]) for name, value in self.trigger.items())
+        batch.met = self.met[mask]
+        batch.top_mass = self.top_mass[mask]
+        batch.entries = self.entries[mask]
+        batch.muons = self.muons.select_events(mask)
+        batch.jets = self.jets.select_events(mask)
+        batch.b_jets = self.b_jets.select_events(mask)
+        batch.neutrinos = dict((key, tuple(array[mask] for array in arrays))
+                               for key, arrays in self.neutrinos.items())
+        return batch
+
+    def events(self):
+        """
+        Generator over all events of the batch as Event objects.
+        """
+        weight = self.weight.tolist()
+        trigger = dict((name, value.tolist()) for name, value in self.trigger.items())
+        top_mass = self.top_mass.tolist()
+        mets = self.met.to_objects()
+        muons = self.muons.to_objects()
+        jets = self.jets.to_objects()
+        muon_offsets = self.muons.offsets.tolist()
+        jet_offsets = self.jets.offsets.tolist()
+        for i in range(self.n_events):
+            event = Event()
+            event.weight = weight[i]
+            for name in trigger.keys():
+                event.trigger[name] = trigger[name][i]
+            event.met = mets[i]
+            event.top_mass = top_mass[i]
+            event.muons = muons[muon_offsets[i]:muon_offsets[i+1]]
+            event.jets = jets[jet_offsets[i]:jet_offsets[i+1]]
+            event.b_jets = [jet for jet in event.jets if jet.has_b_tag]
+            yield event
+
+    __iter__ = events
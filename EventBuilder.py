@@ -1,5 +1,7 @@
 import ROOT
-from Event import Event
+import numpy as np
+from Event import Event, LazyEvent
+from EventBatch import EventBatch
 from uhhObjects import *
 
 class EventBuilder(object):
@@ -9,6 +11,10 @@ class EventBuilder(object):
     def __init__(self,options):
         self.tree = None
         self.btag_threshold = 1.74
+        # branches of the events tree used to build events
+        self.branches = ['EventWeight', 'triggerIsoMu24', 'MET_px', 'MET_py',
+                         'NMuon', 'Muon_Px', 'Muon_Py', 'Muon_Pz', 'Muon_E', 'Muon_Charge', 'Muon_Iso',
+                         'NJet', 'Jet_Px', 'Jet_Py', 'Jet_Pz', 'Jet_E', 'Jet_btag']
         
         # parse options
         jec_factor = 1.0
@@ -21,30 +27,92 @@ class EventBuilder(object):
         
         self.muon_isolation_threshold = 0.1
         if 'muon_isolation' in options.keys():
-            self.muon_isolation_thresold = options['muon_isolation']
+            self.muon_isolation_threshold = options['muon_isolation']
+
+        # build muons, jets and MET of an event only when they are accessed
+        self.lazy = False
+        if 'lazy' in options.keys():
+            self.lazy = options['lazy']
         
 
     def build_event(self,tree):
-        event = Event()
+        """
+        Build an Event from the current entry of the tree or a ColumnRow.
+        With the option "lazy" a LazyEvent is returned, which builds the objects on first access.
+        """
         self.tree = tree
-
+        if self.lazy:
+            # remember the entry, the tree may have moved on when the objects are accessed
+            entry = tree.GetReadEntry() if isinstance(tree, ROOT.TTree) else None
+            event = LazyEvent(self, tree, entry)
+        else:
+            event = Event()
+            event.met = self.build_met(tree) # set MET
+            event.muons = self.build_muons(tree) # set muons
+            event.jets, event.b_jets = self.build_jets(tree) # set jets
         event.weight = tree.EventWeight # set event weight
         event.trigger['IsoMu24'] = tree.triggerIsoMu24 # set trigger information
-        event.met = MET(tree.MET_px, tree.MET_py) # set MET
-        # set muons
+        return event
+
+    def build_met(self, tree):
+        """
+        return the MET of the current entry.
+        """
+        return MET(tree.MET_px, tree.MET_py)
+
+    def build_muons(self, tree):
+        """
+        return the list of isolated muons of the current entry.
+        """
+        muons = []
         for i in range(0,tree.NMuon):
             muon = Muon(tree.Muon_Px[i], tree.Muon_Py[i], tree.Muon_Pz[i], tree.Muon_E[i])
             muon.charge = tree.Muon_Charge[i]
             muon.iso = tree.Muon_Iso[i]/muon.pt()
             if muon.iso < self.muon_isolation_threshold:
-                event.muons.append(muon)
+                muons.append(muon)
+        return muons
 
-        # set jets
+    def build_jets(self, tree):
+        """
+        return the list of all jets and the list of b-tagged jets of the current entry.
+        """
+        jets = []
+        b_jets = []
         for i in range(0,tree.NJet):
             jet = Jet(tree.Jet_Px[i], tree.Jet_Py[i], tree.Jet_Pz[i], tree.Jet_E[i])
             jet = self.JEC * jet
             jet.has_b_tag = tree.Jet_btag[i] > self.btag_threshold
-            event.jets.append(jet)
+            jets.append(jet)
             if jet.has_b_tag:
-                event.b_jets.append(jet)
-        return event
+                b_jets.append(jet)
+        return jets, b_jets
+
+    def build_batch(self, chunk):
+        """
+        Build an EventBatch from a ColumnChunk of the events tree.
+
+        Applies the same muon isolation, JEC and b-tag selection as build_event
+        as vectorized masks on the whole chunk.
+        """
+        batch = EventBatch(len(chunk))
+        batch.weight = np.asarray(chunk['EventWeight'], dtype=np.float64)
+        batch.entries = chunk.first_entry + np.arange(len(chunk))
+        batch.trigger['IsoMu24'] = np.asarray(chunk['triggerIsoMu24'], dtype=bool)
+        batch.met = METArray(chunk['MET_px'], chunk['MET_py'])
+
+        # set muons
+        muons = MuonArray(chunk['Muon_Px'], chunk['Muon_Py'], chunk['Muon_Pz'], chunk['Muon_E'],
+                          charge=chunk['Muon_Charge'], offsets=chunk.offsets('NMuon'))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            muons.iso = chunk['Muon_Iso'] / muons.pt()
+        batch.muons = muons.select(muons.iso < self.muon_isolation_threshold)
+
+        # set jets
+        jets = JetArray(chunk['Jet_Px'], chunk['Jet_Py'], chunk['Jet_Pz'], chunk['Jet_E'],
+                        offsets=chunk.offsets('NJet'))
+        jets = self.JEC * jets
+        jets.has_b_tag = np.asarray(chunk['Jet_btag']) > self.btag_threshold
+        batch.jets = jets
+        batch.b_jets = jets.select(jets.has_b_tag)
+        return batch
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import errno
+import shutil
+import numpy as np
+import ROOT
+from collections import OrderedDict
+from ColumnChunk import ColumnChunk, JAGGED_COUNTERS, read_chunks, counter_branch, prune_branches
+from Fingerprint import input_fingerprint
+
+# version of the layout of the stores, stores of other versions are converted again
+STORE_VERSION = 1
+
+class EventStore(object):
+    """
+    Uncompressed columnar copy of the events tree of a file, read through numpy.memmap.
+
+    Each branch is stored as a raw binary file <branch>.bin in the directory
+    <store_dir>/<file name>, per-event branches with one value per event and per-object
+    branches (Muon_*, Jet_*) as flat arrays over all objects. For each counter branch
+    the offsets of the events into the flat arrays are stored in offsets_<counter>.bin.
+    metadata.json holds the number of events, the data types and the fingerprint of the
+    source file. Reading maps the files into memory without copying, so the pages are
+    shared by all processes reading the same store. The columns keep the types of the tree;
+    events built from them in event mode are computed in double precision, see ColumnRow.
+
+    The store is converted again when the source file changes or branches are missing.
+    Only one process converts a store at a time, holding the lock file <store>.lock.
+    """
+    def __init__(self, file_name, branches, store_dir='stores'):
+        self.file_name = file_name
+        self.branches = list(branches)
+        for branch in list(self.branches):
+            counter = counter_branch(branch)
+            if counter is not None and counter not in self.branches:
+                self.branches.append(counter)
+        self.store_dir = store_dir
+
+    def path(self):
+        """
+        return the directory of the store.
+        """
+        return os.path.join(self.store_dir, os.path.splitext(self.file_name)[0])
+
+    def metadata(self):
+        """
+        return the metadata of the store, None if it does not exist.
+        """
+        path = os.path.join(self.path(), 'metadata.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def is_current(self, metadata=None):
+        """
+        return True if the store is of the current source file and holds all branches.
+        """
+        if metadata is None:
+            metadata = self.metadata()
+        if metadata is None or metadata['version'] != STORE_VERSION:
+            return False
+        fingerprint = input_fingerprint(self.file_name)
+        if metadata['fingerprint']['sha1'] != fingerprint['sha1']:
+            return False
+        return all(branch in metadata['columns'] for branch in self.branches)
+
+    def load(self):
+        """
+        return a ColumnChunk of all events with memory-mapped columns, converting the source file first if needed.
+        """
+        metadata = self.metadata()
+        if not self.is_current(metadata):
+            # only one process converts, the others wait and use its store
+            self.lock()
+            try:
+                metadata = self.metadata()
+                if not self.is_current(metadata):
+                    self.convert(metadata)
+                    metadata = self.metadata()
+            finally:
+                self.unlock()
+        return self.read(metadata)
+
+    def lock(self, poll=0.5):
+        """
+        Wait until no other process converts the store and take the lock file.
+        Lock files of processes which are no longer running are removed.
+        """
+        if not os.path.exists(self.store_dir):
+            try:
+                os.makedirs(self.store_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        path = self.path()+'.lock'
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                if not _lock_alive(path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                time.sleep(poll)
+                continue
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return
+
+    def unlock(self):
+        """
+        Release the lock file taken by lock().
+        """
+        try:
+            os.remove(self.path()+'.lock')
+        except OSError:
+            pass
+
+    def read(self, metadata):
+        """
+        map the columns of the store into memory.
+        """
+        path = self.path()
+        columns = OrderedDict()
+        for branch in self.branches:
+            columns[branch] = _map(os.path.join(path, branch+'.bin'), metadata['columns'][branch])
+        chunk = ColumnChunk(columns)
+        chunk.n_events = metadata['n_events']
+        for counter in JAGGED_COUNTERS.values():
+            if counter in columns:
+                chunk._offsets[counter] = _map(os.path.join(path, 'offsets_%s.bin' % counter), np.dtype(np.int64).str)
+        return chunk
+
+    def convert(self, metadata=None, chunk_size=100000):
+        """
+        Write the branches of the events tree to the store, chunk by chunk.
+        Branches of an existing store are kept.
+        """
+        branches = list(self.branches)
+        if metadata is not None and metadata['version'] == STORE_VERSION:
+            branches += [b for b in metadata['columns'] if b not in branches]
+        print("Converting %s to event store %s." % (self.file_name, self.path()))
+        # write to a temporary directory first, so no incomplete store is read by other processes
+        tmp_path = "%s.%d.tmp" % (self.path(), os.getpid())
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        f = ROOT.TFile.Open('files/'+self.file_name)
+        tree = f.events
+        prune_branches(tree, branches)
+        dtypes = OrderedDict()
+        files = OrderedDict()
+        n_events = 0
+        offsets = dict((counter, 0) for counter in JAGGED_COUNTERS.values() if counter in branches)
+        try:
+            for chunk in read_chunks(tree, branches, chunk_size=chunk_size):
+                for branch in branches:
+                    column = np.asarray(chunk[branch])
+                    if branch not in files:
+                        dtypes[branch] = column.dtype
+                        files[branch] = open(os.path.join(tmp_path, branch+'.bin'), 'wb')
+                    np.ascontiguousarray(column, dtype=dtypes[branch]).tofile(files[branch])
+                for counter in offsets:
+                    if counter+'_offsets' not in files:
+                        files[counter+'_offsets'] = open(os.path.join(tmp_path, 'offsets_%s.bin' % counter), 'wb')
+                        np.zeros(1, dtype=np.int64).tofile(files[counter+'_offsets'])
+                    chunk_offsets = offsets[counter] + np.cumsum(chunk[counter], dtype=np.int64)
+                    chunk_offsets.tofile(files[counter+'_offsets'])
+                    if len(chunk_offsets):
+                        offsets[counter] = int(chunk_offsets[-1])
+                n_events += len(chunk)
+        finally:
+            for column_file in files.values():
+                column_file.close()
+            f.Close()
+        for branch in branches:
+            if branch not in files:
+                # empty tree
+                dtypes[branch] = np.dtype(np.float64)
+                open(os.path.join(tmp_path, branch+'.bin'), 'wb').close()
+        for counter in offsets:
+            if counter+'_offsets' not in files:
+                np.zeros(1, dtype=np.int64).tofile(os.path.join(tmp_path, 'offsets_%s.bin' % counter))
+        metadata = OrderedDict([('version', STORE_VERSION),
+                                ('file_name', self.file_name),
+                                ('fingerprint', input_fingerprint(self.file_name)),
+                                ('n_events', n_events),
+                                ('columns', OrderedDict((branch, dtypes[branch].str) for branch in branches))])
+        with open(os.path.join(tmp_path, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=1)
+        # move the old store aside before removing it, so the store is replaced in two renames
+        old_path = "%s.%d.old" % (self.path(), os.getpid())
+        if os.path.exists(self.path()):
+            os.rename(self.path(), old_path)
+        os.rename(tmp_path, self.path())
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _lock_alive(path):
+    """
+    return False if the process which wrote the lock file path is no longer running.
+    """
+    try:
+        with open(path) as f:
+            pid = int(f.read())
+    except (IOError, OSError):
+        # removed in the meantime
+        return True
+    except ValueError:
+        # just created and the pid not written yet
+        try:
+            return time.time() - os.path.getmtime(path) < 60
+        except OSError:
+            return True
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+def _map(path, dtype):
+    """
+    return the array stored in path, memory-mapped read-only.
+    """
+    dtype = np.dtype(str(dtype))
+    if os.path.getsize(path) == 0:
+        # empty files cannot be mapped
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
@@ -0,0 +1,55 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+# cache of the hashes of the input files
+FINGERPRINT_CACHE = 'output_fingerprints.json'
+
+def file_fingerprint(path, cache_file=None):
+    """
+    return size, modification time and SHA-1 hash of a file.
+
+    If cache_file is given, the hashes are cached in it and a file is only
+    hashed again once its size or modification time changed.
+    """
+    stat = os.stat(path)
+    fingerprint = OrderedDict([('size', stat.st_size), ('mtime', stat.st_mtime)])
+    if cache_file is None:
+        fingerprint['sha1'] = _sha1(path)
+        return fingerprint
+    cache = {}
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file) as f:
+                cache = json.load(f)
+        except ValueError:
+            cache = {}
+    cached = cache.get(path)
+    if cached and cached['size'] == fingerprint['size'] and cached['mtime'] == fingerprint['mtime']:
+        fingerprint['sha1'] = cached['sha1']
+        return fingerprint
+    fingerprint['sha1'] = _sha1(path)
+    cache[path] = fingerprint
+    try:
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f, indent=1)
+    except (IOError, OSError):
+        pass
+    return fingerprint
+
+def _sha1(path):
+    """
+    return the SHA-1 hash of the content of a file.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def input_fingerprint(file_name):
+    """
+    return the fingerprint of the input file files/<file_name>.
+    """
+    return file_fingerprint('files/'+file_name, FINGERPRINT_CACHE)
@@ -0,0 +1,320 @@
+import numpy as np
+from collections import OrderedDict
+
+# smallest expectation used in likelihoods, avoids log(0)
+TINY = 1e-12
+
+def hist_arrays(hist):
+    """
+    return the bin edges, contents and errors of a ROOT TH1 as NumPy arrays, without under- and overflow.
+    """
+    n = hist.GetNbinsX()
+    edges = np.array([hist.GetBinLowEdge(i) for i in range(1, n+2)])
+    counts = np.array([hist.GetBinContent(i) for i in range(1, n+1)])
+    errors = np.array([hist.GetBinError(i) for i in range(1, n+1)])
+    return edges, counts, errors
+
+def range_mask(edges, fit_min, fit_max):
+    """
+    return the mask of bins whose centers are inside [fit_min, fit_max].
+    fit_min and fit_max may be arrays of M ranges, giving an (M, n_bins) mask.
+    """
+    centers = 0.5*(edges[1:] + edges[:-1])
+    fit_min = np.asarray(fit_min, dtype=np.float64)
+    fit_max = np.asarray(fit_max, dtype=np.float64)
+    return (centers >= fit_min[..., None]) & (centers <= fit_max[..., None])
+
+def gaussian(x, params):
+    """
+    norm*exp(-0.5*((x-mean)/sigma)^2) for M parameter sets (norm, mean, sigma), returns an (M, len(x)) array.
+    """
+    norm, mean, sigma = params[:, 0:1], params[:, 1:2], params[:, 2:3]
+    t = (x - mean)/sigma
+    return norm*np.exp(-0.5*t*t)
+
+def crystal_ball(x, params):
+    """
+    Crystal Ball function for M parameter sets (norm, mean, sigma, alpha, n), returns an (M, len(x)) array.
+    Gaussian core with a power law tail below mean - alpha*sigma.
+    """
+    norm, mean, sigma, alpha, n = [params[:, i:i+1] for i in range(5)]
+    t = (x - mean)/sigma
+    core = np.exp(-0.5*t*t)
+    # the tail is only evaluated where it is used, t <= -alpha gives b - t >= n/alpha > 0
+    b = n/alpha - alpha
+    tail_t = np.minimum(t, -alpha)
+    tail = np.exp(n*np.log(n/alpha) - 0.5*alpha*alpha - n*np.log(b - tail_t))
+    return norm*np.where(t > -alpha, core, tail)
+
+def _moments(x, y, weights):
+    """
+    return maximum, mean and standard deviation of M binned distributions.
+    """
+    y = y*weights
+    total = np.maximum(y.sum(axis=1), TINY)
+    mean = (y*x).sum(axis=1)/total
+    sigma = np.sqrt(np.maximum((y*(x - mean[:, None])**2).sum(axis=1)/total, TINY))
+    return y.max(axis=1), mean, sigma
+
+def gaussian_start(x, y, weights):
+    return np.column_stack(_moments(x, y, weights))
+
+def crystal_ball_start(x, y, weights):
+    norm, mean, sigma = _moments(x, y, weights)
+    return np.column_stack([norm, mean, sigma, np.full(len(norm), 1.5), np.full(len(norm), 5.0)])
+
+
+class Model(object):
+    """
+    A fit function with named parameters, the starting values estimated from the data and parameter bounds.
+    """
+    def __init__(self, name, function, parameters, start, bounds):
+        self.name = name
+        self.function = function
+        self.parameters = tuple(parameters)
+        self.start = start
+        self.lower = np.array([b[0] for b in bounds], dtype=np.float64)
+        self.upper = np.array([b[1] for b in bounds], dtype=np.float64)
+
+    def __call__(self, x, params):
+        return self.function(x, params)
+
+MODELS = OrderedDict([('gaus', Model('gaus', gaussian, ('norm', 'mean', 'sigma'), gaussian_start,
+                                     [(0., np.inf), (-np.inf, np.inf), (1e-6, np.inf)])),
+                      ('crystal_ball', Model('crystal_ball', crystal_ball, ('norm', 'mean', 'sigma', 'alpha', 'n'),
+                                             crystal_ball_start,
+                                             [(0., np.inf), (-np.inf, np.inf), (1e-6, np.inf), (1e-3, 10.), (1.0001, 100.)])),
+                      ])
+
+
+class FitResult(object):
+    """
+    Result of M fits: parameter values and covariances, the minimum of chi2 or -2 ln L
+    (as Poisson deviance), the degrees of freedom and whether each fit converged.
+    """
+    def __init__(self, parameters, params, covariance, objective, ndf, converged):
+        self.parameters = tuple(parameters)
+        self.params = params
+        self.covariance = covariance
+        self.errors = np.sqrt(np.maximum(np.diagonal(covariance, axis1=1, axis2=2), 0.0))
+        self.objective = objective
+        self.ndf = ndf
+        self.converged = converged
+
+    def __len__(self):
+        return len(self.params)
+
+    def value(self, name):
+        """
+        return the fitted values of a parameter.
+        """
+        return self.params[:, self.parameters.index(name)]
+
+    def error(self, name):
+        """
+        return the uncertainties of a parameter.
+        """
+        return self.errors[:, self.parameters.index(name)]
+
+
+def _objective(y, mu, weights, likelihood):
+    """
+    return chi2 with the given weights (1/sigma^2 times the bin mask) or, for likelihood fits,
+    the Poisson deviance -2 ln(L/L_saturated) with weights the bin mask.
+    """
+    if not likelihood:
+        r = y - mu
+        return (weights*r*r).sum(axis=1)
+    mu = np.maximum(mu, TINY)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_term = np.where(y > 0, y*np.log(y/mu), 0.0)
+    return 2*(weights*(mu - y + log_term)).sum(axis=1)
+
+def _jacobian(model, x, params, mu):
+    """
+    return the derivatives of the model by its parameters as (M, n_bins, n_parameters) array.
+    """
+    jacobian = np.empty(mu.shape + (params.shape[1],))
+    for i in range(params.shape[1]):
+        step = 1e-7*np.maximum(np.abs(params[:, i]), 1e-3)
+        shifted = params.copy()
+        shifted[:, i] += step
+        jacobian[:, :, i] = (model(x, shifted) - mu)/step[:, None]
+    return jacobian
+
+def fit(model, edges, y, mask=None, errors=None, likelihood=False, p0=None, max_iter=200, tolerance=1e-10):
+    """
+    Fit a Model to M binned distributions at once.
+
+    y are the (M, n_bins) bin contents, or a single distribution. mask selects the bins used
+    in the fit, per distribution or for all. Chi2 fits use errors, by default sqrt(max(y, 1)),
+    likelihood fits maximize the Poisson likelihood. All fits are minimized simultaneously with
+    the Levenberg-Marquardt algorithm; for likelihood fits the weights are updated in every
+    iteration (Fisher scoring). The model is evaluated at the bin centers like a ROOT fit.
+    returns a FitResult.
+    """
+    if isinstance(model, str):
+        model = MODELS[model]
+    x = 0.5*(edges[1:] + edges[:-1])
+    y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+    n_fits, n_bins = y.shape
+    if mask is None:
+        mask = np.ones(n_bins, dtype=bool)
+    bin_weights = np.broadcast_to(np.asarray(mask, dtype=np.float64), y.shape)
+    if not likelihood:
+        sigma2 = np.maximum(y, 1.0) if errors is None else np.maximum(np.asarray(errors, dtype=np.float64)**2, TINY)
+        bin_weights = bin_weights/sigma2
+    if p0 is None:
+        params = model.start(x, y, np.broadcast_to(np.asarray(mask, dtype=np.float64), y.shape))
+    else:
+        params = np.array(np.broadcast_to(np.asarray(p0, dtype=np.float64), (n_fits, len(model.parameters))))
+    params = np.clip(params, model.lower, model.upper)
+
+    n_parameters = params.shape[1]
+    diagonal = np.arange(n_parameters)
+    damping = np.full(n_fits, 1e-3)
+    mu = model(x, params)
+    objective = _objective(y, mu, bin_weights, likelihood)
+    done = ~np.isfinite(objective)
+    for iteration in range(max_iter):
+        weights = bin_weights/np.maximum(mu, TINY) if likelihood else bin_weights
+        jacobian = _jacobian(model, x, params, mu)
+        curvature = np.einsum('mbi,mb,mbj->mij', jacobian, weights, jacobian)
+        gradient = np.einsum('mbi,mb,mb->mi', jacobian, weights, y - mu)
+        damped = curvature.copy()
+        damped[:, diagonal, diagonal] *= 1 + damping[:, None]
+        step = np.einsum('mij,mj->mi', np.linalg.pinv(damped), gradient)
+        trial = np.clip(params + step, model.lower, model.upper)
+        with np.errstate(over='ignore', invalid='ignore'):
+            trial_mu = model(x, trial)
+            trial_objective = _objective(y, trial_mu, bin_weights, likelihood)
+        better = (trial_objective <= objective) & np.isfinite(trial_objective) & ~done
+        small = np.abs(objective - trial_objective) <= tolerance*(1 + np.abs(objective))
+        params[better] = trial[better]
+        mu[better] = trial_mu[better]
+        objective = np.where(better, trial_objective, objective)
+        damping = np.where(better, damping/10, damping*10)
+        done |= (better & small) | (damping > 1e12)
+        if done.all():
+            break
+
+    # covariance from the curvature at the minimum, without damping
+    weights = bin_weights/np.maximum(mu, TINY) if likelihood else bin_weights
+    jacobian = _jacobian(model, x, params, mu)
+    covariance = np.linalg.pinv(np.einsum('mbi,mb,mbj->mij', jacobian, weights, jacobian))
+    ndf = np.broadcast_to(np.asarray(mask), y.shape).sum(axis=1) - n_parameters
+    converged = done & (damping <= 1e12) & np.isfinite(objective)
+    return FitResult(model.parameters, params, covariance, objective, ndf, converged)
+
+
+def shifted_templates(counts, edges, shifts):
+    """
+    return templates of a distribution shifted along x by each of the shifts, as (len(shifts), n_bins) array.
+    The content is assumed to be uniform within each bin.
+    """
+    cdf = np.concatenate([[0.0], np.cumsum(counts)])
+    shifts = np.asarray(shifts, dtype=np.float64)
+    shifted_cdf = np.array([np.interp(edges - shift, edges, cdf) for shift in shifts])
+    return np.diff(shifted_cdf, axis=1)
+
+
+class TemplateFit(object):
+    """
+    Fit of the top quark mass by morphing between templates of the reconstructed mass
+    distribution simulated at different top quark masses.
+
+    Between two masses the expected shape is the bin by bin linear interpolation of the
+    neighbouring templates, normalized in the fit range. The mass is found by a
+    binned Poisson likelihood fit with free normalization, evaluated on a fine grid of
+    masses for all distributions at once and refined by a parabola around the minimum.
+    """
+    def __init__(self, masses, templates, mask=None, step=0.05):
+        order = np.argsort(masses)
+        self.masses = np.asarray(masses, dtype=np.float64)[order]
+        self.templates = np.asarray(templates, dtype=np.float64)[order]
+        if mask is None:
+            mask = np.ones(self.templates.shape[1], dtype=bool)
+        self.mask = np.asarray(mask, dtype=bool)
+        self.grid = np.arange(self.masses[0], self.masses[-1] + step/2, step)
+        self.step = step
+        # log of the normalized shapes on the mass grid
+        self.log_shapes = np.log(np.maximum(self.shapes(self.grid), TINY))
+
+    def shapes(self, masses):
+        """
+        return the morphed shapes for each of the masses, normalized to one in the fit range.
+        """
+        masses = np.clip(np.asarray(masses, dtype=np.float64), self.masses[0], self.masses[-1])
+        upper = np.clip(np.searchsorted(self.masses, masses, side='right'), 1, len(self.masses) - 1)
+        lower = upper - 1
+        t = (masses - self.masses[lower])/(self.masses[upper] - self.masses[lower])
+        shapes = (1 - t)[:, None]*self.templates[lower] + t[:, None]*self.templates[upper]
+        shapes = shapes*self.mask
+        return shapes/np.maximum(shapes.sum(axis=1), TINY)[:, None]
+
+    def expected(self, mass, norm):
+        """
+        return the expected bin contents for a mass and the number of events in the fit range.
+        """
+        return norm*self.shapes([mass])[0]
+
+    def fit(self, y):
+        """
+        Fit the mass of M distributions (M, n_bins) at once, returns a FitResult with parameters norm and mass.
+        """
+        y = np.atleast_2d(np.asarray(y, dtype=np.float64))*self.mask
+        norm = y.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_term = np.where(y > 0, y*np.log(y/np.maximum(norm[:, None], TINY)), 0.0).sum(axis=1)
+        # Poisson deviance of every distribution at every grid mass, the normalization is fitted
+        # analytically as the number of events in the fit range
+        deviance = 2*(log_term[:, None] - np.dot(y, self.log_shapes.T))
+        best = np.argmin(deviance, axis=1)
+        inside = (best > 0) & (best < len(self.grid) - 1)
+        index = np.clip(best, 1, len(self.grid) - 2)
+        rows = np.arange(len(y))
+        d_low, d_min, d_high = deviance[rows, index-1], deviance[rows, index], deviance[rows, index+1]
+        second = (d_low - 2*d_min + d_high)/self.step**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mass = np.where(inside, self.grid[index] - (d_high - d_low)/(2*self.step*second), self.grid[best])
+            mass_error = np.where(inside & (second > 0), np.sqrt(2/second), np.nan)
+            objective = np.where(inside, d_min - (d_high - d_low)**2/(8*second*self.step**2), deviance[rows, best])
+        covariance = np.zeros((len(y), 2, 2))
+        covariance[:, 0, 0] = norm
+        covariance[:, 1, 1] = mass_error**2
+        ndf = np.full(len(y), self.mask.sum() - 2)
+        return FitResult(('norm', 'mass'), np.column_stack([norm, mass]), covariance, objective, ndf,
+                         inside & (second > 0))
+
+
+def poisson_toys(expected, n_toys, seed=None):
+    """
+    return n_toys Poisson fluctuated pseudo-experiments of the expected bin contents as (n_toys, n_bins) array.
+    """
+    rng = np.random.RandomState(seed)
+    return rng.poisson(np.maximum(expected, 0.0), size=(n_toys, len(expected))).astype(np.float64)
+
+def bias_and_pull(result, parameter, truth):
+    """
+    return bias, its uncertainty, mean and width of the pull of a parameter fitted in pseudo-experiments,
+    using only the converged fits.
+    """
+    values = result.value(parameter)[result.converged]
+    errors = result.error(parameter)[result.converged]
+    pulls = (values - truth)/errors
+    n = max(len(values), 1)
+    return OrderedDict([('n_toys', len(values)),
+                        ('bias', float(np.mean(values - truth)) if len(values) else np.nan),
+                        ('bias_error', float(np.std(values)/np.sqrt(n)) if len(values) else np.nan),
+                        ('pull_mean', float(np.mean(pulls)) if len(values) else np.nan),
+                        ('pull_width', float(np.std(pulls)) if len(values) else np.nan),
+                        ])
+
+def ensemble_test(fit_function, expected, parameter, truth, n_toys=1000, seed=1):
+    """
+    Fit n_toys Poisson pseudo-experiments of the expected bin contents with fit_function,
+    which takes the (n_toys, n_bins) array and returns a FitResult.
+    returns the FitResult and the bias and pull of the parameter with respect to truth.
+    """
+    result = fit_function(poisson_toys(expected, n_toys, seed))
+    return result, bias_and_pull(result, parameter, truth)
@@ -1,17 +1,42 @@
 import ROOT
+import numpy as np
+import FitEngine
+from collections import OrderedDict
+from FitEngine import hist_arrays, range_mask, shifted_templates, TemplateFit
+from Datasets import default_datasets
 
 class Fitter(object):
 
-    def __init__(self, analyzers):
+    def __init__(self, analyzers, datasets=None):
+        # the samples of each dataset are combined and scaled by the registry datasets
+        if datasets is None:
+            datasets = default_datasets()
+        histograms = datasets.histograms(analyzers)
+        # the distributions are also kept as NumPy arrays for the fits of FitEngine
+        self.edges = None
+        self.data_counts = None
+        self.mc_counts = None
+        self.mc_errors2 = None
+        for x in histograms:
+            edges, counts, errors = hist_arrays(histograms[x]['top_mass']['top_mass'])
+            self.edges = edges
+            if(datasets.is_data(x)):
+                self.data_counts = counts
+            elif(self.mc_counts is None):
+                self.mc_counts = counts
+                self.mc_errors2 = errors**2
+            else:
+                self.mc_counts = self.mc_counts + counts
+                self.mc_errors2 = self.mc_errors2 + errors**2
         self.top_hist_MC = 0
         self.top_hist = 0
-        for x in analyzers:
-            if(x == 'Data'):
-                self.top_hist = analyzers[x].histograms['top_mass'].hists['top_mass']
+        for x in histograms:
+            if(datasets.is_data(x)):
+                self.top_hist = histograms[x]['top_mass']['top_mass']
             elif(self.top_hist_MC == 0):
-                self.top_hist_MC = analyzers[x].histograms['top_mass'].hists['top_mass']
+                self.top_hist_MC = histograms[x]['top_mass']['top_mass']
             else:
-                self.top_hist_MC.Add(analyzers[x].histograms['top_mass'].hists['top_mass'])
+                self.top_hist_MC.Add(histograms[x]['top_mass']['top_mass'])
         self.mean = 0.0
         self.unc = 0.0
 
@@ -50,3 +75,47 @@ class Fitter(object):
         c.SaveAs("plots/ReconstructedTopMass_MC.pdf")
         del c
         return self.top_hist_MC
+
+    def fit_arrays(self, fit_min, fit_max, model='gaus', likelihood=False, data=True):
+        """
+        Fit the top mass distribution of data (or of the MC sum with data=False) with FitEngine,
+        without drawing. model is 'gaus' or 'crystal_ball'. fit_min and fit_max can be arrays
+        of fit ranges, which are fitted all at once.
+        returns the FitEngine.FitResult.
+        """
+        counts = self.data_counts if data else self.mc_counts
+        if counts is None:
+            raise ValueError("Fitter.fit_arrays(): no %s distribution" % ("data" if data else "MC"))
+        mask = range_mask(self.edges, fit_min, fit_max)
+        errors = None if data else np.sqrt(self.mc_errors2)
+        y = np.broadcast_to(counts, mask.shape) if mask.ndim > 1 else counts
+        return FitEngine.fit(model, self.edges, y, mask, errors=errors, likelihood=likelihood)
+
+    def template_fit(self, fit_min, fit_max, mass_mc=172.5, shifts=np.arange(-10., 10.1, 2.5)):
+        """
+        return the TemplateFit of the top quark mass with templates from the MC sum shifted by the given shifts
+        around the top quark mass mass_mc of the simulation.
+        """
+        templates = shifted_templates(self.mc_counts, self.edges, shifts)
+        return TemplateFit(mass_mc + np.asarray(shifts), templates, range_mask(self.edges, fit_min, fit_max))
+
+    def toys(self, fit_min, fit_max, n_toys=1000, model='gaus', seed=1):
+        """
+        Estimate the bias and the pull of the fitted top quark mass with Poisson pseudo-experiments
+        of the MC expectation, for the likelihood fit of model and for the template fit.
+        The reference values are the fits of the MC expectation itself.
+        returns an OrderedDict with the bias and pull of each fit.
+        """
+        mask = range_mask(self.edges, fit_min, fit_max)
+        def function_fit(toys):
+            return FitEngine.fit(model, self.edges, toys, mask, likelihood=True)
+        template_fit = self.template_fit(fit_min, fit_max)
+        results = OrderedDict()
+        results[model] = FitEngine.ensemble_test(function_fit, self.mc_counts, 'mean',
+                                                 function_fit(self.mc_counts).value('mean')[0], n_toys, seed)[1]
+        results['template'] = FitEngine.ensemble_test(template_fit.fit, self.mc_counts, 'mass',
+                                                      template_fit.fit(self.mc_counts).value('mass')[0], n_toys, seed)[1]
+        for name, result in results.items():
+            print("%-12s %d toys: bias %.3f +- %.3f GeV, pull mean %.3f, pull width %.3f" % (
+                name, result['n_toys'], result['bias'], result['bias_error'], result['pull_mean'], result['pull_width']))
+        return results
@@ -1,14 +1,23 @@
 import math
+import numpy as np
 
 class FourMomentum(object):
     """
     Four-momentum of a particle in the form of (px, py, pz, E)
+
+    pt, eta and phi are computed on first use and cached,
+    change the components only with set_v4 to reset the cache.
     """
+    __slots__ = ('px', 'py', 'pz', 'E', '_pt', '_eta', '_phi')
+
     def __init__(self, px=0, py=0, pz=0, E=0):
         self.px = px
         self.py = py
         self.pz = pz
         self.E = E
+        self._pt = None
+        self._eta = None
+        self._phi = None
 
     def __add__(self, other):
         """
@@ -36,8 +45,13 @@ class FourMomentum(object):
 
         # check if is multiplied with number
         elif isinstance(other, (int, float, complex)) and not isinstance(other, bool):
-            # multiplication with a scalar
-            new_fourmomentum = FourMomentum(self.px*other, self.py*other, self.pz*other, self.E*other)
+            # multiplication with a scalar, keeps the type and attributes of e.g. Jet
+            cls = self.__class__
+            new_fourmomentum = cls.__new__(cls)
+            FourMomentum.__init__(new_fourmomentum, self.px*other, self.py*other, self.pz*other, self.E*other)
+            for name in attribute_slots(cls):
+                if hasattr(self, name):
+                    setattr(new_fourmomentum, name, getattr(self, name))
             return new_fourmomentum
 
     # multiplication is commutative
@@ -47,25 +61,28 @@ class FourMomentum(object):
         """
         return transverse momentum
         """
-        return math.sqrt(self.px**2.0 + self.py**2.0)
+        pt = self._pt
+        if pt is None:
+            pt = self._pt = math.sqrt(self.px*self.px + self.py*self.py)
+        return pt
 
     def eta(self):
         """
         return pseudorapidity
         """
-        return math.atanh(self.pz / math.sqrt(self.px**2 + self.py**2 + self.pz**2))
+        eta = self._eta
+        if eta is None:
+            eta = self._eta = math.atanh(self.pz / math.sqrt(self.px*self.px + self.py*self.py + self.pz*self.pz))
+        return eta
 
     def phi(self):
         """
         return azimuthal angle phi
         """
-        return math.atan2(self.py, self.px)
-
-    def E(self):
-        """
-        return energy
-        """
-        return self.E
+        phi = self._phi
+        if phi is None:
+            phi = self._phi = math.atan2(self.py, self.px)
+        return phi
 
     def m(self):
         """
@@ -85,8 +102,219 @@ class FourMomentum(object):
         4 arguments: px, py, pz, E
         """
         if len(args) == 4:
-            self.__init__(args[0], args[1], args[2], args[3])
+            FourMomentum.__init__(self, args[0], args[1], args[2], args[3])
         elif len(args) == 1:
-            self.__init__(args[0].px, args[0].py, args[0].pz, args[0].E)
+            FourMomentum.__init__(self, args[0].px, args[0].py, args[0].pz, args[0].E)
         else:
             raise TypeError("set_v4() takes 1 or 4 arguments (%d given)" % len(args))
+
+
+# attributes of the classes derived from FourMomentum, by class
+_attribute_slots = {}
+
+def attribute_slots(cls):
+    """
+    return the names of the slots a class derived from FourMomentum adds, e.g. charge and iso of Muon.
+    """
+    if cls not in _attribute_slots:
+        names = []
+        for klass in cls.__mro__:
+            if klass is FourMomentum:
+                break
+            slots = klass.__dict__.get('__slots__', ())
+            names.extend([slots] if isinstance(slots, str) else slots)
+        _attribute_slots[cls] = tuple(names)
+    return _attribute_slots[cls]
+
+
+def counts_to_offsets(counts):
+    """
+    return offsets into a flat array from the number of objects per event.
+    """
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def math_elementwise(func, *args):
+    """
+    apply a function of the math module element-wise.
+
+    The SIMD implementations of the NumPy transcendental functions can differ in the
+    last bit from the C library used by math, this gives array results identical to
+    the scalar FourMomentum methods at the cost of one Python call per element.
+    """
+    n = len(args[0])
+    return np.fromiter(map(func, *[a.tolist() for a in args]), dtype=np.float64, count=n)
+
+
+class FourMomentumArray(object):
+    """
+    Array of four-momenta stored as contiguous NumPy arrays of px, py, pz and E.
+
+    Provides the same methods as FourMomentum, evaluated for all elements at once.
+    The array can be jagged by event: the objects of event i are stored in
+    [offsets[i], offsets[i+1]).
+    """
+    # scalar class of the elements
+    object_class = FourMomentum
+    # additional per-object columns of derived classes
+    columns = ()
+
+    def __init__(self, px=(), py=(), pz=(), E=(), offsets=None):
+        self.px = np.ascontiguousarray(px, dtype=np.float64)
+        self.py = np.ascontiguousarray(py, dtype=np.float64)
+        self.pz = np.ascontiguousarray(pz, dtype=np.float64)
+        self.E = np.ascontiguousarray(E, dtype=np.float64)
+        self.offsets = offsets
+
+    @classmethod
+    def from_objects(cls, objects, offsets=None):
+        """
+        create an array from a list of scalar four-momenta.
+        """
+        array = cls([o.px for o in objects], [o.py for o in objects],
+                    [o.pz for o in objects], [o.E for o in objects], offsets=offsets)
+        for name in cls.columns:
+            setattr(array, name, np.array([getattr(o, name) for o in objects]))
+        return array
+
+    def to_objects(self):
+        """
+        return a list of scalar four-momenta.
+        """
+        objects = []
+        columns = [(name, getattr(self, name).tolist()) for name in self.columns]
+        for i, (px, py, pz, E) in enumerate(zip(self.px.tolist(), self.py.tolist(),
+                                                self.pz.tolist(), self.E.tolist())):
+            o = self.object_class.__new__(self.object_class)
+            FourMomentum.__init__(o, px, py, pz, E)
+            for name, values in columns:
+                setattr(o, name, values[i])
+            objects.append(o)
+        return objects
+
+    def _new(self, px, py, pz, E, index=None, offsets=None):
+        """
+        return a new array of the same type, per-object columns are taken at index.
+        """
+        array = self.__class__.__new__(self.__class__)
+        FourMomentumArray.__init__(array, px, py, pz, E, offsets)
+        for name in self.columns:
+            value = getattr(self, name)
+            setattr(array, name, value if index is None else value[index])
+        return array
+
+    def __len__(self):
+        return len(self.px)
+
+    def __getitem__(self, index):
+        """
+        return element i as scalar FourMomentum or a flat sub-array for slices, masks and index arrays.
+        """
+        if isinstance(index, (int, np.integer)):
+            return self[index:index+1].to_objects()[0]
+        return self._new(self.px[index], self.py[index], self.pz[index], self.E[index], index)
+
+    def __add__(self, other):
+        """
+        element-wise sum of two four-vector arrays.
+        """
+        return self._new(self.px + other.px, self.py + other.py, self.pz + other.pz, self.E + other.E,
+                         offsets=self.offsets)
+
+    def __mul__(self, other):
+        """
+        implementation of vector multiplication.
+
+        returns array of scalar products if multiplied with other FourMomentumArray or FourMomentum
+        returns FourMomentumArray if multiplied with a number or an array of numbers
+        """
+        if isinstance(other, (FourMomentumArray, FourMomentum)):
+            return self.E*other.E - self.px*other.px - self.py*other.py - self.pz*other.pz
+        elif isinstance(other, (int, float, np.number, np.ndarray)) and not isinstance(other, bool):
+            return self._new(self.px*other, self.py*other, self.pz*other, self.E*other,
+                             offsets=self.offsets)
+        return NotImplemented
+
+    # multiplication is commutative
+    __rmul__ = __mul__
+
+    def pt(self):
+        """
+        return transverse momenta
+        """
+        return np.sqrt(self.px*self.px + self.py*self.py)
+
+    def eta(self, exact=False):
+        """
+        return pseudorapidities, with exact=True bit-identical to FourMomentum.eta (slow).
+        """
+        x = self.pz / np.sqrt(self.px*self.px + self.py*self.py + self.pz*self.pz)
+        if exact:
+            return math_elementwise(math.atanh, x)
+        return np.arctanh(x)
+
+    def phi(self, exact=False):
+        """
+        return azimuthal angles phi, with exact=True bit-identical to FourMomentum.phi (slow).
+        """
+        if exact:
+            return math_elementwise(math.atan2, self.py, self.px)
+        return np.arctan2(self.py, self.px)
+
+    def m(self):
+        """
+        return invariant masses.
+        """
+        m2 = self*self
+        return np.where(m2 >= 0, np.sqrt(np.abs(m2)), -np.sqrt(np.abs(m2)))
+
+    # jagged arrays
+
+    def counts(self):
+        """
+        return number of objects per event.
+        """
+        return np.diff(self.offsets)
+
+    def event_index(self):
+        """
+        return the event index of each object.
+        """
+        counts = self.counts()
+        return np.repeat(np.arange(len(counts)), counts)
+
+    def select(self, mask):
+        """
+        return a jagged array keeping only the objects where mask is True.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        counts = np.bincount(self.event_index()[mask], minlength=len(self.offsets) - 1)
+        array = self[mask]
+        array.offsets = counts_to_offsets(counts)
+        return array
+
+    def select_events(self, mask):
+        """
+        return a jagged array keeping only the events where mask is True.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        counts = self.counts()
+        array = self[np.repeat(mask, counts)]
+        array.offsets = counts_to_offsets(counts[mask])
+        return array
+
+    def nth(self, n):
+        """
+        return the n-th object (counting from 0) of each event as flat array
+        and the mask of events having at least n+1 objects.
+        """
+        has_object = self.counts() > n
+        return self[self.offsets[:-1][has_object] + n], has_object
+
+    def event(self, i):
+        """
+        return the objects of event i as list of scalar four-momenta.
+        """
+        return self[self.offsets[i]:self.offsets[i+1]].to_objects()
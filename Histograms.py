@@ -1,4 +1,5 @@
 import ROOT
+import numpy as np
 from collections import OrderedDict
 
 class Histograms(object):
@@ -11,6 +12,8 @@ class Histograms(object):
             self.hists = OrderedDict()
         self.is_init = False
         self.initialize_histograms()
+        # HistogramBuffers of the histograms filled with fill_array
+        self.buffers = OrderedDict()
 
     def initialize_histograms(self):
         """
@@ -30,5 +33,113 @@ class Histograms(object):
         Has to be implemented by actual implemenation of Histograms.
         """
         raise NotImplementedError()
-    
-    
+
+    def fill_batch(self, batch):
+        """
+        Fill histograms for all events of an EventBatch.
+
+        By default fill is called for each event of the batch.
+        """
+        for event in batch.events():
+            self.fill(event)
+
+    def fill_array(self, key, values, weights):
+        """
+        Fill the histogram key with arrays of values and weights.
+
+        The values are accumulated in a HistogramBuffer and added to the
+        histogram when flush is called.
+        """
+        if key not in self.buffers:
+            self.buffers[key] = HistogramBuffer(self.hists[key])
+        self.buffers[key].fill(values, weights)
+
+    def flush(self):
+        """
+        Add the content of all HistogramBuffers to the histograms.
+        """
+        for buffer in self.buffers.values():
+            buffer.flush()
+
+
+class HistogramBuffer(object):
+    """
+    Accumulates weighted values for a one-dimensional ROOT histogram with NumPy.
+
+    The binning is taken from the histogram. Sums of weights and of squared weights
+    per bin (including under- and overflow), the number of entries and the
+    statistics used by ROOT for mean and RMS are accumulated until flush adds
+    them to the histogram.
+    """
+    def __init__(self, hist):
+        self.hist = hist
+        axis = hist.GetXaxis()
+        self.n_bins = hist.GetNbinsX()
+        self.x_min = axis.GetXmin()
+        self.x_max = axis.GetXmax()
+        self.edges = None
+        if axis.GetXbins().GetSize() > 0:
+            self.edges = np.array([axis.GetBinLowEdge(i) for i in range(1, self.n_bins + 2)])
+        self.reset()
+
+    def reset(self):
+        """
+        clear the accumulated content.
+        """
+        self.sumw = np.zeros(self.n_bins + 2)
+        self.sumw2 = np.zeros(self.n_bins + 2)
+        self.entries = 0
+        # sum of w, w^2, w*x and w*x^2 of values inside the histogram range
+        self.stats = np.zeros(4)
+
+    def find_bins(self, values):
+        """
+        return the bin number of each value, with the same convention as TAxis::FindFixBin.
+        """
+        with np.errstate(invalid='ignore'):
+            underflow = values < self.x_min
+            overflow = ~(values < self.x_max) & ~underflow
+            if self.edges is None:
+                x = np.where(underflow | overflow, self.x_min, values)
+                bins = 1 + (self.n_bins*(x - self.x_min)/(self.x_max - self.x_min)).astype(np.int64)
+                bins = np.clip(bins, 1, self.n_bins)
+            else:
+                bins = np.searchsorted(self.edges, values, side='right')
+        bins[underflow] = 0
+        bins[overflow] = self.n_bins + 1
+        return bins
+
+    def fill(self, values, weights):
+        """
+        add arrays of values and weights.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        bins = self.find_bins(values)
+        self.sumw += np.bincount(bins, weights, minlength=self.n_bins + 2)
+        self.sumw2 += np.bincount(bins, weights*weights, minlength=self.n_bins + 2)
+        self.entries += len(values)
+        inside = (bins > 0) & (bins <= self.n_bins)
+        x = values[inside]
+        w = weights[inside]
+        self.stats += [w.sum(), (w*w).sum(), (w*x).sum(), (w*x*x).sum()]
+
+    def flush(self):
+        """
+        add the accumulated content to the histogram and reset the buffer.
+        """
+        if self.entries == 0:
+            return
+        hist = self.hist
+        if hist.GetSumw2N() == 0:
+            hist.Sumw2()
+        entries = hist.GetEntries()
+        stats = np.zeros(4)
+        hist.GetStats(stats)
+        sumw2 = hist.GetSumw2()
+        for i in range(self.n_bins + 2):
+            hist.SetBinContent(i, hist.GetBinContent(i) + self.sumw[i])
+            sumw2[i] += self.sumw2[i]
+        hist.PutStats(stats + self.stats)
+        hist.SetEntries(entries + self.entries)
+        self.reset()
@@ -0,0 +1,158 @@
+import math
+import numpy as np
+from FourMomentum import FourMomentum
+
+class NeutrinoSolver(object):
+    """
+    Reconstruction of the neutrino from the missing transverse momentum and a muon.
+
+    The longitudinal momentum pz of the neutrino is obtained by requiring the invariant
+    mass of muon and neutrino to be the W boson mass, which gives a quadratic equation
+    with two solutions. If the discriminant is negative there is no real solution and
+    the strategy decides:
+    'real':    use the real part of the complex solutions, keeping the MET.
+    'rescale': scale the MET down until the discriminant vanishes and use the single solution.
+
+    The solutions of an Event or EventBatch are cached on it, so top reconstruction and
+    histograms using the same solver settings share them.
+    """
+    strategies = ('real', 'rescale')
+
+    def __init__(self, mass_w=80.399, strategy='real'):
+        if strategy not in self.strategies:
+            raise ValueError("NeutrinoSolver(): unknown strategy %s" % strategy)
+        self.mass_w = mass_w
+        self.strategy = strategy
+
+    def key(self):
+        """
+        return the key of the cached solutions of this solver.
+        """
+        return (self.mass_w, self.strategy)
+
+    def _solve(self, met, muon):
+        """
+        return the MET scale factor and the list of neutrino pz solutions.
+        """
+        pt2 = muon.px*muon.px + muon.py*muon.py
+        if pt2 == 0:
+            return 1.0, []
+        half_mw2 = self.mass_w*self.mass_w/2
+        dot = met.px*muon.px + met.py*muon.py
+        met2 = met.px*met.px + met.py*met.py
+        mu = half_mw2 + dot
+        A = mu*muon.pz/pt2
+        discriminant = A*A - (muon.E*muon.E*met2 - mu*mu)/pt2
+        if discriminant >= 0:
+            root = math.sqrt(discriminant)
+            return 1.0, [A + root, A - root]
+        if self.strategy == 'real':
+            return 1.0, [A]
+        # MET scale for which the discriminant is zero
+        p = math.sqrt(pt2 + muon.pz*muon.pz)
+        scale = half_mw2*p/(math.sqrt(met2*pt2)*muon.E - dot*p)
+        return scale, [(half_mw2 + scale*dot)*muon.pz/pt2]
+
+    def solve(self, met, muon):
+        """
+        return the list of neutrino pz solutions for a MET and a muon.
+        """
+        return self._solve(met, muon)[1]
+
+    def neutrinos(self, met, muon):
+        """
+        return the list of neutrino four-momenta for a MET and a muon.
+        """
+        scale, solutions = self._solve(met, muon)
+        px = scale*met.px
+        py = scale*met.py
+        return [FourMomentum(px, py, pz, math.sqrt(px*px + py*py + pz*pz)) for pz in solutions]
+
+    def event_neutrinos(self, event):
+        """
+        return the neutrino four-momenta for the MET and the leading muon of an event,
+        an empty list for events without muon. The result is cached on the event.
+        """
+        key = self.key()
+        if key not in event.neutrinos:
+            event.neutrinos[key] = self.neutrinos(event.met, event.muons[0]) if event.muons else []
+        return event.neutrinos[key]
+
+    def solve_batch(self, met, muon):
+        """
+        solve for arrays of N MET and muon four-momenta.
+
+        returns an (N, 2) array of neutrino pz solutions, a boolean (N, 2) array marking
+        which solutions exist and the MET scale factor of each event.
+        Gives the same values as solve for each event.
+        """
+        pt2 = muon.px*muon.px + muon.py*muon.py
+        half_mw2 = self.mass_w*self.mass_w/2
+        dot = met.px*muon.px + met.py*muon.py
+        met2 = met.px*met.px + met.py*met.py
+        mu = half_mw2 + dot
+        with np.errstate(divide='ignore', invalid='ignore'):
+            A = mu*muon.pz/pt2
+            discriminant = A*A - (muon.E*muon.E*met2 - mu*mu)/pt2
+            real = discriminant >= 0
+            root = np.sqrt(np.where(real, discriminant, 0.0))
+            scale = np.ones(len(pt2))
+            single = A
+            if self.strategy == 'rescale':
+                p = np.sqrt(pt2 + muon.pz*muon.pz)
+                scale = np.where(real, 1.0, half_mw2*p/(np.sqrt(met2*pt2)*muon.E - dot*p))
+                single = (half_mw2 + scale*dot)*muon.pz/pt2
+        solutions = np.empty((len(pt2), 2))
+        solutions[:, 0] = np.where(real, A + root, single)
+        solutions[:, 1] = A - root
+        valid = np.empty((len(pt2), 2), dtype=bool)
+        valid[:, 0] = (pt2 != 0) & np.isfinite(solutions[:, 0]) & np.isfinite(scale)
+        valid[:, 1] = valid[:, 0] & real
+        return solutions, valid, scale
+
+    def neutrinos_batch(self, met, muon):
+        """
+        return the neutrino px, py, pz and E as (N, 2) arrays for arrays of N MET and muon
+        four-momenta and the boolean (N, 2) array marking which solutions exist.
+        """
+        pz, valid, scale = self.solve_batch(met, muon)
+        px = np.repeat((scale*met.px)[:, None], 2, axis=1)
+        py = np.repeat((scale*met.py)[:, None], 2, axis=1)
+        with np.errstate(invalid='ignore'):
+            E = np.sqrt(px*px + py*py + pz*pz)
+        return px, py, pz, E, valid
+
+    def batch_neutrinos(self, batch):
+        """
+        return the neutrinos of the MET and the leading muon of each event of an EventBatch,
+        see neutrinos_batch. Events without muon have no valid solution.
+        The result is cached on the batch.
+        """
+        key = self.key()
+        if key not in batch.neutrinos:
+            batch.neutrinos[key] = self.leading_muon_neutrinos(batch.met, batch.muons)
+        return batch.neutrinos[key]
+
+    def leading_muon_neutrinos(self, met, muons):
+        """
+        neutrinos_batch for the leading muon of each event of the jagged muons.
+        """
+        muon, has_muon = muons.nth(0)
+        index = np.nonzero(has_muon)[0]
+        arrays = [np.zeros((len(met), 2)) for i in range(4)]
+        valid = np.zeros((len(met), 2), dtype=bool)
+        results = self.neutrinos_batch(met[index], muon)
+        for array, values in zip(arrays + [valid], results):
+            array[index] = values
+        return tuple(arrays) + (valid,)
+
+
+def transverse_mass(met, muon):
+    """
+    return the transverse mass of the W boson from MET and muon, for single objects or arrays.
+    """
+    pt_product = met.pt()*muon.pt()
+    dot = met.px*muon.px + met.py*muon.py
+    if isinstance(pt_product, np.ndarray):
+        return np.sqrt(np.maximum(2*(pt_product - dot), 0.0))
+    return math.sqrt(max(2*(pt_product - dot), 0.0))
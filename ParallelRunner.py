@@ -0,0 +1,77 @@
+import multiprocessing
+import ROOT
+from collections import OrderedDict
+
+def _run_task(task):
+    """
+    Run an analyzer on one entry range of a dataset in a worker process.
+    """
+    analyzer_class, dataset_name, file_name, event_options, first_entry, n_entries = task
+    analyzer = analyzer_class(dataset_name, file_name, event_options)
+    analyzer.run(first_entry, n_entries, write=False)
+    return analyzer.results()
+
+
+class ParallelRunner(object):
+    """
+    Run an analyzer on several datasets using a pool of worker processes.
+
+    Each dataset, or each chunk of chunk_size entries of a dataset, is processed
+    in its own worker. The histograms and counters of the workers are merged in
+    the order of the datasets and chunks, so the result does not depend on the
+    number of workers. With chunk_size = None every dataset is processed by a
+    single worker and the result is bit-identical to a serial run.
+    """
+    def __init__(self, analyzer_class, n_workers=None, chunk_size=None):
+        self.analyzer_class = analyzer_class
+        self.n_workers = n_workers if n_workers else multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+
+    def tasks(self, datasets, event_options):
+        """
+        return the list of tasks for the given datasets.
+        """
+        tasks = []
+        for name, file_name in datasets.items():
+            if self.chunk_size is None:
+                tasks.append((self.analyzer_class, name, file_name, event_options, 0, -1))
+                continue
+            f = ROOT.TFile.Open('files/'+file_name)
+            n_entries = f.events.GetEntries()
+            f.Close()
+            for first_entry in range(0, max(n_entries, 1), self.chunk_size):
+                tasks.append((self.analyzer_class, name, file_name, event_options, first_entry, self.chunk_size))
+        return tasks
+
+    def run(self, datasets, event_options={}, write=True):
+        """
+        Analyze all datasets.
+
+        Returns an OrderedDict of analyzers holding the merged results, which
+        have written their output files unless write is False.
+        """
+        analyzers = OrderedDict()
+        for name, file_name in datasets.items():
+            analyzers[name] = self.analyzer_class(name, file_name, event_options)
+
+        if self.n_workers == 1:
+            for analyzer in analyzers.values():
+                analyzer.run(write=write)
+            return analyzers
+
+        tasks = self.tasks(datasets, event_options)
+        pool = multiprocessing.Pool(min(self.n_workers, len(tasks)))
+        try:
+            merged = set()
+            for task, results in zip(tasks, pool.imap(_run_task, tasks)):
+                name = task[1]
+                analyzers[name].merge(results, first=(name not in merged))
+                merged.add(name)
+        finally:
+            pool.close()
+            pool.join()
+
+        if write:
+            for analyzer in analyzers.values():
+                analyzer.write_output()
+        return analyzers
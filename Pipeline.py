@@ -0,0 +1,485 @@
+import copy
+import ROOT
+from ColumnChunk import ColumnChunk, read_chunks, prune_branches
+from CutFlow import Cut
+from Event import Event
+from EventBatch import EventBatch
+from EventBuilder import EventBuilder
+
+class EventSource(object):
+    """
+    Base class of the sources of a Pipeline.
+
+    In "event" mode single entries are yielded, in "batch" mode ColumnChunks.
+    Stages add the branches they need before the source is opened. timer wraps the
+    iterator over the entries or chunks read, e.g. to measure the time spent reading.
+    """
+    def __init__(self, branches=(), mode="event"):
+        if mode not in ("event", "batch"):
+            raise ValueError("%s(): unknown mode %s" % (self.__class__.__name__, mode))
+        self.branches = list(branches)
+        self.mode = mode
+        self.timer = None
+        # tree positioned at the current entry, only for sources reading a tree
+        self.tree = None
+        # number of events read
+        self.n_events = 0
+
+    def add_branches(self, *branches):
+        """
+        Read additional branches of the events tree.
+        """
+        for branch in branches:
+            if branch not in self.branches:
+                self.branches.append(branch)
+
+    def open(self):
+        self.n_events = 0
+
+    def close(self):
+        pass
+
+    def timed(self, items):
+        """
+        return items, wrapped by timer if given.
+        """
+        return self.timer(items) if self.timer is not None else items
+
+
+class Source(EventSource):
+    """
+    Source of a Pipeline reading the events tree of a file.
+
+    Reads the entries [first_entry, first_entry+n_entries), n_entries < 0 reads until
+    the end of the tree. In "event" mode the tree is yielded positioned at each entry,
+    in "batch" mode ColumnChunks of chunk_size entries are yielded. Only the given
+    branches are read, stages add the branches they need when the pipeline is opened.
+    """
+    def __init__(self, file_name, branches=(), first_entry=0, n_entries=-1, mode="event",
+                 chunk_size=100000, cache_size=30*1024*1024):
+        super(Source, self).__init__(branches, mode)
+        self.file_name = file_name
+        self.first_entry = first_entry
+        self.n_entries = n_entries
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self.file = None
+
+    def open(self):
+        """
+        Open the file and enable the branches to read.
+        """
+        super(Source, self).open()
+        self.file = ROOT.TFile.Open('files/'+self.file_name)
+        self.tree = self.file.events
+        prune_branches(self.tree, self.branches, self.cache_size)
+
+    def close(self):
+        """
+        Close the file.
+        """
+        if self.file is not None:
+            self.file.Close()
+        self.file = None
+        self.tree = None
+
+    def __iter__(self):
+        last_entry = self.tree.GetEntries()
+        if self.n_entries >= 0:
+            last_entry = min(last_entry, self.first_entry + self.n_entries)
+        if self.mode == "batch":
+            for chunk in self.timed(read_chunks(self.tree, self.branches, self.first_entry, last_entry,
+                                                self.chunk_size)):
+                self.n_events += len(chunk)
+                yield chunk
+            return
+        for tree in self.timed(self.entries(self.first_entry, last_entry)):
+            self.n_events += 1
+            yield tree
+
+    def entries(self, first_entry, last_entry):
+        """
+        Generator positioning the tree at each entry.
+        """
+        tree = self.tree
+        for i in range(first_entry, last_entry):
+            tree.GetEntry(i)
+            yield tree
+
+
+class ChunkSource(EventSource):
+    """
+    Source of a Pipeline reading the events from an iterable of ColumnChunks,
+    e.g. a Prefetcher. In "event" mode the ColumnRow of each event is yielded.
+    """
+    def __init__(self, chunks, mode="event"):
+        super(ChunkSource, self).__init__((), mode)
+        self.chunks = chunks
+
+    def __iter__(self):
+        for chunk in self.timed(self.chunks):
+            if self.mode == "batch":
+                self.n_events += len(chunk)
+                yield chunk
+                continue
+            for i in range(len(chunk)):
+                self.n_events += 1
+                yield chunk.row(i)
+
+
+class ColumnSource(ChunkSource):
+    """
+    Source of a Pipeline reading the events [first_entry, last_entry) of a ColumnChunk
+    holding all events, e.g. a skim or an EventStore, in chunks of chunk_size events.
+    """
+    def __init__(self, columns, first_entry=0, last_entry=None, mode="event", chunk_size=100000):
+        self.columns = columns
+        self.first_entry = first_entry
+        self.last_entry = len(columns) if last_entry is None else last_entry
+        super(ColumnSource, self).__init__(columns.chunks(self.first_entry, self.last_entry, chunk_size), mode)
+
+
+class Stage(object):
+    """
+    A stage of a Pipeline, processing single Events or EventBatches.
+
+    process returns the item passed on to the next stage, or None to drop it.
+    Calling a stage with an iterable returns a generator over the processed items,
+    so stages can also be chained directly, e.g. Fill(hists)(Filter(selection)(events)).
+    open and close are called by the Pipeline before the first and after the last item.
+    """
+    def open(self, source):
+        """
+        Prepare the stage for reading from source, e.g. add the branches it needs.
+        """
+        pass
+
+    def process(self, item):
+        return item
+
+    def close(self):
+        """
+        Finish the stage after the last item.
+        """
+        pass
+
+    def __call__(self, items):
+        process = self.process
+        for item in items:
+            item = process(item)
+            if item is not None:
+                yield item
+
+
+class Build(Stage):
+    """
+    Build an Event from each tree entry or ColumnRow and an EventBatch from each ColumnChunk.
+    """
+    def __init__(self, builder=None):
+        self.builder = builder if builder is not None else EventBuilder({})
+
+    def open(self, source):
+        source.add_branches(*self.builder.branches)
+
+    def process(self, item):
+        if isinstance(item, ColumnChunk):
+            return self.builder.build_batch(item)
+        if isinstance(item, (Event, EventBatch)):
+            raise TypeError("Build: the events are already built, add analyzers as branches of a pipeline without Build stage")
+        return self.builder.build_event(item)
+
+
+class Filter(Stage):
+    """
+    Pass on only events passing a selection, see Cut for the possible selections.
+    Batches are reduced to the passing events, empty batches are dropped.
+    """
+    def __init__(self, selection, select_batch=None):
+        self.cut = Cut("filter", selection, select_batch)
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            item = item.select(self.cut.mask(item))
+            return item if len(item) > 0 else None
+        return item if self.cut.passes(item) else None
+
+
+class ApplyCutFlow(Stage):
+    """
+    Apply the cuts of a CutFlow, recording the yields after each cut.
+
+    fill(item, name) is called for the histogram collections of each passed cut,
+    e.g. the fill_histograms method of an analyzer.
+    """
+    def __init__(self, cutflow, fill=None):
+        self.cutflow = cutflow
+        self.fill = fill
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            item = self.cutflow.process_batch(item, self.fill)
+            return item if len(item) > 0 else None
+        return item if self.cutflow.process(item, self.fill) else None
+
+
+class Map(Stage):
+    """
+    Replace each item by function(item), function_batch is used for EventBatches if given.
+    Returning None drops the item.
+    """
+    def __init__(self, function, function_batch=None):
+        self.function = function
+        self.function_batch = function_batch if function_batch is not None else function
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            return self.function_batch(item)
+        return self.function(item)
+
+
+class TopMass(Stage):
+    """
+    Reconstruct the top quark mass with a TopReco and store it in top_mass,
+    using the neutrinos of solver if given.
+    """
+    def __init__(self, reco, solver=None):
+        self.reco = reco
+        self.solver = solver
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            neutrinos = self.solver.batch_neutrinos(item) if self.solver is not None else None
+            item.top_mass = self.reco.calculateTopMassBatch(item.jets, item.met, item.muons, neutrinos=neutrinos)
+        elif item.muons:
+            neutrinos = self.solver.event_neutrinos(item) if self.solver is not None else None
+            item.top_mass = self.reco.calculateTopMass(item.jets, item.met, item.muons[0], neutrinos)
+        return item
+
+
+class Fill(Stage):
+    """
+    Fill a histogram collection and pass the items on.
+    """
+    def __init__(self, histograms):
+        self.histograms = histograms
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            self.histograms.fill_batch(item)
+        else:
+            self.histograms.fill(item)
+        return item
+
+    def close(self):
+        self.histograms.flush()
+
+
+class Counter(Stage):
+    """
+    Count the events and their weights and pass the items on.
+    """
+    def __init__(self):
+        self.n_events = 0
+        self.sum_weights = 0.0
+        self.sum_weights2 = 0.0
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            self.n_events += len(item)
+            self.sum_weights += float(item.weight.sum())
+            self.sum_weights2 += float((item.weight*item.weight).sum())
+        else:
+            self.n_events += 1
+            self.sum_weights += item.weight
+            self.sum_weights2 += item.weight*item.weight
+        return item
+
+
+class SkimWriter(Stage):
+    """
+    Write the tree entries of the events reaching this stage to a new ROOT file
+    and pass the items on. Only the branches read by the source are written.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.tree = None
+        self.source = None
+
+    def open(self, source):
+        if not isinstance(source, Source):
+            raise TypeError("SkimWriter: the source of the pipeline has to read a tree")
+        self.source = source
+
+    def process(self, item):
+        source_tree = self.source.tree
+        if self.tree is None:
+            # the branches are only known once all stages are opened
+            self.file = ROOT.TFile.Open(self.path, 'RECREATE')
+            self.tree = source_tree.CloneTree(0)
+        if isinstance(item, EventBatch):
+            for entry in item.entries.tolist():
+                source_tree.GetEntry(entry)
+                self.tree.Fill()
+        else:
+            # in event mode the tree is positioned at the entry of the event
+            self.tree.Fill()
+        return item
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.cd()
+        self.tree.Write()
+        self.file.Close()
+        self.file = None
+        self.tree = None
+
+
+class Progress(Stage):
+    """
+    Count the events read and print message(n_events) every every events in "event" mode
+    and after each chunk in "batch" mode.
+    """
+    def __init__(self, message, every=10000):
+        self.message = message
+        self.every = every
+        self.n_events = 0
+
+    def process(self, item):
+        if isinstance(item, (ColumnChunk, EventBatch)):
+            self.n_events += len(item)
+            print(self.message(self.n_events))
+        else:
+            self.n_events += 1
+            if self.n_events % self.every == 0:
+                print(self.message(self.n_events))
+        return item
+
+
+class Process(Stage):
+    """
+    Pass each Event to the process and each EventBatch to the process_batch method of an analyzer.
+    """
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+
+    def open(self, source):
+        source.add_branches(*self.analyzer.branches())
+
+    def process(self, item):
+        if isinstance(item, EventBatch):
+            self.analyzer.process_batch(item)
+        else:
+            self.analyzer.process(item)
+        return item
+
+
+def is_analyzer(stage):
+    """
+    return True if stage is an Analyzer.
+    """
+    return hasattr(stage, 'variation_analyzers') and hasattr(stage, 'event_builder')
+
+def as_stages(stage):
+    """
+    return the list of stages for a Stage or a function, functions become Map stages.
+    """
+    if is_analyzer(stage):
+        raise TypeError("Pipeline: analyzers are added as branches, e.g. Pipeline(source).branch(analyzer)")
+    if isinstance(stage, Stage):
+        return [stage]
+    if callable(stage):
+        return [Map(stage)]
+    raise TypeError("Pipeline: %r is not a stage" % (stage,))
+
+
+class Pipeline(object):
+    """
+    A streaming chain of stages reading the events of a Source.
+
+    Each tree entry or chunk is passed through the stages one after the other, nothing
+    is buffered. The stages given to the Pipeline are applied once, their output is then
+    passed to each branch, so several analyses share one read of the input:
+
+        source = Source('ttbar.root', mode='batch')
+        pipeline = Pipeline(source, Build(), Filter(('trigger.IsoMu24', '==', True)))
+        pipeline.branch(Fill(DefaultHistograms('ttbar_trigger')))
+        pipeline.branch(Filter(('n_b_jets', '>=', 2)), TopMass(PrunedTopReco(10.0, 2, 4)), Fill(TopMassHist('ttbar')))
+        pipeline.run()
+
+    Each branch receives its own shallow copy of built Events and EventBatches, so stages
+    setting attributes, e.g. TopMass, do not change the items seen by other branches.
+
+    Analyzers are added as branches of their own, Pipeline(source).branch(TTbarAnalyzer(...)),
+    which build the events from the source with their EventBuilder and pass them to
+    process or process_batch, with one branch for each variation. Analyzer.run is such a
+    pipeline; the output of analyzers added to other pipelines is not written, call
+    write_output afterwards.
+    """
+    def __init__(self, source, *stages):
+        self.source = source
+        self.stages = []
+        for stage in stages:
+            self.stages += as_stages(stage)
+        self.branches = []
+
+    def branch(self, *stages):
+        """
+        Add a branch of stages receiving every item passing the stages of the pipeline.
+        An analyzer is added as one branch per variation and has to be the only stage of the branch.
+        """
+        if any(is_analyzer(stage) for stage in stages):
+            if len(stages) != 1:
+                raise TypeError("Pipeline.branch(): an analyzer has to be the only stage of its branch")
+            for analyzer in stages[0].variation_analyzers().values():
+                self.branches.append([Build(analyzer.event_builder), Process(analyzer)])
+            return self
+        branch = []
+        for stage in stages:
+            branch += as_stages(stage)
+        self.branches.append(branch)
+        return self
+
+    def all_stages(self):
+        """
+        return the stages of the pipeline followed by the stages of all branches.
+        """
+        return self.stages + [stage for branch in self.branches for stage in branch]
+
+    def stream(self):
+        """
+        Generator over the items passing the stages of the pipeline, the branches are not applied.
+        The source needs to be opened first, run does this for the full pipeline.
+        """
+        items = iter(self.source)
+        for stage in self.stages:
+            items = stage(items)
+        return items
+
+    def run(self):
+        """
+        Read all items of the source and pass them through the pipeline and its branches.
+        returns the number of events read.
+        """
+        stages = self.all_stages()
+        try:
+            for stage in stages:
+                stage.open(self.source)
+            self.source.open()
+            branches = [[stage.process for stage in branch] for branch in self.branches]
+            shared = len(branches) > 1
+            for item in self.stream():
+                # built items can be changed by the stages, each branch gets its own copy
+                copy_item = shared and isinstance(item, (Event, EventBatch))
+                for branch in branches:
+                    branch_item = copy.copy(item) if copy_item else item
+                    for process in branch:
+                        branch_item = process(branch_item)
+                        if branch_item is None:
+                            break
+        finally:
+            for stage in stages:
+                stage.close()
+            self.source.close()
+        return self.source.n_events
@@ -1,8 +1,18 @@
 import sys,os
+import json
+import hashlib
+import subprocess
+import multiprocessing
 import ROOT
 ROOT.gROOT.SetBatch(True)
 ROOT.gErrorIgnoreLevel = 2002
 from collections import OrderedDict, defaultdict
+from Datasets import default_datasets
+
+# hashes of the histograms of the written plots
+MANIFEST = 'plots/manifest.json'
+# Plotter used by the worker processes, set by _init_worker
+_plotter = None
 
 class Plotter(object):
     """
@@ -10,12 +20,22 @@ class Plotter(object):
     """
 
 
-    def __init__(self, analyzers):
+    def __init__(self, analyzers, n_workers=None, formats=('pdf',), datasets=None):
+        """
+        n_workers is the number of processes rendering the plots (None: one per CPU core),
+        formats are the file formats of the single plots, e.g. ('pdf', 'png').
+        datasets is the registry of the datasets (default: default_datasets()) giving the colors
+        and the scale factors, the histograms of the samples of a dataset are plotted combined.
+        """
+        if datasets is None:
+            datasets = default_datasets()
+        self.n_workers = n_workers if n_workers else multiprocessing.cpu_count()
+        self.formats = tuple(formats)
+        # plots are drawn again whenever the plotting code changes
+        with open(os.path.splitext(os.path.abspath(__file__))[0]+".py", 'rb') as f:
+            self.source_hash = hashlib.sha1(f.read()).hexdigest()
         # set default plotting style
-        self.style = default_style()
-        self.style.SetOptLogy(True)
-        ROOT.gROOT.SetStyle("MyStyle");
-        self.colors = {'TTbar':632, 'single top':798, 'W+jets':602, 'QCD':867, 'DY+jets':829, 'Diboson':875}
+        self.set_style()
         self.hists_data = []
         self.hists_stack = []
         self.hists_err = []
@@ -23,14 +43,15 @@ class Plotter(object):
             os.makedirs('plots')
         # loop over all histograms
         # apply dataset specific styling and create THStack and TH1 objects for plotting
-        for process in analyzers.keys():
+        histograms = datasets.histograms(analyzers)
+        for process in histograms.keys():
             i = 0
-            is_data = ('data' in process.lower())
-            for d in analyzers[process].histograms.keys():
-                for hist in analyzers[process].histograms[d].hists.values():
+            is_data = datasets.is_data(process)
+            for d in histograms[process].keys():
+                for hist in histograms[process][d].values():
                     if not is_data:
-                        if process in self.colors.keys():
-                            hist.SetFillColor(self.colors[process])
+                        if datasets.color(process) is not None:
+                            hist.SetFillColor(datasets.color(process))
                         if i >= len(self.hists_stack):
                             self.hists_stack.append(ROOT.THStack(hist.GetName()+"_stack", hist.GetTitle()))
                             self.hists_err.append(hist.Clone(hist.GetName()+"_err"))
@@ -51,43 +72,212 @@ class Plotter(object):
 
 # self.histograms = {d:{{process:hist} for process in analyzers.keys()] for d in dirs}
 
+    def set_style(self):
+        """
+        set the default plotting style.
+        """
+        self.style = default_style()
+        self.style.SetOptLogy(True)
+        ROOT.gROOT.SetStyle("MyStyle");
+
+    def __getstate__(self):
+        """
+        return the state sent to the worker processes, the style is set up again by __setstate__.
+        """
+        state = dict(self.__dict__)
+        del state['style']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.set_style()
+
+    def plot_name(self, i):
+        """
+        return the name of the plot of the i-th histogram, without the dataset name.
+        """
+        return "_".join(self.hists_stack[i].GetName().split("_")[1:])
+
+    def summary_name(self, i):
+        """
+        return the name of the multi-page pdf the i-th histogram belongs to, one per histogram collection.
+        """
+        return "".join(self.plot_name(i).split("_default")[0:1])+".pdf"
+
+    def plot_files(self, i):
+        """
+        return the files written for the i-th histogram.
+        """
+        name = "plots/"+self.plot_name(i)
+        files = [name+"_MC."+ext for ext in self.formats]
+        if len(self.hists_data) > 0:
+            files += [name+"."+ext for ext in self.formats]
+        return files
+
+    def plot_hash(self, i):
+        """
+        return a hash of everything drawn in the plot of the i-th histogram.
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(self.source_hash.encode('utf-8'))
+        hists = [hist for hist in self.hists_stack[i].GetHists()] + [self.hists_err[i]]
+        if len(self.hists_data) > 0:
+            hists.append(self.hists_data[i])
+        for hist in hists:
+            content = [hist.GetBinContent(b) for b in range(hist.GetNbinsX()+2)]
+            errors = [hist.GetBinError(b) for b in range(hist.GetNbinsX()+2)]
+            sha1.update(repr([hist.GetName(), hist.GetTitle(), hist.GetFillColor(), hist.GetEntries(),
+                              hist.GetXaxis().GetXmin(), hist.GetXaxis().GetXmax(), content, errors]).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def draw(self, i):
+        """
+        Draw the i-th histogram and write the plots of Monte Carlo only and, if available, with data.
+        returns the canvas showing the last plot.
+        """
+        h = self.hists_stack[i]
+        c = ROOT.TCanvas("c","c",800,600)
+        if h.GetMaximum() <= 0: h.SetMaximum(1)
+        h.SetMinimum(0.8)
+        h.Draw("hist")
+        h.GetXaxis().SetTitle(h.GetTitle())
+        h.GetXaxis().SetTitleOffset(1.3)
+        h.GetYaxis().SetTitle("Events")
+        h.GetYaxis().SetTitleOffset(1.3)
+        c.Modified()
+        self.hists_err[i].Draw("E2SAME")
+        c.Modified()
+        c.BuildLegend(0.76,0.4,0.95,0.95,"");
+        for ext in self.formats:
+            c.Print("plots/"+self.plot_name(i)+"_MC."+ext)
+        if len(self.hists_data) > 0:
+            self.hists_data[i].Draw("PESAME")
+            c.BuildLegend(0.75,0.35,0.95,0.95,"");
+            for ext in self.formats:
+                c.Print("plots/"+self.plot_name(i)+"."+ext)
+        return c
+
+    def render(self, i):
+        """
+        Write the plots of the i-th histogram.
+        """
+        c = self.draw(i)
+        del c
+
     def process(self):
-        s=""
-        for i in range(0,len(self.hists_stack)):
-            h = self.hists_stack[i]
-            c = ROOT.TCanvas("c","c",800,600)
-            if h.GetMaximum() <= 0: h.SetMaximum(1)
-            h.SetMinimum(0.8)
-            h.Draw("hist")
-            h.GetXaxis().SetTitle(h.GetTitle())
-            h.GetXaxis().SetTitleOffset(1.3)
-            h.GetYaxis().SetTitle("Events")
-            h.GetYaxis().SetTitleOffset(1.3)
-            c.Modified()
-            self.hists_err[i].Draw("E2SAME")
-            c.Modified()
-            c.BuildLegend(0.76,0.4,0.95,0.95,"");
-            c.Print("plots/"+"_".join(h.GetName().split("_")[1:])+"_MC.pdf")
-            if len(self.hists_data) > 0:
-                self.hists_data[i].Draw("PESAME")
-                c.BuildLegend(0.75,0.35,0.95,0.95,"");
-                c.Print("plots/"+"_".join(h.GetName().split("_")[1:])+".pdf")
-
-            old_s = s
-            s = "_".join(h.GetName().split("_")[1:])
-            s = "".join(s.split("_default")[0:1])+".pdf"
-            if(s != old_s):
-                if(i == len(self.hists_stack) - 1):
-                    c.Print(s)
-                else:
-                    c.Print(s+"(")
-                if(old_s != ""):
-                    c.Print(old_s+"]")
-            elif(i == len(self.hists_stack) - 1):
-                c.Print(s+")")
-            else:
-                c.Print(s)
-            del c
+        """
+        Write the plots of all histograms and the multi-page pdf of each histogram collection.
+
+        Plots are rendered in n_workers processes. Plots whose histograms did not change
+        since the last call, according to the hashes stored in the manifest, are not rendered again.
+        """
+        manifest = self.read_manifest()
+        hashes = [self.plot_hash(i) for i in range(len(self.hists_stack))]
+        todo = [i for i in range(len(self.hists_stack))
+                if any(manifest.get(f) != hashes[i] or not os.path.exists(f) for f in self.plot_files(i))]
+        if self.n_workers == 1 or len(todo) <= 1:
+            for i in todo:
+                self.render(i)
+        else:
+            # the plotter is passed to the workers when they start, with the spawn start method it is pickled
+            pool = multiprocessing.Pool(min(self.n_workers, len(todo)), _init_worker, (self,))
+            try:
+                pool.map(_render, todo)
+            finally:
+                pool.close()
+                pool.join()
+        for i in todo:
+            for f in self.plot_files(i):
+                manifest[f] = hashes[i]
+        self.write_summaries(hashes, manifest)
+        self.write_manifest(manifest)
+
+    def write_summaries(self, hashes, manifest):
+        """
+        Write the multi-page pdf of each histogram collection from the pdfs of its plots.
+
+        The pages are merged with pdfunite or ghostscript, if neither is available they are drawn again.
+        """
+        summaries = OrderedDict()
+        for i in range(len(self.hists_stack)):
+            summaries.setdefault(self.summary_name(i), []).append(i)
+        for name, indices in summaries.items():
+            summary_hash = hashlib.sha1("".join(hashes[i] for i in indices).encode('utf-8')).hexdigest()
+            if manifest.get(name) == summary_hash and os.path.exists(name):
+                continue
+            pages = ["plots/"+self.plot_name(i)+("." if len(self.hists_data) > 0 else "_MC.")+"pdf"
+                     for i in indices]
+            if "pdf" not in self.formats or not merge_pdfs(pages, name):
+                self.print_summary(name, indices)
+            manifest[name] = summary_hash
+
+    def print_summary(self, name, indices):
+        """
+        Draw the plots of the given histograms into the multi-page pdf name.
+        """
+        formats = self.formats
+        # the single plots are not written again
+        self.formats = ()
+        try:
+            for j, i in enumerate(indices):
+                c = self.draw(i)
+                if j == 0:
+                    c.Print(name+"[")
+                c.Print(name)
+                if j == len(indices) - 1:
+                    c.Print(name+"]")
+                del c
+        finally:
+            self.formats = formats
+
+    def read_manifest(self):
+        """
+        return the hashes of the plots written by the last call of process.
+        """
+        if os.path.exists(MANIFEST):
+            try:
+                with open(MANIFEST) as f:
+                    return json.load(f)
+            except ValueError:
+                pass
+        return {}
+
+    def write_manifest(self, manifest):
+        """
+        store the hashes of the written plots.
+        """
+        with open(MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def _init_worker(plotter):
+    """
+    Set the Plotter of a worker process.
+    """
+    global _plotter
+    _plotter = plotter
+
+def _render(i):
+    """
+    Write the plots of the i-th histogram of the Plotter in a worker process.
+    """
+    _plotter.render(i)
+
+def merge_pdfs(pages, output):
+    """
+    merge the pdf files pages into output with pdfunite or ghostscript.
+    returns False if neither of them is available or merging failed.
+    """
+    commands = [["pdfunite"] + pages + [output],
+                ["gs", "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pdfwrite", "-sOutputFile="+output] + pages]
+    with open(os.devnull, 'w') as devnull:
+        for command in commands:
+            try:
+                if subprocess.call(command, stdout=devnull, stderr=subprocess.STDOUT) == 0:
+                    return True
+            except OSError:
+                continue
+    return False
 
 def default_style():
     """
@@ -0,0 +1,118 @@
+import sys
+import threading
+import traceback
+import multiprocessing
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import ROOT
+from ColumnChunk import read_chunks, prune_branches
+
+# markers sent by the background reader after the last item and on errors
+_DONE = 'done'
+_ERROR = 'error'
+_ITEM = 'item'
+
+def read_file_chunks(file_name, branches, first_entry=0, last_entry=-1, chunk_size=100000, cache_size=30*1024*1024):
+    """
+    Generator over ColumnChunks of the given branches of the events tree of files/<file_name>.
+    Opens the file itself, so it can run in another thread or process.
+    """
+    f = ROOT.TFile.Open('files/'+file_name)
+    try:
+        tree = f.events
+        prune_branches(tree, branches, cache_size)
+        for chunk in read_chunks(tree, branches, first_entry, last_entry, chunk_size):
+            yield chunk
+    finally:
+        f.Close()
+
+def _produce(function, args, items, stop):
+    """
+    Put the items of function(*args) into the queue items until all are read or stop is set.
+    """
+    try:
+        for item in function(*args):
+            while not stop.is_set():
+                try:
+                    items.put((_ITEM, item), timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if stop.is_set():
+                return
+        items.put((_DONE, None))
+    except Exception:
+        items.put((_ERROR, "".join(traceback.format_exception(*sys.exc_info()))))
+
+
+class Prefetcher(object):
+    """
+    Read the items of function(*args), e.g. read_file_chunks, in a background process or thread
+    while the main loop processes the previous ones.
+
+    At most depth items are read ahead; the reader waits while the queue is full, so the
+    memory used stays bounded. With process=True the items are read in a separate process,
+    which also overlaps decompression in ROOT with Python code, and are sent to the main
+    process through a pipe. With process=False a thread is used, which avoids copying the items,
+    but reading through PyROOT mostly holds the GIL, so a thread overlaps little of the reading.
+    Daemonic processes, e.g. the workers of a ParallelRunner, cannot start processes and always
+    use a thread; Analyzer does not prefetch in them. Errors of the reader are raised in the main loop, as is the reader process
+    ending without finishing, e.g. when it crashed or was killed.
+    """
+    def __init__(self, function, args=(), depth=2, process=True, poll=1.0):
+        if depth < 1:
+            raise ValueError("Prefetcher(): depth must be at least 1")
+        self.function = function
+        self.args = tuple(args)
+        self.depth = depth
+        self.process = process
+        # seconds to wait for an item before checking that the reader is still alive
+        self.poll = poll
+
+    def __iter__(self):
+        process = self.process and not multiprocessing.current_process().daemon
+        if process:
+            items = multiprocessing.Queue(self.depth)
+            stop = multiprocessing.Event()
+            worker = multiprocessing.Process(target=_produce, args=(self.function, self.args, items, stop))
+        else:
+            items = queue.Queue(self.depth)
+            stop = threading.Event()
+            worker = threading.Thread(target=_produce, args=(self.function, self.args, items, stop))
+        worker.daemon = True
+        worker.start()
+        try:
+            while True:
+                try:
+                    kind, item = items.get(timeout=self.poll)
+                except queue.Empty:
+                    if worker.is_alive():
+                        continue
+                    try:
+                        # the last items may still be in transit from the finished reader
+                        kind, item = items.get(timeout=self.poll)
+                    except queue.Empty:
+                        raise RuntimeError("Prefetcher: background reader ended without finishing (exit code %s)"
+                                           % getattr(worker, 'exitcode', None))
+                if kind == _DONE:
+                    break
+                if kind == _ERROR:
+                    raise RuntimeError("Prefetcher: error in background reader:\n" + item)
+                yield item
+        finally:
+            # stop the reader, also when the main loop ends early
+            stop.set()
+            if process:
+                worker.join(1.0)
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            else:
+                while worker.is_alive():
+                    try:
+                        items.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                worker.join()
@@ -0,0 +1,187 @@
+import sys
+import json
+import resource
+import timeit
+from collections import OrderedDict
+from TopReco import TopReco
+
+def peak_rss():
+    """
+    return the peak resident set size of the process in MB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kB on Linux
+    if sys.platform == 'darwin':
+        return rss / (1024.*1024.)
+    return rss / 1024.
+
+
+class Profiler(object):
+    """
+    Measures the time spent in each stage of the event loop.
+
+    Stages are ROOT I/O ("io"), building events ("build"), processing them ("process"),
+    filling each histogram collection ("fill:<name>") and the top quark reconstruction
+    ("top_reco"). The methods of an analyzer are wrapped by instrument, so analyzers
+    without profiler run without any overhead. Times of nested stages are included in
+    the enclosing stage, e.g. "process" includes "fill:*" and "top_reco".
+    """
+    def __init__(self):
+        self.times = OrderedDict()
+        self.calls = OrderedDict()
+        self.n_events = 0
+        # time spent in Analyzer.run
+        self.wall_time = 0.0
+        self.peak_rss = 0.0
+        self._start = None
+        self._instrumented = set()
+        # stages currently measured, nested calls of the same stage are not counted twice
+        self._active = set()
+
+    def add(self, stage, seconds, calls=1):
+        """
+        add the time of calls to a stage.
+        """
+        if stage not in self.times:
+            self.times[stage] = 0.0
+            self.calls[stage] = 0
+        self.times[stage] += seconds
+        self.calls[stage] += calls
+
+    def timed(self, stage, function):
+        """
+        return function wrapped with a timer for stage.
+        """
+        timer = timeit.default_timer
+        add = self.add
+        active = self._active
+        def wrapper(*args, **kwargs):
+            if stage in active:
+                return function(*args, **kwargs)
+            active.add(stage)
+            start = timer()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add(stage, timer() - start)
+                active.discard(stage)
+        return wrapper
+
+    def timed_iter(self, stage, iterable):
+        """
+        iterate over iterable, timing each step for stage.
+        """
+        timer = timeit.default_timer
+        iterator = iter(iterable)
+        while True:
+            start = timer()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, timer() - start, 0)
+                return
+            self.add(stage, timer() - start)
+            yield item
+
+    def instrument(self, analyzer):
+        """
+        Wrap the event builder, process, the histogram collections and the TopReco instances of an analyzer with timers.
+        """
+        if id(analyzer) in self._instrumented:
+            return
+        self._instrumented.add(id(analyzer))
+        builder = analyzer.event_builder
+        builder.build_event = self.timed("build", builder.build_event)
+        builder.build_batch = self.timed("build", builder.build_batch)
+        analyzer.process = self.timed("process", analyzer.process)
+        analyzer.process_batch = self.timed("process", analyzer.process_batch)
+        for name, histograms in analyzer.histograms.items():
+            histograms.fill = self.timed("fill:"+name, histograms.fill)
+            histograms.fill_batch = self.timed("fill:"+name, histograms.fill_batch)
+        for value in list(vars(analyzer).values()):
+            if isinstance(value, TopReco):
+                value.calculateTopMass = self.timed("top_reco", value.calculateTopMass)
+                value.calculateTopMassBatch = self.timed("top_reco", value.calculateTopMassBatch)
+
+    def start(self):
+        """
+        start measuring the wall time of a run.
+        """
+        self._start = timeit.default_timer()
+
+    def stop(self, n_events):
+        """
+        stop measuring the wall time of a run which processed n_events.
+        """
+        self.wall_time += timeit.default_timer() - self._start
+        self.n_events += n_events
+        self.peak_rss = max(self.peak_rss, peak_rss())
+        self._start = None
+
+    def events_per_second(self, n_events=None):
+        """
+        return the number of events processed per second, by default of all finished runs.
+        """
+        if n_events is None:
+            n_events, wall_time = self.n_events, self.wall_time
+        else:
+            wall_time = timeit.default_timer() - self._start
+        return n_events / wall_time if wall_time > 0 else 0.0
+
+    def progress(self, n_events):
+        """
+        return the throughput and the time per event of each stage of the current run as string.
+        """
+        stages = ", ".join("%s %.1f us" % (stage, 1e6*self.times[stage]/n_events) for stage in self.times)
+        return "%.0f events/s, per event: %s" % (self.events_per_second(n_events), stages)
+
+    def summary(self):
+        """
+        return the profile as dictionary.
+        """
+        n_events = max(self.n_events, 1)
+        stages = OrderedDict()
+        for stage in self.times:
+            stages[stage] = OrderedDict([('time', self.times[stage]),
+                                         ('calls', self.calls[stage]),
+                                         ('time_per_event', self.times[stage]/n_events)])
+        return OrderedDict([('n_events', self.n_events),
+                            ('wall_time', self.wall_time),
+                            ('events_per_second', self.events_per_second()),
+                            ('peak_rss_mb', self.peak_rss),
+                            ('stages', stages)])
+
+    def results(self):
+        """
+        return the measured times, e.g. to send them from a worker process.
+        """
+        return {'times': self.times, 'calls': self.calls, 'n_events': self.n_events,
+                'wall_time': self.wall_time, 'peak_rss': self.peak_rss}
+
+    def merge(self, results, first=False):
+        """
+        Add the times returned by results() of another profiler.
+        If first is True the times are replaced instead.
+        The wall times of several processes are summed, the peak RSS is the maximum.
+        """
+        if first:
+            self.times = OrderedDict()
+            self.calls = OrderedDict()
+            self.n_events = 0
+            self.wall_time = 0.0
+            self.peak_rss = 0.0
+        for stage in results['times']:
+            self.add(stage, results['times'][stage], results['calls'][stage])
+        self.n_events += results['n_events']
+        self.wall_time += results['wall_time']
+        self.peak_rss = max(self.peak_rss, results['peak_rss'])
+
+    def write(self, path, dataset_name=None):
+        """
+        write the summary to a JSON file.
+        """
+        summary = self.summary()
+        if dataset_name is not None:
+            summary = OrderedDict([('dataset', dataset_name)] + list(summary.items()))
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=1)
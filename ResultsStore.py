@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import inspect
+import hashlib
+import numpy as np
+import ROOT
+from collections import OrderedDict
+from Fingerprint import file_fingerprint, input_fingerprint
+from ParallelRunner import ParallelRunner
+
+# name of the object holding the metadata in the output files
+METADATA_NAME = 'results'
+# event options changing only how the events are read and processed, not the results.
+# 'mode', 'event_store' and 'prefetch' select other numerical paths and are part of the hash.
+EXECUTION_OPTIONS = ('chunk_size', 'cache_size', 'lazy', 'profile')
+
+def source_files(analyzer_class):
+    """
+    return the source files of the modules of the framework the analyzer class depends on.
+
+    Starting from the module of the class, all modules in the same directory whose
+    modules, classes or functions are used by an already found module are collected.
+    """
+    base = os.path.dirname(os.path.abspath(inspect.getsourcefile(analyzer_class)))
+    files = OrderedDict()
+    modules = [sys.modules[analyzer_class.__module__]]
+    while modules:
+        module = modules.pop()
+        try:
+            path = os.path.abspath(inspect.getsourcefile(module))
+        except TypeError:
+            continue
+        if os.path.dirname(path) != base or path in files:
+            continue
+        files[path] = module
+        for value in vars(module).values():
+            if inspect.ismodule(value):
+                modules.append(value)
+            elif inspect.isclass(value) or inspect.isfunction(value):
+                dependency = sys.modules.get(getattr(value, '__module__', None))
+                if dependency is not None:
+                    modules.append(dependency)
+    return sorted(files.keys())
+
+def _canonical(value):
+    """
+    return a JSON serializable representation of an event option.
+
+    The order of OrderedDicts is kept, other dictionaries are sorted by key.
+    """
+    if isinstance(value, OrderedDict):
+        return [[str(key), _canonical(item)] for key, item in value.items()]
+    if isinstance(value, dict):
+        return [[str(key), _canonical(value[key])] for key in sorted(value.keys(), key=str)]
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if callable(value):
+        return "%s.%s" % (getattr(value, '__module__', ''), getattr(value, '__name__', type(value).__name__))
+    return value
+
+def result_options(event_options):
+    """
+    return the event options without the EXECUTION_OPTIONS, also in the options of each variation.
+    """
+    options = event_options.__class__((key, value) for key, value in event_options.items()
+                                      if key not in EXECUTION_OPTIONS)
+    if options.get("variations"):
+        options["variations"] = options["variations"].__class__((name, result_options(variation))
+                                                                for name, variation in options["variations"].items())
+    return options
+
+def config_hash(analyzer_class, event_options):
+    """
+    return a hash of the configuration of an analyzer.
+
+    It changes with the analyzer class, the event options and the source code of the
+    framework modules used by the analyzer. Options listed in EXECUTION_OPTIONS, e.g.
+    'profile' or 'lazy', do not change the results and are not part of the hash.
+    """
+    sources = [[os.path.basename(path), file_fingerprint(path)['sha1']] for path in source_files(analyzer_class)]
+    content = json.dumps(["%s.%s" % (analyzer_class.__module__, analyzer_class.__name__),
+                          _canonical(result_options(event_options)),
+                          sources])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class ResultsStore(object):
+    """
+    Reads the results of an analyzer back from the output files written by Analyzer.write_output.
+
+    Next to the histograms, the output files hold the hash of the analyzer configuration,
+    the fingerprint of the input file, the counters and the cut flow. The stored results
+    of a dataset are used as long as neither its input file nor the configuration changed,
+    otherwise the dataset is processed again.
+    """
+    def __init__(self, analyzer_class, event_options={}):
+        self.analyzer_class = analyzer_class
+        self.event_options = event_options
+        self._config_hash = None
+
+    def config_hash(self):
+        """
+        return the hash of the current configuration.
+        """
+        if self._config_hash is None:
+            self._config_hash = config_hash(self.analyzer_class, self.event_options)
+        return self._config_hash
+
+    def path(self, file_name):
+        """
+        return the path of the output file of a dataset.
+        """
+        return 'output_'+file_name
+
+    def metadata(self, file_name):
+        """
+        return the metadata stored in the output file of a dataset,
+        None if there is no output file or it has no metadata.
+        """
+        path = self.path(file_name)
+        if not os.path.exists(path):
+            return None
+        f = ROOT.TFile.Open(path)
+        if not f or f.IsZombie():
+            return None
+        stored = f.Get(METADATA_NAME)
+        metadata = json.loads(stored.GetTitle()) if stored else None
+        f.Close()
+        return metadata
+
+    def is_current(self, file_name):
+        """
+        return True if the output file of a dataset was written with the current
+        configuration from the current input file.
+        """
+        metadata = self.metadata(file_name)
+        if metadata is None or metadata['config_hash'] != self.config_hash():
+            return False
+        fingerprint = input_fingerprint(file_name)
+        stored = metadata['fingerprint']
+        return stored['size'] == fingerprint['size'] and stored['sha1'] == fingerprint['sha1']
+
+    def load(self, dataset_name, file_name):
+        """
+        return an analyzer holding the histograms, counters and cut flow stored in the output file.
+        """
+        analyzer = self.analyzer_class(dataset_name, file_name, self.event_options)
+        metadata = self.metadata(file_name)
+        if metadata is None:
+            raise IOError("ResultsStore.load(): no stored results in %s" % self.path(file_name))
+        print("Loading %s from %s." % (dataset_name, self.path(file_name)))
+        f = ROOT.TFile.Open(self.path(file_name))
+        if analyzer.variation is None:
+            results = self._read_results(analyzer, f, metadata['results'])
+        else:
+            results = self._read_results(analyzer, f.Get(analyzer.variation), metadata['results'])
+            results['variations'] = OrderedDict(
+                (name, self._read_results(variation, f.Get(name), metadata['results']['variations'][name]))
+                for name, variation in analyzer.variation_analyzers().items() if variation is not analyzer)
+        # the histograms are copied, so the file can be closed afterwards
+        analyzer.merge(results, first=True)
+        f.Close()
+        return analyzer
+
+    def _read_results(self, analyzer, tdir, summary):
+        """
+        return the results of an analyzer, see Analyzer.results, with the histograms read from tdir.
+        """
+        histograms = OrderedDict()
+        for name, collection in analyzer.histograms.items():
+            histograms[name] = OrderedDict()
+            for key, hist in collection.hists.items():
+                stored = tdir.Get(name+"/"+hist.GetName())
+                if not stored:
+                    raise IOError("ResultsStore.load(): histogram %s/%s not found in %s"
+                                  % (name, hist.GetName(), tdir.GetName()))
+                histograms[name][key] = stored
+        return {'histograms': histograms, 'counters': summary['counters'], 'cutflow': summary['cutflow']}
+
+    def load_all(self, datasets):
+        """
+        return an OrderedDict of analyzers with the stored results of all datasets,
+        without checking if they are up to date, e.g. to only plot or fit them.
+        """
+        return OrderedDict((name, self.load(name, file_name)) for name, file_name in datasets.items())
+
+    def run(self, datasets, runner=None):
+        """
+        return an OrderedDict of analyzers for all datasets.
+
+        Datasets with current stored results are loaded, the others are processed
+        with runner, by default a ParallelRunner of the analyzer class.
+        """
+        stale = OrderedDict((name, file_name) for name, file_name in datasets.items()
+                            if not self.is_current(file_name))
+        processed = OrderedDict()
+        if stale:
+            if runner is None:
+                runner = ParallelRunner(self.analyzer_class)
+            print("Processing %s." % ", ".join(stale.keys()))
+            processed = runner.run(stale, self.event_options)
+        analyzers = OrderedDict()
+        for name, file_name in datasets.items():
+            analyzers[name] = processed[name] if name in stale else self.load(name, file_name)
+        return analyzers
@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from ColumnChunk import ColumnChunk, JAGGED_COUNTERS, read_chunks, counter_branch
+from CutFlow import OPERATORS
+from Fingerprint import file_fingerprint
+
+# version of the content of the skim files, skims of other versions are built again
+SKIM_VERSION = 2
+
+
+class Skim(object):
+    """
+    Columnar cache of the events of a file passing a preselection.
+
+    The preselection is a list of cuts (branch, operator, value) on per-event branches,
+    e.g. [('triggerIsoMu24', '==', True)]. Only the given branches of the selected events
+    are stored in a .npz file in skim_dir. The file is keyed by the fingerprint of the
+    source file, the preselection and the branches and rebuilt whenever one of them changes.
+    """
+    def __init__(self, file_name, branches, preselection, skim_dir='skims'):
+        self.file_name = file_name
+        self.branches = list(branches)
+        self.preselection = [tuple(cut) for cut in preselection]
+        for branch, op, value in self.preselection:
+            if op not in OPERATORS:
+                raise ValueError("Skim(): unknown operator '%s' in preselection" % op)
+            if counter_branch(branch) is not None:
+                raise ValueError("Skim(): preselection on per-object branch '%s'" % branch)
+        self.skim_dir = skim_dir
+        # number, sum of weights and sum of squared weights of the events in the source file
+        self.n_source_events = 0
+        self.sum_source_weights = 0.0
+        self.sum_source_weights2 = 0.0
+
+    def key(self):
+        """
+        return the key identifying the skim of the current source file.
+        """
+        if not os.path.exists(self.skim_dir):
+            os.makedirs(self.skim_dir)
+        fingerprint = file_fingerprint('files/'+self.file_name, os.path.join(self.skim_dir, 'fingerprints.json'))
+        content = json.dumps([SKIM_VERSION,
+                              fingerprint,
+                              [list(cut) for cut in self.preselection],
+                              self.branches], sort_keys=True, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        """
+        return the path of the skim file for the given key.
+        """
+        name = os.path.splitext(self.file_name)[0]
+        return os.path.join(self.skim_dir, "%s_%s.npz" % (name, key[:16]))
+
+    def select(self, chunk):
+        """
+        return the mask of events in chunk passing the preselection.
+        """
+        mask = np.ones(len(chunk), dtype=bool)
+        for branch, op, value in self.preselection:
+            mask &= OPERATORS[op](chunk[branch], value)
+        return mask
+
+    def load(self, tree):
+        """
+        return a ColumnChunk holding all skimmed events.
+
+        The skim is read from the cache file if it is up to date, otherwise it is built from tree.
+        """
+        key = self.key()
+        path = self.path(key)
+        if os.path.exists(path):
+            return self.read(path)
+        return self.build(tree, path)
+
+    def read(self, path):
+        """
+        read the skimmed events from the cache file.
+        """
+        print("Reading skim %s." % path)
+        with np.load(path) as data:
+            self.n_source_events = int(data['_n_source_events'])
+            self.sum_source_weights = float(data['_sum_source_weights'])
+            self.sum_source_weights2 = float(data['_sum_source_weights2'])
+            columns = OrderedDict((branch, data[branch]) for branch in self.branches)
+        return ColumnChunk(columns)
+
+    def source_yields(self):
+        """
+        return the yields of all events of the source file in the format of CutFlow.yields for a single cut.
+        """
+        return {'counts': [self.n_source_events], 'sumw': [self.sum_source_weights],
+                'sumw2': [self.sum_source_weights2]}
+
+    def build(self, tree, path):
+        """
+        build the skim from tree and write it to the cache file.
+        """
+        print("Building skim %s." % path)
+        branches = list(self.branches)
+        for branch, op, value in self.preselection:
+            if branch not in branches:
+                branches.append(branch)
+        if 'EventWeight' not in branches:
+            branches.append('EventWeight')
+        self.n_source_events = 0
+        self.sum_source_weights = 0.0
+        self.sum_source_weights2 = 0.0
+        chunks = []
+        for chunk in read_chunks(tree, branches):
+            weights = np.asarray(chunk['EventWeight'], dtype=np.float64)
+            self.n_source_events += len(chunk)
+            self.sum_source_weights += float(np.sum(weights))
+            self.sum_source_weights2 += float(np.sum(weights*weights))
+            chunks.append(chunk.select(self.select(chunk)))
+        if chunks:
+            skim = ColumnChunk.concatenate(chunks)
+        else:
+            counters = JAGGED_COUNTERS.values()
+            skim = ColumnChunk(OrderedDict((branch, np.zeros(0, dtype=np.int64 if branch in counters else np.float64))
+                                           for branch in branches))
+        columns = OrderedDict((branch, skim[branch]) for branch in self.branches)
+        # remove outdated skims of the same file
+        stale = re.compile(re.escape(os.path.splitext(self.file_name)[0]) + r'_[0-9a-f]{16}\.npz$')
+        for name in os.listdir(self.skim_dir):
+            if stale.match(name) and name != os.path.basename(path):
+                os.remove(os.path.join(self.skim_dir, name))
+        # write to a temporary file first, so no incomplete skim is read by other processes
+        tmp_path = "%s.%d.tmp.npz" % (path[:-len('.npz')], os.getpid())
+        np.savez(tmp_path,
+                 _n_source_events=self.n_source_events,
+                 _sum_source_weights=self.sum_source_weights,
+                 _sum_source_weights2=self.sum_source_weights2,
+                 **columns)
+        os.rename(tmp_path, path)
+        return ColumnChunk(columns)
@@ -0,0 +1,120 @@
+import ROOT
+import numpy as np
+from collections import OrderedDict
+from ColumnChunk import ColumnChunk, JAGGED_COUNTERS, counter_branch
+
+# branches of the events tree: name -> ROOT leaf type, per-object branches are counted by JAGGED_COUNTERS
+SCHEMA = OrderedDict([('EventWeight', 'F'),
+                      ('triggerIsoMu24', 'O'),
+                      ('MET_px', 'F'),
+                      ('MET_py', 'F'),
+                      ('NMuon', 'I'),
+                      ('Muon_Px', 'F'),
+                      ('Muon_Py', 'F'),
+                      ('Muon_Pz', 'F'),
+                      ('Muon_E', 'F'),
+                      ('Muon_Charge', 'I'),
+                      ('Muon_Iso', 'F'),
+                      ('NJet', 'I'),
+                      ('Jet_Px', 'F'),
+                      ('Jet_Py', 'F'),
+                      ('Jet_Pz', 'F'),
+                      ('Jet_E', 'F'),
+                      ('Jet_btag', 'F'),
+                      ])
+
+DTYPES = {'F': np.float32, 'I': np.int32, 'O': np.bool_}
+
+# maximum number of objects per event in the written trees
+MAX_OBJECTS = 50
+
+def _four_momenta(rng, n, mass, pt_min, pt_scale):
+    """
+    return px, py, pz, E of n objects with exponential pT spectrum and flat eta and phi.
+    """
+    pt = pt_min + rng.exponential(pt_scale, n)
+    eta = rng.uniform(-2.5, 2.5, n)
+    phi = rng.uniform(-np.pi, np.pi, n)
+    px = pt*np.cos(phi)
+    py = pt*np.sin(phi)
+    pz = pt*np.sinh(eta)
+    E = np.sqrt(px*px + py*py + pz*pz + mass*mass)
+    return px, py, pz, E
+
+def generate(n_events, mean_jets=4.0, b_tag_rate=0.2, mean_muons=1.0, n_jets=None, n_muons=None, seed=1):
+    """
+    return a ColumnChunk with n_events synthetic events with the branches of the events tree.
+
+    The number of jets and muons per event is Poisson distributed with mean mean_jets and
+    mean_muons, or fixed to n_jets and n_muons if given. b_tag_rate is the fraction of
+    b-tagged jets. Most muons are isolated, the trigger fires for 90% of the events
+    with a muon above 24 GeV.
+    """
+    rng = np.random.RandomState(seed)
+    if n_muons is None:
+        counts_muons = np.minimum(rng.poisson(mean_muons, n_events), MAX_OBJECTS)
+    else:
+        counts_muons = np.full(n_events, n_muons)
+    if n_jets is None:
+        counts_jets = np.minimum(rng.poisson(mean_jets, n_events), MAX_OBJECTS)
+    else:
+        counts_jets = np.full(n_events, n_jets)
+    total_muons = int(counts_muons.sum())
+    total_jets = int(counts_jets.sum())
+
+    columns = OrderedDict()
+    columns['EventWeight'] = rng.uniform(0.5, 1.5, n_events)
+    muon_px, muon_py, muon_pz, muon_E = _four_momenta(rng, total_muons, 0.105, 10., 30.)
+    jet_px, jet_py, jet_pz, jet_E = _four_momenta(rng, total_jets, 10., 20., 50.)
+    columns['NMuon'] = counts_muons
+    columns['Muon_Px'], columns['Muon_Py'], columns['Muon_Pz'], columns['Muon_E'] = muon_px, muon_py, muon_pz, muon_E
+    columns['Muon_Charge'] = rng.choice([-1, 1], total_muons)
+    # the isolation is stored as absolute value, relative isolation is exponentially distributed
+    columns['Muon_Iso'] = rng.exponential(0.05, total_muons)*np.hypot(muon_px, muon_py)
+    columns['NJet'] = counts_jets
+    columns['Jet_Px'], columns['Jet_Py'], columns['Jet_Pz'], columns['Jet_E'] = jet_px, jet_py, jet_pz, jet_E
+    tagged = rng.uniform(size=total_jets) < b_tag_rate
+    columns['Jet_btag'] = np.where(tagged, rng.uniform(1.75, 5., total_jets), rng.uniform(-1., 1.7, total_jets))
+
+    # MET balances the visible objects, smeared by the resolution
+    event_of_muon = np.repeat(np.arange(n_events), counts_muons)
+    event_of_jet = np.repeat(np.arange(n_events), counts_jets)
+    columns['MET_px'] = (-np.bincount(event_of_muon, muon_px, n_events) - np.bincount(event_of_jet, jet_px, n_events)
+                         + rng.normal(0., 20., n_events))
+    columns['MET_py'] = (-np.bincount(event_of_muon, muon_py, n_events) - np.bincount(event_of_jet, jet_py, n_events)
+                         + rng.normal(0., 20., n_events))
+
+    leading_pt = np.zeros(n_events)
+    np.maximum.at(leading_pt, event_of_muon, np.hypot(muon_px, muon_py))
+    columns['triggerIsoMu24'] = (leading_pt > 24.) & (rng.uniform(size=n_events) < 0.9)
+
+    return ColumnChunk(OrderedDict((branch, np.asarray(columns[branch], dtype=DTYPES[leaf]))
+                                   for branch, leaf in SCHEMA.items()))
+
+def write_tree(path, chunk):
+    """
+    write the events of a ColumnChunk to the tree "events" of a new ROOT file.
+    """
+    f = ROOT.TFile.Open(path, 'RECREATE')
+    tree = ROOT.TTree('events', 'events')
+    buffers = OrderedDict()
+    for branch, leaf in SCHEMA.items():
+        counter = counter_branch(branch)
+        if counter is None:
+            buffers[branch] = np.zeros(1, dtype=DTYPES[leaf])
+            tree.Branch(branch, buffers[branch], "%s/%s" % (branch, leaf))
+        else:
+            buffers[branch] = np.zeros(MAX_OBJECTS, dtype=DTYPES[leaf])
+            tree.Branch(branch, buffers[branch], "%s[%s]/%s" % (branch, counter, leaf))
+    offsets = dict((counter, chunk.offsets(counter)) for counter in JAGGED_COUNTERS.values())
+    for i in range(len(chunk)):
+        for branch in SCHEMA:
+            counter = counter_branch(branch)
+            if counter is None:
+                buffers[branch][0] = chunk[branch][i]
+            else:
+                begin, end = offsets[counter][i], offsets[counter][i+1]
+                buffers[branch][:end-begin] = chunk[branch][begin:end]
+        tree.Fill()
+    tree.Write()
+    f.Close()
@@ -1,13 +1,16 @@
 from Analyzer import Analyzer
-from uhhHists import DefaultHistograms, TopMassHist
+from uhhHists import DefaultHistograms, TopMassHist, WBosonHists
 from ROOT import TH1F
-from TopReco import TopReco
+from TopReco import PrunedTopReco
+from NeutrinoSolver import NeutrinoSolver
 
 class TTbarAnalyzer(Analyzer):
     """
     Analyzer for the ttbar cross-section and mass measurement.
     Derived from Analyzer base class.
     """
+    # names of your own counters, see below
+    counter_names = ()
 
     def __init__(self, dataset_name, file_name, event_options = {}):
         # initialize base class functionality
@@ -21,17 +24,35 @@ class TTbarAnalyzer(Analyzer):
 
 ##
         self.attach_histogram(TopMassHist(dataset_name+"_top_mass"), "top_mass")
+
+        ## Neutrino reconstruction, shared by the W boson histograms and the top mass reconstruction ##
+        # NeutrinoSolver(mass_w, strategy): strategy for events without real solution,
+        # 'real' uses the real part of the solutions, 'rescale' scales the MET until there is one solution.
+        self.neutrino_solver = NeutrinoSolver()
+        self.attach_histogram(WBosonHists(dataset_name+"_w_boson", self.neutrino_solver), "w_boson")
         
         ##Creating the class that will reconstruct the top mass
-        self.TopReconstruction = TopReco(10.0,2,4)
-        #TopReco(x,y,z)
+        self.TopReconstruction = PrunedTopReco(10.0,2,4,self.neutrino_solver)
+        #PrunedTopReco(x,y,z), same parameters and results as TopReco(x,y,z)
         # x = max allowed mass difference between leptonic and hadronic top quark
         # y = minimum number of jets used for reconstruction.
         # z = maximum number of jets used for reconstruction
         # y=z is possible.
 
+        ## Define the event selection here ##
+        # Each cut has a name, a selection and the names of the histograms filled after the cut.
+        # The selection is either (field, operator, value) with a field of the event, e.g. ("n_jets", ">=", 4),
+        # or a function of the event returning True if the event passes, e.g. lambda event: event.n_jets() >= 4
+        # The cut flow records the number of events and the weighted number of events after each cut.
+        # The "no_cuts" histograms use the muons, jets and MET of every event, so with the
+        # 'lazy' event option all objects are still built; remove them to only build the
+        # objects of events passing the trigger.
+        self.cutflow.add_cut("no_cuts", histograms=["no_cuts"])
+        self.cutflow.add_cut("trigger", ("trigger.IsoMu24", "==", True), histograms=["trigger", "w_boson"])
+
         ## Here you can define your own variables ##
-        self.n_total = 0.0
+        # Counters, e.g. self.n_selected = 0, have to be listed in counter_names
+        # at the top of the class, e.g. counter_names = ('n_selected',), to be summed over the chunks of a dataset.
 
     def process(self,event):
         """
@@ -39,35 +60,29 @@ class TTbarAnalyzer(Analyzer):
         You can fill all attatched histograms using self.fill_histograms(event, <hist_name>).
         """
 
-        # increase total number of events for processed dataset
-        self.n_total += 1
-        # fill initial histogram
-        self.fill_histograms(event, "no_cuts")
-
         # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
         # Exercise 1: MC / data comparisons
         # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
         # Event selection:
-        # check if event fulfills the "IsoMu24" trigger
-        if not event.trigger["IsoMu24"]:
-            return 
-        # only events fulfilling the "IsoMu24" trigger will be further processed
-        
-        # fill histograms for all events passing the trigger selection
-        self.fill_histograms(event, "trigger")
+        # apply the cuts defined in __init__ and fill the histograms after each cut,
+        # e.g. check if event fulfills the "IsoMu24" trigger
+        if not self.cutflow.process(event, self.fill_histograms):
+            return
+        # only events passing all cuts will be further processed
 
         # Have a look at your histograms and compare the different background samples.
         # Try to enrich the fraction of ttbar events by cutting on any of the distributions 
-        # Plot all variables after every cut you introduce. Therefore define a new set of Histogramms at the top of this program 
+        # Plot all variables after every cut you introduce. Therefore define a new set of Histogramms at the top of this program
+        # and add a cut filling it to the cut flow.
 
         # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
         # Exercise 2: Measurement of the ttbar production cross section
         # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-        # Once you have optimized your event selection, define a variable in __init__ for the weighted number of selected events. 
-        # Also, define a variable for the weighted number of generated events. With these numbers, 
-        # the selection efficiency can be calculated. Afterwards, move to the 'Analysis.py' 
+        # Once you have optimized your event selection, the weighted number of selected and of generated events
+        # can be taken from the cut flow (self.cutflow.sum_weights(<cut_name>)). With these numbers, 
+        # the selection efficiency can be calculated (self.cutflow.efficiency(<cut_name>)). Afterwards, move to the 'Analysis.py' 
         # file to determine the efficiency and the ttbar cross section.
 
         # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
@@ -79,8 +94,25 @@ class TTbarAnalyzer(Analyzer):
         # Decomment the lines responsible for fitting the top mass in 'Analysis.py'. You may modify the variables x,y in fit(x,y)
 
         ## Top Quark Reconstruction ##
-        #mass = self.TopReconstruction.calculateTopMass(event.jets, event.met, event.muons[0])
+        #mass = self.TopReconstruction.calculateTopMass(event.jets, event.met, event.muons[0],
+        #                                               self.neutrino_solver.event_neutrinos(event))
 
         #if(mass > 0):
         #    event.top_mass = mass
         #    self.fill_histograms(event, "top_mass")
+
+    def process_batch(self, batch):
+        """
+        This method is called for each EventBatch when running in batch mode (event option "mode": "batch").
+        It applies the same selection as process to all events of the batch at once.
+        """
+
+        # Event selection:
+        # keep only events passing the cuts defined in __init__ and fill the histograms after each cut
+        batch = self.cutflow.process_batch(batch, self.fill_histograms)
+
+        ## Top Quark Reconstruction ##
+        # Decomment to reconstruct the top quark mass for all events of the batch at once.
+        #batch.top_mass = self.TopReconstruction.calculateTopMassBatch(batch.jets, batch.met, batch.muons,
+        #                                                              neutrinos=self.neutrino_solver.batch_neutrinos(batch))
+        #self.fill_histograms(batch.select(batch.top_mass > 0), "top_mass")
@@ -1,9 +1,11 @@
 from FourMomentum import FourMomentum
+from NeutrinoSolver import NeutrinoSolver
 import cmath, math, functools, itertools
+import numpy as np
 
 class TopReco:
 
-    def __init__(self, hl_diff, n_jet_min, n_jet_max):
+    def __init__(self, hl_diff, n_jet_min, n_jet_max, solver=None):
         if(not (isinstance(hl_diff, (float,int)) and isinstance(n_jet_min, int) and isinstance(n_jet_max, int))):
             raise TypeError("Please use the correct parameter types for TopReco(float or int, int, int)")
         elif(hl_diff<0 or n_jet_min<2 or n_jet_min>n_jet_max):
@@ -12,33 +14,157 @@ class TopReco:
             self.max_diff = hl_diff
             self.njet_min = n_jet_min
             self.njet_max = n_jet_max
-
+            # hypothesis tables of calculateTopMassBatch for each number of jets
+            self._hypotheses = {}
+            # solver of the neutrino pz, can be shared with other users of the neutrino solutions
+            self.solver = solver if solver is not None else NeutrinoSolver()
 
 
     def neutrinoReconstruction(self, met, muon):
-        Mw = 80.399
-        mu = Mw**2/2 + met.pt()*muon.pt()*math.cos(math.acos(met.px / met.pt())-muon.phi())
-        A = mu*muon.pz/muon.pt()**2
-        B = mu**2*muon.pz**2/muon.pt()**4
-        C = (muon.E**2*met.pt()**2-mu**2)/muon.pt()**2
-        discriminant = B-C
-        solutions=[]
-        if(discriminant<0):
-            solutions.append(A)
-        else:
-            solutions.append(A+math.sqrt(B-C))
-            solutions.append(A-math.sqrt(B-C))
-        return solutions
+        """
+        return the list of neutrino pz solutions, see NeutrinoSolver.
+        """
+        return self.solver.solve(met, muon)
+
+    def neutrinoReconstructionBatch(self, met, muon):
+        """
+        neutrinoReconstruction for arrays of N MET and muon four-momenta.
+
+        returns an (N, 2) array of neutrino pz solutions and a boolean (N, 2) array
+        marking which solutions exist, see NeutrinoSolver.solve_batch.
+        """
+        solutions, valid, scale = self.solver.solve_batch(met, muon)
+        return solutions, valid
+
+    def hypotheses(self, n):
+        """
+        return the jet assignment hypotheses for events with n jets in the order of calculateTopMass.
+
+        returns index arrays of the neutrino solution, the leptonic jet and the hadronic
+        jet combination of each hypothesis and the list of hadronic jet combinations.
+        """
+        if n not in self._hypotheses:
+            combinations = []
+            for l in range(self.njet_min-1, self.njet_max):
+                combinations += list(itertools.combinations(range(n), l))
+            hyp_sol, hyp_x, hyp_had = [], [], []
+            for sol in range(2):
+                for x in range(n):
+                    for i, y in enumerate(combinations):
+                        if x in y: continue
+                        hyp_sol.append(sol)
+                        hyp_x.append(x)
+                        hyp_had.append(i)
+            self._hypotheses[n] = (np.array(hyp_sol, dtype=np.int64), np.array(hyp_x, dtype=np.int64),
+                                   np.array(hyp_had, dtype=np.int64), combinations)
+        return self._hypotheses[n]
+
+    def calculateTopMassBatch(self, jets, met, muons, max_size=4000000, neutrinos=None):
+        """
+        calculateTopMass for N events at once.
+
+        jets and muons are jagged JetArray and MuonArray objects, met a METArray with
+        one entry per event. The leading muon of each event is used.
+        neutrinos are the neutrino solutions of all events, e.g. from NeutrinoSolver.batch_neutrinos,
+        by default they are calculated by the solver.
+        Events are grouped by their number of jets and all jet assignment hypotheses
+        of a group are evaluated as arrays, in blocks of at most max_size hypotheses.
+        returns an array of top masses with -1 for events without reconstruction.
+        """
+        n_events = len(met)
+        masses = np.full(n_events, -1.0)
+        if neutrinos is None:
+            neutrinos = self.solver.leading_muon_neutrinos(met, muons)
+        nu_px, nu_py, nu_pz, nu_E, valid_solutions = neutrinos
+        muon, has_muon = muons.nth(0)
+        n_jets = jets.counts()
+        event_index = np.nonzero(has_muon)[0]
+        valid_solutions = valid_solutions[event_index]
+        # neutrino + muon, shape (events, solutions)
+        nm_px = nu_px[event_index] + muon.px[:, None]
+        nm_py = nu_py[event_index] + muon.py[:, None]
+        nm_pz = nu_pz[event_index] + muon.pz[:, None]
+        nm_E = nu_E[event_index] + muon.E[:, None]
+
+        for n in np.unique(n_jets[event_index]):
+            if n <= 2: continue
+            hyp_sol, hyp_x, hyp_had, combinations = self.hypotheses(int(n))
+            if not combinations: continue
+            group = np.nonzero(n_jets[event_index] == n)[0]
+            block = max(1, max_size // len(hyp_sol))
+            for begin in range(0, len(group), block):
+                rows = group[begin:begin+block]
+                masses[event_index[rows]] = self._evaluate_hypotheses(
+                    jets, event_index[rows], int(n), hyp_sol, hyp_x, hyp_had, combinations,
+                    valid_solutions[rows], nm_px[rows], nm_py[rows], nm_pz[rows], nm_E[rows])
+        return masses
+
+    def _evaluate_hypotheses(self, jets, events, n, hyp_sol, hyp_x, hyp_had, combinations,
+                             valid_solutions, nm_px, nm_py, nm_pz, nm_E):
+        """
+        return the top masses of events with n jets from all jet assignment hypotheses.
+        The masses are computed with np.sqrt on arrays of the momenta summed in the order of
+        calculateTopMass; like math.sqrt it is correctly rounded, so the masses are identical.
+        """
+        index = jets.offsets[events][:, None] + np.arange(n)
+        px, py, pz, E = jets.px[index], jets.py[index], jets.pz[index], jets.E[index]
+        b_tag = jets.has_b_tag[index]
+        N_bjets = b_tag.sum(axis=1)
+
+        # leptonic top for each solution and jet, shape (events, solutions, jets)
+        l_px = nm_px[:, :, None] + px[:, None, :]
+        l_py = nm_py[:, :, None] + py[:, None, :]
+        l_pz = nm_pz[:, :, None] + pz[:, None, :]
+        l_E = nm_E[:, :, None] + E[:, None, :]
+        with np.errstate(invalid='ignore'):
+            Mt_lep = np.sqrt(l_E*l_E - l_px*l_px - l_py*l_py - l_pz*l_pz)
 
-    def calculateTopMass(self, jets, met, muon):
+        # hadronic top for each jet combination, summed in the same order as in calculateTopMass
+        Mt_had = []
+        has_b = []
+        for l in range(self.njet_min-1, self.njet_max):
+            c = np.array([y for y in combinations if len(y) == l], dtype=np.int64)
+            if len(c) == 0: continue
+            h_px, h_py, h_pz, h_E = px[:, c[:, 0]], py[:, c[:, 0]], pz[:, c[:, 0]], E[:, c[:, 0]]
+            for k in range(1, l):
+                h_px = h_px + px[:, c[:, k]]
+                h_py = h_py + py[:, c[:, k]]
+                h_pz = h_pz + pz[:, c[:, k]]
+                h_E = h_E + E[:, c[:, k]]
+            with np.errstate(invalid='ignore'):
+                Mt_had.append(np.sqrt(h_E*h_E - h_px*h_px - h_py*h_py - h_pz*h_pz))
+            has_b.append(b_tag[:, c].any(axis=2))
+        Mt_had = np.concatenate(Mt_had, axis=1)
+        has_b = np.concatenate(has_b, axis=1)
+
+        # validity of each hypothesis, see calculateTopMass
+        lep = Mt_lep[:, hyp_sol, hyp_x]
+        had = Mt_had[:, hyp_had]
+        x_is_b = b_tag[:, hyp_x]
+        need_b = (N_bjets[:, None] > 1) | ((N_bjets[:, None] == 1) & ~x_is_b)
+        valid = valid_solutions[:, hyp_sol]
+        valid &= ~((N_bjets[:, None] > 1) & ~x_is_b)
+        valid &= ~need_b | has_b[:, hyp_had]
+        diff = np.abs(lep - had)
+        with np.errstate(invalid='ignore'):
+            valid &= diff < self.max_diff
+        diff = np.where(valid, diff, np.inf)
+        # the first hypothesis with the smallest difference is used
+        best = np.argmin(diff, axis=1)
+        rows = np.arange(len(events))
+        return np.where(valid[rows, best], (lep[rows, best] + had[rows, best]) / 2, -1.0)
+
+    def calculateTopMass(self, jets, met, muon, neutrinos=None):
         N_bjets = 0
         Mt = -1.0
         B_jet = []
         l_diff = self.max_diff
         if not isinstance(muon, FourMomentum) or not len(jets) > 2: return -1
-        #Calculating the neutrino 4-vector by using the missing transverse energy (met)
-        solutions = self.neutrinoReconstruction(met, muon)
-        if not solutions: return -1
+        #Calculating the neutrino 4-vectors by using the missing transverse energy (met),
+        #unless they are given, e.g. from NeutrinoSolver.event_neutrinos
+        if neutrinos is None:
+            neutrinos = self.solver.neutrinos(met, muon)
+        if not neutrinos: return -1
 
         #Counting number of b-tagged jets
         for x in range(len(jets)):
@@ -47,8 +173,7 @@ class TopReco:
                 B_jet.append(x)
 
         #Looping over all possible neutrino four momentums
-        for sol in range(len(solutions)):
-            neutrino = FourMomentum(met.px, met.py, solutions[sol], math.sqrt(met.pt()**2+solutions[sol]**2))
+        for neutrino in neutrinos:
             #Looping over all jets as possible leptonic top candidates.
             for x in range(len(jets)):
                 #If there are two B-jets we want the leptonic top to have one of them
@@ -81,3 +206,85 @@ class TopReco:
                             l_diff = abs(Mt_lep - Mt_had)
                             Mt = (Mt_lep + Mt_had) / 2
         return Mt
+
+
+class PrunedTopReco(TopReco):
+    """
+    Top mass reconstruction with the same interface and results as TopReco,
+    evaluating far fewer jet combinations for events with many jets.
+
+    The jet four-momenta are unpacked once per event, the sums of the hadronic
+    jet combinations are built incrementally along a depth-first search over the
+    jet indices and b-jet requirements are checked with bitmasks. Since adding a jet
+    never decreases the invariant mass, a combination whose mass already exceeds
+    the leptonic top mass by more than the best difference found so far is not
+    extended any further. Ties are resolved in the same order as in TopReco.
+    """
+
+    def calculateTopMass(self, jets, met, muon, neutrinos=None):
+        if not isinstance(muon, FourMomentum) or not len(jets) > 2: return -1
+        #Calculating the neutrino 4-vectors by using the missing transverse energy (met)
+        if neutrinos is None:
+            neutrinos = self.solver.neutrinos(met, muon)
+        if not neutrinos: return -1
+
+        n = len(jets)
+        px = [jet.px for jet in jets]
+        py = [jet.py for jet in jets]
+        pz = [jet.pz for jet in jets]
+        E = [jet.E for jet in jets]
+        b_mask = 0
+        for i in range(n):
+            if jets[i].has_b_tag:
+                b_mask |= 1 << i
+        N_bjets = bin(b_mask).count('1')
+        #b-tagged jets with index >= i
+        b_from = [b_mask >> i << i for i in range(n + 1)]
+        #pruning relies on the mass growing when jets are added, which holds for E >= |p|
+        prune = all(E[i] >= 0 and E[i]*E[i] >= px[i]*px[i] + py[i]*py[i] + pz[i]*pz[i] for i in range(n))
+        l_min = self.njet_min - 1
+        l_max = self.njet_max - 1
+        #best difference, ordering key of the best candidate (solution, leptonic jet, size, jets) and top mass
+        best = [self.max_diff, None, -1.0]
+
+        def extend(combo, s_px, s_py, s_pz, s_E, has_b, need_b, Mt_lep, key):
+            size = len(combo)
+            m2 = s_E*s_E - s_px*s_px - s_py*s_py - s_pz*s_pz
+            if size >= l_min and (has_b or not need_b):
+                Mt_had = math.sqrt(m2)
+                diff = abs(Mt_lep - Mt_had)
+                if diff < best[0] or (diff == best[0] and best[1] is not None and key + (size, combo) < best[1]):
+                    best[0] = diff
+                    best[1] = key + (size, combo)
+                    best[2] = (Mt_lep + Mt_had) / 2
+            if size == l_max:
+                return
+            if prune and m2 >= 0 and math.sqrt(m2) - Mt_lep > best[0] + 1e-9*s_E:
+                return
+            for j in range(combo[-1] + 1, n):
+                if j == key[1]: continue
+                if need_b and not has_b and not b_from[j] & need_b: break
+                extend(combo + (j,), s_px + px[j], s_py + py[j], s_pz + pz[j], s_E + E[j],
+                       has_b or (b_mask >> j) & 1, need_b, Mt_lep, key)
+
+        for sol, neutrino in enumerate(neutrinos):
+            nm_px = neutrino.px + muon.px
+            nm_py = neutrino.py + muon.py
+            nm_pz = neutrino.pz + muon.pz
+            nm_E = neutrino.E + muon.E
+            for x in range(n):
+                x_is_b = (b_mask >> x) & 1
+                #If there are two B-jets we want the leptonic top to have one of them
+                if N_bjets > 1 and not x_is_b: continue
+                l_px = nm_px + px[x]
+                l_py = nm_py + py[x]
+                l_pz = nm_pz + pz[x]
+                l_E = nm_E + E[x]
+                Mt_lep = math.sqrt(l_E*l_E - l_px*l_px - l_py*l_py - l_pz*l_pz)
+                #b-tagged jets of which the hadronic top has to contain at least one
+                need_b = b_mask & ~(1 << x) if (N_bjets > 1 or (N_bjets == 1 and not x_is_b)) else 0
+                for i in range(n):
+                    if i == x: continue
+                    if need_b and not b_from[i] & need_b: break
+                    extend((i,), px[i], py[i], pz[i], E[i], (b_mask >> i) & 1, need_b, Mt_lep, (sol, x))
+        return best[2]
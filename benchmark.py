@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import timeit
+import platform
+import subprocess
+import numpy as np
+from collections import OrderedDict
+from FourMomentum import FourMomentum, FourMomentumArray
+from EventBuilder import EventBuilder
+from uhhHists import DefaultHistograms
+from TopReco import TopReco, PrunedTopReco
+from TTbarAnalyzer import TTbarAnalyzer
+from SyntheticEvents import generate, write_tree
+
+# history of all benchmark runs
+HISTORY = 'benchmarks.json'
+# runs slower than the previous one by more than this factor are reported as regression
+REGRESSION_THRESHOLD = 1.2
+
+def measure(function, repeat=3):
+    """
+    return the shortest time of repeat calls of function in seconds.
+    """
+    times = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+def bench_four_momentum(n_objects):
+    """
+    time scaling and pt, eta, phi, m of single FourMomentum objects and of a FourMomentumArray.
+    """
+    chunk = generate(n_objects, mean_jets=1.0, n_jets=1)
+    px, py, pz, E = [np.asarray(chunk['Jet_'+c], dtype=np.float64) for c in ('Px', 'Py', 'Pz', 'E')]
+    objects = [FourMomentum(*p) for p in zip(px.tolist(), py.tolist(), pz.tolist(), E.tolist())]
+    array = FourMomentumArray(px, py, pz, E)
+    def scalar():
+        for p in objects:
+            q = 1.05*p
+            q.pt(), q.eta(), q.phi(), q.m()
+    def vectorized():
+        q = 1.05*array
+        q.pt(), q.eta(), q.phi(), q.m()
+    return OrderedDict([('FourMomentum', measure(scalar)),
+                        ('FourMomentumArray', measure(vectorized))])
+
+def bench_build_event(n_events):
+    """
+    time EventBuilder.build_event for each event and build_batch for all events.
+    """
+    chunk = generate(n_events)
+    builder = EventBuilder({})
+    rows = [chunk.row(i) for i in range(len(chunk))]
+    def events():
+        for row in rows:
+            builder.build_event(row)
+    return OrderedDict([('build_event', measure(events)),
+                        ('build_batch', measure(lambda: builder.build_batch(chunk)))])
+
+def bench_fill(n_events):
+    """
+    time DefaultHistograms.fill for each event and fill_batch for all events.
+    """
+    batch = EventBuilder({}).build_batch(generate(n_events))
+    events = list(batch.events())
+    hists = DefaultHistograms("benchmark_fill_%d" % n_events)
+    def fill():
+        for event in events:
+            hists.fill(event)
+    def fill_batch():
+        hists.fill_batch(batch)
+        hists.flush()
+    return OrderedDict([('DefaultHistograms.fill', measure(fill)),
+                        ('DefaultHistograms.fill_batch', measure(fill_batch))])
+
+def bench_top_reco(n_jets, n_events):
+    """
+    time the top quark mass reconstruction of events with n_jets jets and at least one isolated muon.
+    """
+    batch = EventBuilder({}).build_batch(generate(n_events, n_jets=n_jets, n_muons=1))
+    batch = batch.select(batch.n_muons() >= 1)
+    events = list(batch.events())
+    results = OrderedDict()
+    for name, reco in (('TopReco', TopReco(10.0, 2, 4)), ('PrunedTopReco', PrunedTopReco(10.0, 2, 4))):
+        def scalar():
+            for event in events:
+                reco.calculateTopMass(event.jets, event.met, event.muons[0])
+        if name == 'TopReco' and FourMomentum() + FourMomentum() is None:
+            # FourMomentum addition is part of the exercises
+            print("Skipping %s: FourMomentum.__add__ is not implemented." % name)
+            continue
+        results[name] = measure(scalar, 1)
+    reco = PrunedTopReco(10.0, 2, 4)
+    results['calculateTopMassBatch'] = measure(lambda: reco.calculateTopMassBatch(batch.jets, batch.met, batch.muons), 1)
+    return results, len(events)
+
+def bench_analyzer_run(n_events, mode):
+    """
+    time TTbarAnalyzer.run on a synthetic tree with n_events events.
+    """
+    file_name = "benchmark_%d.root" % n_events
+    write_tree('files/'+file_name, generate(n_events))
+    try:
+        def run():
+            TTbarAnalyzer("Benchmark", file_name, {'mode': mode}).run(write=False)
+        return measure(run, 1)
+    finally:
+        os.remove('files/'+file_name)
+
+def git_commit():
+    """
+    return the current git commit or None.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD']).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, history):
+    """
+    print the results with the change relative to the previous run.
+    """
+    previous = {}
+    if history:
+        previous = dict(((r['benchmark'], r['scale']), r['seconds']) for r in history[-1]['results'])
+    for r in results:
+        line = "%-32s %8d %12.4f s %12.3f us/item" % (r['benchmark'], r['scale'], r['seconds'], r['us_per_item'])
+        key = (r['benchmark'], r['scale'])
+        if key in previous and previous[key] > 0:
+            ratio = r['seconds'] / previous[key]
+            line += "   x%.2f" % ratio
+            if ratio > REGRESSION_THRESHOLD:
+                line += "  REGRESSION"
+        print(line)
+
+if __name__ == "__main__":
+    """
+    Benchmarks of the hot paths of the framework on synthetic events.
+    The results are appended to benchmarks.json and compared to the previous run.
+    """
+
+    # numbers of events (objects for FourMomentum) of each benchmark
+    scales = [1000, 10000, 100000]
+    # jet multiplicities and number of events of the top quark reconstruction benchmark
+    top_reco_jets = [2, 3, 4, 5, 6, 8]
+    top_reco_events = 200
+    # numbers of events of the full analyzer run
+    run_scales = [10000, 100000]
+
+    results = []
+    def record(benchmark, scale, seconds, n_items=None):
+        results.append(OrderedDict([('benchmark', benchmark), ('scale', scale), ('seconds', seconds),
+                                    ('us_per_item', 1e6*seconds/max(n_items or scale, 1))]))
+
+    for n in scales:
+        print("Running benchmarks with %d events." % n)
+        for name, seconds in bench_four_momentum(n).items():
+            record(name, n, seconds)
+        for name, seconds in bench_build_event(n).items():
+            record(name, n, seconds)
+        for name, seconds in bench_fill(n).items():
+            record(name, n, seconds)
+    for n_jets in top_reco_jets:
+        print("Running top quark reconstruction with %d jets." % n_jets)
+        times, n_events = bench_top_reco(n_jets, top_reco_events)
+        for name, seconds in times.items():
+            record("%s (%d jets)" % (name, n_jets), top_reco_events, seconds, n_events)
+    for n in run_scales:
+        for mode in ("event", "batch"):
+            print("Running TTbarAnalyzer on %d events in %s mode." % (n, mode))
+            record("Analyzer.run (%s)" % mode, n, bench_analyzer_run(n, mode))
+
+    history = []
+    if os.path.exists(HISTORY):
+        with open(HISTORY) as f:
+            history = json.load(f)
+    compare(results, history)
+    history.append(OrderedDict([('time', time.strftime('%Y-%m-%d %H:%M:%S')),
+                                ('commit', git_commit()),
+                                ('python', platform.python_version()),
+                                ('numpy', np.__version__),
+                                ('results', results)]))
+    with open(HISTORY, 'w') as f:
+        json.dump(history, f, indent=1)
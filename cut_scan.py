@@ -0,0 +1,45 @@
+import numpy as np
+from collections import OrderedDict
+from CutScan import CutScan, ScanAnalyzer, significance, best_grid_points
+from ParallelRunner import ParallelRunner
+from Datasets import default_datasets
+
+if __name__ == "__main__":
+    """
+    Cut optimization script. Each dataset is read once and the yields of all
+    combinations of the cut thresholds below are calculated.
+    """
+
+    # Monte Carlo datasets used for the optimization
+    datasets = default_datasets().select(data=False)
+
+    # Grid of cut thresholds, events are selected with value >= threshold
+    # available variables: muon_pt (leading muon), n_jets, n_b_jets, met_pt
+    grid = OrderedDict([('muon_pt', np.arange(0., 65., 5.)),
+                        ('n_jets', np.arange(0, 7)),
+                        ('n_b_jets', np.arange(0, 4)),
+                        ('met_pt', np.arange(0., 110., 10.)),
+    ]
+    )
+
+    event_options = {'JEC': 'nominal',
+                     'muon_isolation': 0.1,
+                     'mode': 'batch', # fill the scan with whole batches of events
+                     'scan': grid,
+                     }
+
+    runner = ParallelRunner(ScanAnalyzer, n_workers=None)
+    # the scan is not written to the output files, they hold the results of my_analysis.py
+    analyzers = runner.run(datasets.runs(), event_options, write=False)
+    # combine the scans of the files of each dataset with their scale factors
+    scans = OrderedDict()
+    for name, runs in datasets.groups(analyzers).items():
+        scans[name] = CutScan(grid)
+        for analyzer, scale in runs:
+            scans[name].merge({'sumw': scale*analyzer.scan.sumw, 'sumw2': scale*scale*analyzer.scan.sumw2})
+
+    print("Scanned %d grid points." % significance(scans).size)
+    for metric, label in (('s_over_sqrt_b', 'S/sqrt(B)'), ('s_over_sqrt_s_plus_b', 'S/sqrt(S+B)')):
+        print("Best grid points for %s:" % label)
+        for value, cuts in best_grid_points(scans, 10, 'TTbar', metric):
+            print("  %8.3f   %s" % (value, ", ".join("%s >= %g" % item for item in cuts.items())))
@@ -1,7 +1,9 @@
 from TTbarAnalyzer import TTbarAnalyzer
 from Plotter import Plotter
-from collections import OrderedDict
-from Fitter import Fitter
+from ParallelRunner import ParallelRunner
+from ResultsStore import ResultsStore
+from CrossSection import CrossSection
+from Datasets import default_datasets
 
 if __name__ == "__main__":
     """
@@ -12,53 +14,60 @@ if __name__ == "__main__":
     #run_all = False to only run the Monte Carlo simulation. Use this as you default for the design and optimization of the analysis.
     run_all = False
 
-    # List of datasets to be analyzed
-    if run_all:
-        datasets = OrderedDict([('Data', 'data.root'),
-                                ('QCD', 'qcd.root'),
-                                ('Diboson', 'diboson.root'),
-                                ('DY+jets', 'dy.root'),
-                                ('single top', 'single_top.root'),
-                                ('TTbar', 'ttbar.root'),
-                                ('W+jets', 'wjets.root'),
-        ]
-        )
-    else:
-        datasets = OrderedDict([('QCD', 'qcd.root'),
-                                ('Diboson', 'diboson.root'),
-                                ('DY+jets', 'dy.root'),
-                                ('single top', 'single_top.root'),
-                                ('TTbar', 'ttbar.root'),
-                                ('W+jets', 'wjets.root'),
-        ]
-        )
+    # Datasets to be analyzed, with their files, plotting colors and normalization (see Datasets.py)
+    datasets = default_datasets()
+    if not run_all:
+        datasets = datasets.select(data=False)
 
     # Options for the event builder
     event_options = {'JEC': 'nominal', # Jet Energy corrections: change to "up" or "down" to evaluate the systematic uncertainties
-                     'muon_isolation': 0.1 # muon isolation, you can leave this at the default value
+                     'muon_isolation': 0.1, # muon isolation, you can leave this at the default value
+                     # 'skim': [('triggerIsoMu24', '==', True)], # only read events passing this preselection from a cached skim
+                     # 'event_store': True, # read the events from an uncompressed memory-mapped copy in stores/, written on the first run
+                     # 'prefetch': 2, # read up to this many chunks of events ahead in a background process, only without worker processes (n_workers=1)
+                     # 'lazy': True, # build muons, jets and MET of an event only when they are used; saves time only if no histograms are filled before the first cut, e.g. without the 'no_cuts' histograms of TTbarAnalyzer
+                     # 'profile': True, # measure the time spent in each stage of datasets that are processed, written to profile_<file>.json
+                     # process systematic variations in the same event loop, each variation overrides some of the options above:
+                     # 'variations': OrderedDict([('nominal', {}), ('jec_up', {'JEC': 'up'}), ('jec_down', {'JEC': 'down'})]),
                      }
 
-    analyzers = OrderedDict()
+    # Number of worker processes used to analyze the datasets (1: run serially, None: one per CPU core)
+    n_workers = None
+    # Split datasets into chunks of this many events, each processed by its own worker (None: one worker per dataset)
+    chunk_size = None
 
     # Analyze all datasets:
-    for name, file_name in datasets.items():
-        analyzer = TTbarAnalyzer(name, file_name, event_options) # create an Analyzer for each dataset
-        analyzer.run() # run the Analyzer
-        analyzers[name] = analyzer # store the results
+    # an Analyzer is created for each dataset, run and the results are stored in analyzers.
+    # Datasets of several files, e.g. Diboson, are processed per file and combined when plotting.
+    # Datasets whose output file was written with the same analyzer code, options and input file
+    # are not processed again, their results are read from the output file instead.
+    runner = ParallelRunner(TTbarAnalyzer, n_workers, chunk_size)
+    store = ResultsStore(TTbarAnalyzer, event_options)
+    analyzers = store.run(datasets.runs(), runner)
+    # to only plot or fit the stored results without checking if they are up to date:
+    #analyzers = store.load_all(datasets.runs())
 
 
     # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # Exercise 2: Measurement of the ttbar production cross section
     # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-    # You can access variables from TTbarAnalyzer like this:
-    n_ttbar = analyzers['TTbar'].n_total # get total number of ttbar events
+    # You can access the cut flow of TTbarAnalyzer like this:
+    print(analyzers['TTbar'].cutflow.table()) # write the cut flow table to the console
+    n_ttbar = analyzers['TTbar'].cutflow.count('no_cuts') # get total number of ttbar events
     print("Total Number of ttbar events: {0}".format(n_ttbar)) # write to the console
-    n_background_total = sum([an.n_total for key, an in analyzers.items() if not (key == 'Data' or key == 'TTbar')]) # Sum total number of all events, except data and ttbar
+    n_background_total = sum([an.cutflow.count('no_cuts') for key, an in analyzers.items() if not (key == 'Data' or key == 'TTbar')]) # Sum total number of all events, except data and ttbar
     print("Total Number of background events: {0}".format(n_background_total))
+    efficiency = analyzers['TTbar'].cutflow.efficiency('trigger') # weighted fraction of ttbar events passing all cuts up to 'trigger'
+    print("Selection efficiency for ttbar events: {0}".format(efficiency))
+    # Cross section with statistical (analytic and from pseudo-experiments) and systematic uncertainties,
+    # computed from the cut flows after the last cut; systematic uncertainties need the 'variations' option.
+    # Without data the sum of the simulation is used as expected data.
+    cross_section = CrossSection.from_analyzers(analyzers, datasets=datasets)
+    print(cross_section.summary())
 
     # Plot all histograms filled in the Analysis
-    plotter = Plotter(analyzers)
+    plotter = Plotter(analyzers, datasets=datasets)
     plotter.process()
 
     # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
@@ -66,7 +75,13 @@ if __name__ == "__main__":
     # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
     # Run the fit of the top mass distribution
-    #fitter = Fitter(analyzers)
+    #fitter = Fitter(analyzers, datasets)
     #fitter.fit(130., 210.)
     # fitter.fit(x,y)
     # (x,y) = fit range
+    # Fast fits of the binned distributions without drawing, e.g. to compare fit ranges or functions:
+    #print(fitter.fit_arrays([120., 130., 140.], [200., 210., 220.]).value('mean')) # Gaussian fits in three ranges at once
+    #result = fitter.fit_arrays(130., 210., model='crystal_ball', likelihood=True)
+    #result = fitter.template_fit(130., 210.).fit(fitter.data_counts) # mass from templates of the simulation
+    #print(result.value('mass'), result.error('mass'))
+    #fitter.toys(130., 210., n_toys=5000) # bias and pull of the fitted mass from pseudo-experiments
@@ -2,6 +2,7 @@ from TTbarAnalyzer import TTbarAnalyzer
 from Plotter import Plotter
 from collections import OrderedDict
 from Fitter import Fitter
+from Datasets import default_datasets
 
 if __name__ == "__main__":
     """
@@ -9,26 +10,20 @@ if __name__ == "__main__":
     """
 
     print("Staring test analysis...")
-    datasets = OrderedDict([('Data', 'data.root'),
-                                ('QCD', 'qcd.root'),
-                                ('Diboson', 'diboson.root'),
-                                ('DY+jets', 'dy.root'),
-                                ('single top', 'single_top.root'),
-                                ('TTbar', 'ttbar.root'),
-                                ('W+jets', 'wjets.root'), ])
+    datasets = default_datasets()
 
     event_options = {'JEC': 'nominal',
                      'muon_isolation': 0.1,
                      'max_events':10
                      }
     analyzers = OrderedDict()
-    for name, file_name in datasets.items():
+    for name, file_name in datasets.runs().items():
         analyzer = TTbarAnalyzer(name, file_name, event_options)
         # run analysis for dataset
         analyzer.run()
         analyzers[name] = analyzer
 
-    plotter = Plotter(analyzers)
+    plotter = Plotter(analyzers, datasets=datasets)
     plotter.process()
 
     print("test analysis finished successfully.")
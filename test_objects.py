@@ -0,0 +1,198 @@
+import os
+import math
+import shutil
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from FourMomentum import FourMomentum, FourMomentumArray
+from uhhObjects import Muon, Jet
+from TopReco import TopReco, PrunedTopReco
+from NeutrinoSolver import NeutrinoSolver, transverse_mass
+from EventBuilder import EventBuilder
+from ColumnChunk import ColumnChunk, JAGGED_COUNTERS
+from SyntheticEvents import generate
+from EventStore import EventStore, STORE_VERSION
+
+def check_four_momentum_array(n_objects=100000, seed=1):
+    """
+    compare pt, eta and phi of a FourMomentumArray with the scalar FourMomentum methods.
+    """
+    rng = np.random.RandomState(seed)
+    px, py, pz = rng.normal(0., 50., (3, n_objects))
+    E = np.sqrt(px*px + py*py + pz*pz) + rng.exponential(5., n_objects)
+    array = FourMomentumArray(px, py, pz, E)
+    objects = array.to_objects()
+    for name in ('pt', 'eta', 'phi'):
+        scalar = np.array([getattr(o, name)() for o in objects])
+        vectorized = getattr(array, name)()
+        if not np.allclose(vectorized, scalar, rtol=1e-12, atol=1e-12):
+            raise AssertionError("FourMomentumArray.%s differs from FourMomentum.%s" % (name, name))
+        if name != 'pt' and not np.array_equal(getattr(array, name)(exact=True), scalar):
+            raise AssertionError("FourMomentumArray.%s(exact=True) is not identical to FourMomentum.%s" % (name, name))
+    print("FourMomentumArray agrees with FourMomentum for %d objects." % n_objects)
+
+def _add(self, other):
+    return FourMomentum(self.px + other.px, self.py + other.py, self.pz + other.pz, self.E + other.E)
+
+def _mul(self, other):
+    if isinstance(other, FourMomentum):
+        return self.E*other.E - self.px*other.px - self.py*other.py - self.pz*other.pz
+    return _scale(self, other)
+
+_scale = FourMomentum.__mul__
+
+def random_jets(rng, n, spacelike=False):
+    """
+    return n jets with integer momenta, so that many hypotheses have equal mass differences,
+    some of them duplicated and b-tagged at random. With spacelike=True E is slightly below |p|
+    and no jets are duplicated, since the sum of two collinear such jets has no real mass.
+    """
+    jets = []
+    for i in range(n):
+        if jets and not spacelike and rng.uniform() < 0.2:
+            px, py, pz = jets[rng.randint(len(jets))].px, jets[rng.randint(len(jets))].py, jets[-1].pz
+        else:
+            px, py, pz = [float(v) for v in rng.randint(-60, 61, 3)]
+        p = math.sqrt(px*px + py*py + pz*pz)
+        E = (1 - 1e-9)*p if spacelike else float(math.ceil(p) + rng.randint(0, 10))
+        jet = Jet(px, py, pz, E)
+        jet.has_b_tag = bool(rng.uniform() < 0.3)
+        jets.append(jet)
+    return jets
+
+def check_pruned_top_reco(n_events=3000, seed=1):
+    """
+    compare the top masses of PrunedTopReco with TopReco for random events, including
+    hypotheses with equal mass differences but different masses, all numbers of b-tagged
+    jets and jets with E < |p|, for which the search is not pruned.
+    FourMomentum addition and the scalar product are part of the exercises and are
+    replaced by a simple implementation for this check.
+    """
+    rng = np.random.RandomState(seed)
+    add, mul = FourMomentum.__add__, FourMomentum.__mul__
+    FourMomentum.__add__, FourMomentum.__mul__ = _add, _mul
+    try:
+        configurations = [(10.0, 2, 4, False), (25.0, 2, 3, False), (40.0, 3, 5, False), (40.0, 3, 4, True)]
+        n_found = 0
+        for i in range(n_events):
+            max_diff, n_jet_min, n_jet_max, spacelike = configurations[i % len(configurations)]
+            if i % 3 == 1 and not spacelike:
+                # jets, muon and neutrinos at rest, all masses are integers and many hypotheses tie
+                jets = []
+                for j in range(rng.randint(3, 8)):
+                    jets.append(Jet(0.0, 0.0, 0.0, float(rng.randint(10, 90))))
+                    jets[-1].has_b_tag = bool(rng.uniform() < 0.3)
+                a = float(rng.randint(20, 50))
+                muon = Muon(a, 0.0, 0.0, a)
+                neutrinos = [FourMomentum(-a, 0.0, 0.0, a)]
+                if rng.uniform() < 0.5:
+                    neutrinos.append(FourMomentum(-a, 0.0, 0.0, a + float(rng.randint(1, 20))))
+            else:
+                jets = random_jets(rng, rng.randint(3, 8), spacelike)
+                muon = Muon(*[float(v) for v in rng.randint(-40, 41, 3)] + [0.0])
+                muon.E = math.sqrt(muon.px*muon.px + muon.py*muon.py + muon.pz*muon.pz)
+                neutrinos = []
+                for j in range(rng.randint(1, 3)):
+                    px, py, pz = [float(v) for v in rng.randint(-40, 41, 3)]
+                    neutrinos.append(FourMomentum(px, py, pz, math.sqrt(px*px + py*py + pz*pz)))
+            if i % 7 == 0:
+                for jet in jets:
+                    jet.has_b_tag = False
+            expected = TopReco(max_diff, n_jet_min, n_jet_max).calculateTopMass(jets, None, muon, neutrinos)
+            result = PrunedTopReco(max_diff, n_jet_min, n_jet_max).calculateTopMass(jets, None, muon, neutrinos)
+            if result != expected:
+                raise AssertionError("PrunedTopReco gives %r instead of %r for event %d" % (result, expected, i))
+            n_found += expected > 0
+    finally:
+        FourMomentum.__add__, FourMomentum.__mul__ = add, mul
+    print("PrunedTopReco agrees with TopReco for %d events (%d reconstructed)." % (n_events, n_found))
+
+def check_neutrino_solver(n_events=5000, seed=1):
+    """
+    compare the neutrinos and transverse masses of NeutrinoSolver for single events
+    with those for an EventBatch, for both strategies.
+    """
+    batch = EventBuilder({}).build_batch(generate(n_events, seed=seed))
+    events = list(batch.events())
+    muon, has_muon = batch.muons.nth(0)
+    batch_mt = np.full(n_events, -1.0)
+    batch_mt[has_muon] = transverse_mass(batch.met[has_muon], muon)
+    for strategy in NeutrinoSolver.strategies:
+        solver = NeutrinoSolver(strategy=strategy)
+        px, py, pz, E, valid = solver.batch_neutrinos(batch)
+        for i, event in enumerate(events):
+            scalar = [(n.px, n.py, n.pz, n.E) for n in solver.event_neutrinos(event)]
+            vectorized = [(px[i, j], py[i, j], pz[i, j], E[i, j]) for j in range(2) if valid[i, j]]
+            if scalar != vectorized:
+                raise AssertionError("NeutrinoSolver('%s') batch neutrinos differ for event %d" % (strategy, i))
+            mt = transverse_mass(event.met, event.muons[0]) if event.muons else -1.0
+            if mt != batch_mt[i]:
+                raise AssertionError("batch transverse mass differs for event %d" % i)
+    print("NeutrinoSolver agrees for single events and batches of %d events." % n_events)
+
+def _event_values(event, reco):
+    """
+    return the objects, weight and top mass of an event as a tuple of numbers.
+    """
+    values = [event.weight, event.trigger['IsoMu24'], event.met.px, event.met.py]
+    for muon in event.muons:
+        values += [muon.px, muon.py, muon.pz, muon.E, muon.charge, muon.iso]
+    for jet in event.jets:
+        values += [jet.px, jet.py, jet.pz, jet.E, jet.has_b_tag]
+    if event.muons:
+        values.append(reco.calculateTopMass(event.jets, event.met, event.muons[0]))
+    return tuple(values)
+
+def _stored_chunk(chunk, store_dir):
+    """
+    write the columns of chunk in the layout of an EventStore and return them memory-mapped.
+    """
+    store = EventStore('synthetic.root', list(chunk.columns.keys()), store_dir)
+    os.makedirs(store.path())
+    for name, column in chunk.columns.items():
+        column.tofile(os.path.join(store.path(), name+'.bin'))
+    for counter in JAGGED_COUNTERS.values():
+        chunk.offsets(counter).astype(np.int64).tofile(os.path.join(store.path(), 'offsets_%s.bin' % counter))
+    metadata = {'version': STORE_VERSION, 'n_events': len(chunk),
+                'columns': dict((name, column.dtype.str) for name, column in chunk.columns.items())}
+    return store.read(metadata)
+
+def check_column_rows(n_events=5000, seed=1):
+    """
+    compare events built in event mode from float32 columns, as read from a skim, a memory-mapped
+    event store or a prefetched chunk, with events built from the same values in double precision,
+    as read from the tree.
+    """
+    chunk = generate(n_events, n_muons=1, seed=seed)
+    tree_values = ColumnChunk(OrderedDict((name, column.astype(np.float64) if column.dtype.kind == 'f' else column)
+                                          for name, column in chunk.columns.items()))
+    store_dir = tempfile.mkdtemp()
+    add, mul = FourMomentum.__add__, FourMomentum.__mul__
+    FourMomentum.__add__, FourMomentum.__mul__ = _add, _mul
+    try:
+        sources = [('columns', chunk), ('event store', _stored_chunk(chunk, store_dir))]
+        reco = PrunedTopReco(10.0, 2, 4)
+        for options in ({}, {'JEC': 'up'}):
+            builder = EventBuilder(options)
+            for i in range(n_events):
+                expected = _event_values(builder.build_event(tree_values.row(i)), reco)
+                for name, source in sources:
+                    result = _event_values(builder.build_event(source.row(i)), reco)
+                    if result != expected or any(isinstance(v, np.floating) and v.dtype != np.float64 for v in result):
+                        raise AssertionError("event %d built from float32 %s differs from the tree" % (i, name))
+    finally:
+        FourMomentum.__add__, FourMomentum.__mul__ = add, mul
+        shutil.rmtree(store_dir)
+    print("Events built from float32 columns agree with the tree for %d events." % n_events)
+
+if __name__ == "__main__":
+    """
+    Consistency checks of the vectorized and optimized code against the simple implementations.
+    """
+
+    check_four_momentum_array()
+    check_pruned_top_reco()
+    check_neutrino_solver()
+    check_column_rows()
+
+    print("object tests finished successfully.")
@@ -1,6 +1,8 @@
+import numpy as np
 from Histograms import Histograms
 from ROOT import TH1F
 from collections import OrderedDict
+from NeutrinoSolver import NeutrinoSolver, transverse_mass
 
 class DefaultHistograms(Histograms):
     """
@@ -93,6 +95,45 @@ class DefaultHistograms(Histograms):
 
         # other histograms go here
 
+    def fill_batch(self, batch):
+        """
+        Here the histograms are filled for all events of an EventBatch at once.
+        eta and phi are computed with the NumPy functions, which may differ from fill()
+        in the last bit (relative 1e-15), so a value exactly at a bin edge can end up in
+        the neighbouring bin. Use eta(exact=True) and phi(exact=True) for identical bins.
+        """
+
+        event_weight = batch.weight
+
+        # fill muon hists
+        self.fill_array('muons_number', batch.n_muons(), event_weight)
+        muon, has_muon = batch.muons.nth(0)
+        self.fill_kinematics('muon1', muon, event_weight[has_muon])
+
+        # fill jet hists
+        self.fill_array('jets_number', batch.n_jets(), event_weight)
+        for i in range(3):
+            jet, has_jet = batch.jets.nth(i)
+            self.fill_kinematics('jet%d' % (i+1), jet, event_weight[has_jet])
+
+        # fill met hists
+        self.fill_array('met_pt', batch.met.pt(), event_weight)
+        self.fill_array('met_phi', batch.met.phi(), event_weight)
+
+        # fill b-jet hists
+        self.fill_array('bjets_number', batch.n_b_jets(), event_weight)
+        for i in range(2):
+            b_jet, has_b_jet = batch.b_jets.nth(i)
+            self.fill_kinematics('bjet%d' % (i+1), b_jet, event_weight[has_b_jet])
+
+    def fill_kinematics(self, name, objects, weights):
+        """
+        fill the pt, eta and phi histograms of an object array.
+        """
+        self.fill_array(name+'_pt', objects.pt(), weights)
+        self.fill_array(name+'_eta', objects.eta(), weights)
+        self.fill_array(name+'_phi', objects.phi(), weights)
+
 class TopMassHist(Histograms):
     def __init__(self, name):
         self.hists = OrderedDict([('top_mass', TH1F('top_mass',';M_{T}', 60,0,300)),
@@ -111,3 +152,51 @@ class TopMassHist(Histograms):
         #fill top hists
         if event.top_mass > 0.0:
             self.hists['top_mass'].Fill(event.top_mass, event_weight)
+
+    def fill_batch(self, batch):
+        """
+        Here the histograms are filled for all events of an EventBatch at once.
+        """
+        has_top = batch.top_mass > 0.0
+        self.fill_array('top_mass', batch.top_mass[has_top], batch.weight[has_top])
+
+class WBosonHists(Histograms):
+    """
+    Histograms of the leptonically decaying W boson: transverse mass and neutrino solutions.
+    """
+    def __init__(self, name, solver=None):
+        self.hists = OrderedDict([('w_mt',               TH1F('w_mt','m_{T,W} [GeV]', 40,0,200)),
+                                  ('neutrino_solutions', TH1F('neutrino_solutions','N_{#nu solutions}', 3,-0.5,2.5)),
+                                  ('neutrino_pz',        TH1F('neutrino_pz','p_{z,#nu} [GeV]', 60,-300,300)),
+                                  ])
+        # solver of the neutrino pz, the solutions are shared with the top quark reconstruction
+        self.solver = solver if solver is not None else NeutrinoSolver()
+        ## DO NOT TOUCH THIS PART ##
+        name = name + "_default"
+        super(WBosonHists, self).__init__(name)
+
+    def fill(self, event):
+        """
+        Here the histograms are filled for events with at least one muon.
+        """
+        if event.n_muons() < 1:
+            return
+        event_weight = event.weight
+        neutrinos = self.solver.event_neutrinos(event)
+        self.hists['w_mt'].Fill(transverse_mass(event.met, event.muons[0]), event_weight)
+        self.hists['neutrino_solutions'].Fill(len(neutrinos), event_weight)
+        for neutrino in neutrinos:
+            self.hists['neutrino_pz'].Fill(neutrino.pz, event_weight)
+
+    def fill_batch(self, batch):
+        """
+        Here the histograms are filled for all events of an EventBatch at once.
+        """
+        muon, has_muon = batch.muons.nth(0)
+        event_weight = batch.weight[has_muon]
+        px, py, pz, E, valid = self.solver.batch_neutrinos(batch)
+        valid = valid[has_muon]
+        pz = pz[has_muon]
+        self.fill_array('w_mt', transverse_mass(batch.met[has_muon], muon), event_weight)
+        self.fill_array('neutrino_solutions', valid.sum(axis=1), event_weight)
+        self.fill_array('neutrino_pz', pz[valid], np.repeat(event_weight[:, None], 2, axis=1)[valid])
@@ -1,10 +1,13 @@
-from FourMomentum import FourMomentum
+from FourMomentum import FourMomentum, FourMomentumArray
+import numpy as np
 import math
 
 class Muon(FourMomentum):
     """A muon.
     Holds the muon four momentum
     """
+    __slots__ = ('charge', 'iso')
+
     def __init__(self, px=0, py=0, pz=0, E=0):
         super(Muon, self).__init__(px, py, pz, E)
         self.charge = None
@@ -14,11 +17,47 @@ class Jet(FourMomentum):
     """A jet.
     Holds the muon four momentum
     """
+    __slots__ = ('has_b_tag',)
+
     def __init__(self, px=0,py=0,pz=0,E=0):
         super(Jet, self).__init__(px, py, pz, E)
         self.has_b_tag = False
 
 class MET(FourMomentum):
+    __slots__ = ()
+
     def __init__(self,px=0,py=0):
         super(MET, self).__init__(px,py,0,0)
 
+
+class MuonArray(FourMomentumArray):
+    """An array of muons.
+    Holds the muon four momenta, charge and isolation as columns
+    """
+    object_class = Muon
+    columns = ('charge', 'iso')
+
+    def __init__(self, px=(), py=(), pz=(), E=(), charge=None, iso=None, offsets=None):
+        super(MuonArray, self).__init__(px, py, pz, E, offsets)
+        self.charge = np.zeros(len(self), dtype=np.int32) if charge is None else np.asarray(charge)
+        self.iso = np.zeros(len(self)) if iso is None else np.asarray(iso, dtype=np.float64)
+
+class JetArray(FourMomentumArray):
+    """An array of jets.
+    Holds the jet four momenta and b-tag decisions as columns
+    """
+    object_class = Jet
+    columns = ('has_b_tag',)
+
+    def __init__(self, px=(), py=(), pz=(), E=(), has_b_tag=None, offsets=None):
+        super(JetArray, self).__init__(px, py, pz, E, offsets)
+        self.has_b_tag = np.zeros(len(self), dtype=bool) if has_b_tag is None else np.asarray(has_b_tag, dtype=bool)
+
+class METArray(FourMomentumArray):
+    """An array of missing transverse momenta, one per event.
+    """
+    object_class = MET
+
+    def __init__(self, px=(), py=()):
+        px = np.asarray(px, dtype=np.float64)
+        super(METArray, self).__init__(px, py, np.zeros(len(px)), np.zeros(len(px)))